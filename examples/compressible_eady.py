@@ -163,10 +163,9 @@ piparams = {'pc_type': 'fieldsplit',
                                            'pc_type': 'bjacobi',
                                            'sub_pc_type': 'ilu'}}}
 rho_b = Function(Vr)
-compressible_hydrostatic_balance(state, theta_b, rho_b,
-                                 params=piparams)
-compressible_hydrostatic_balance(state, theta0, rho0,
-                                 params=piparams)
+balance_solver = HydrostaticBalanceSolver(state, params=piparams)
+balance_solver.solve(theta_b, rho_b)
+balance_solver.solve(theta0, rho0)
 
 # set Pi0
 Pi0 = calculate_Pi0(state, theta0, rho0)
@@ -23,6 +23,13 @@ if '--limit' in sys.argv:
     limit = True
 else:
     limit = False
+# the IMEX Runge-Kutta timestepper makes two linear solves per step,
+# rather than the maxk*maxi solves of the Crank-Nicolson iteration. The
+# number of linear solves per step is logged at the end of the run.
+if '--imex' in sys.argv:
+    imex = True
+else:
+    imex = False
 
 
 # make mesh
@@ -38,7 +45,10 @@ diffusion = False
 degree = 0 if recovered else 1
 
 fieldlist = ['u', 'rho', 'theta']
-timestepping = TimesteppingParameters(dt=dt, maxk=4, maxi=1)
+if imex:
+    timestepping = TimesteppingParameters(dt=dt, maxi=1, alpha=ARS232.gamma)
+else:
+    timestepping = TimesteppingParameters(dt=dt, maxk=4, maxi=1)
 
 dirname = 'dry_bf_bubble'
 
@@ -183,8 +193,13 @@ if diffusion:
                                                  mu=Constant(10./deltax), bcs=bcs)))
 
 # build time stepper
-stepper = CrankNicolson(state, advected_fields, linear_solver,
-                        compressible_forcing,
-                        diffused_fields=diffused_fields)
+if imex:
+    stepper = ARS232(state, advected_fields, linear_solver,
+                     compressible_forcing,
+                     diffused_fields=diffused_fields)
+else:
+    stepper = CrankNicolson(state, advected_fields, linear_solver,
+                            compressible_forcing,
+                            diffused_fields=diffused_fields)
 
 stepper.run(t=0, tmax=tmax)
@@ -204,9 +204,15 @@ euler_poincare = False if recovered else True
 
 advected_fields = [u_advection,
                    ('rho', SSPRK3(state, rho0, rhoeqn)),
-                   ('theta', SSPRK3(state, theta0, thetaeqn, limiter=limiter)),
-                   ('water_v', SSPRK3(state, water_v0, thetaeqn, limiter=limiter)),
-                   ('water_c', SSPRK3(state, water_c0, thetaeqn, limiter=limiter))]
+                   ('theta', SSPRK3(state, theta0, thetaeqn, limiter=limiter))]
+if recovered or limit:
+    advected_fields.append(('water_v', SSPRK3(state, water_v0, thetaeqn, limiter=limiter)))
+    advected_fields.append(('water_c', SSPRK3(state, water_c0, thetaeqn, limiter=limiter)))
+else:
+    # advect the moisture fields together, with the same embedded DG
+    # scheme as theta
+    moisture_advection = MultiTracerAdvection(state, moisture, options=EmbeddedDGOptions())
+    advected_fields.append((moisture_advection.name, moisture_advection))
 
 # Set up linear solver
 linear_solver = CompressibleSolver(state, moisture=moisture)
@@ -115,9 +115,9 @@ piparams = {'ksp_type': 'gmres',
                                    'pc_type': 'bjacobi',
                                    'sub_pc_type': 'ilu'}}
 
-compressible_hydrostatic_balance(state, theta_b, rho_b, Pi,
-                                 top=True, pi_boundary=0.5,
-                                 params=piparams)
+balance_solver = HydrostaticBalanceSolver(state, top=True, pi_boundary=0.5,
+                                          params=piparams)
+balance_solver.solve(theta_b, rho_b, Pi)
 
 
 def minimum(f):
@@ -131,15 +131,12 @@ static void minify(double *a, double *b) {
 
 
 p0 = minimum(Pi)
-compressible_hydrostatic_balance(state, theta_b, rho_b, Pi,
-                                 top=True, params=piparams)
+balance_solver.solve(theta_b, rho_b, Pi, pi_boundary=1.0)
 p1 = minimum(Pi)
 alpha = 2.*(p1-p0)
 beta = p1-alpha
 pi_top = (1.-beta)/alpha
-compressible_hydrostatic_balance(state, theta_b, rho_b, Pi,
-                                 top=True, pi_boundary=pi_top, solve_for_rho=True,
-                                 params=piparams)
+balance_solver.solve(theta_b, rho_b, Pi, pi_boundary=pi_top, solve_for_rho=True)
 
 theta0.assign(theta_b)
 rho0.assign(rho_b)
@@ -4,7 +4,14 @@ from firedrake import (FunctionSpace, as_vector, VectorFunctionSpace,
                        exp, pi, cos, Function, conditional, Mesh, sin, op2)
 import sys
 
-dt = 5.0
+# the HEVI timestepper treats the horizontal acoustic terms explicitly,
+# so it needs a shorter timestep
+if '--hevi' in sys.argv:
+    hevi = True
+    dt = 2.0
+else:
+    hevi = False
+    dt = 5.0
 if '--running-tests' in sys.argv:
     tmax = dt
 else:
@@ -40,15 +47,22 @@ else:
 new_coords = Function(Vc).interpolate(xexpr)
 mesh = Mesh(new_coords)
 
+if hevi:
+    dirname += '_hevi'
+
 # sponge function
 W_DG = FunctionSpace(mesh, "DG", 2)
 x, z = SpatialCoordinate(mesh)
 zc = H-10000.
-mubar = 0.15/dt
+# the sponge strength does not depend on the timestep
+mubar = 0.15/5.0
 mu_top = conditional(z <= zc, 0.0, mubar*sin((pi/2.)*(z-zc)/(H-zc))**2)
 mu = Function(W_DG).interpolate(mu_top)
 fieldlist = ['u', 'rho', 'theta']
-timestepping = TimesteppingParameters(dt=dt)
+if hevi:
+    timestepping = TimesteppingParameters(dt=dt, maxi=2, alpha=ARS232.gamma)
+else:
+    timestepping = TimesteppingParameters(dt=dt)
 
 output = OutputParameters(dirname=dirname,
                           dumpfreq=18,
@@ -109,9 +123,9 @@ piparams = {'ksp_type': 'gmres',
                                    'pc_type': 'bjacobi',
                                    'sub_pc_type': 'ilu'}}
 
-compressible_hydrostatic_balance(state, theta_b, rho_b, Pi,
-                                 top=True, pi_boundary=0.5,
-                                 params=piparams)
+balance_solver = HydrostaticBalanceSolver(state, top=True, pi_boundary=0.5,
+                                          params=piparams)
+balance_solver.solve(theta_b, rho_b, Pi)
 
 
 def minimum(f):
@@ -125,15 +139,12 @@ static void minify(double *a, double *b) {
 
 
 p0 = minimum(Pi)
-compressible_hydrostatic_balance(state, theta_b, rho_b, Pi,
-                                 top=True, params=piparams)
+balance_solver.solve(theta_b, rho_b, Pi, pi_boundary=1.0)
 p1 = minimum(Pi)
 alpha = 2.*(p1-p0)
 beta = p1-alpha
 pi_top = (1.-beta)/alpha
-compressible_hydrostatic_balance(state, theta_b, rho_b, Pi,
-                                 top=True, pi_boundary=pi_top, solve_for_rho=True,
-                                 params=piparams)
+balance_solver.solve(theta_b, rho_b, Pi, pi_boundary=pi_top, solve_for_rho=True)
 
 theta0.assign(theta_b)
 rho0.assign(rho_b)
@@ -160,14 +171,15 @@ advected_fields.append(("u", ThetaMethod(state, u0, ueqn)))
 advected_fields.append(("rho", SSPRK3(state, rho0, rhoeqn)))
 advected_fields.append(("theta", SSPRK3(state, theta0, thetaeqn)))
 
-# Set up linear solver
-linear_solver = CompressibleSolver(state)
-
 # Set up forcing
 compressible_forcing = CompressibleForcing(state)
 
 # build time stepper
-stepper = CrankNicolson(state, advected_fields, linear_solver,
-                        compressible_forcing)
+if hevi:
+    stepper = HEVI(state, advected_fields, compressible_forcing)
+else:
+    linear_solver = CompressibleSolver(state)
+    stepper = CrankNicolson(state, advected_fields, linear_solver,
+                            compressible_forcing)
 
 stepper.run(t=0, tmax=tmax)
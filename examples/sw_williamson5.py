@@ -12,6 +12,11 @@ else:
     ref_dt = {3: 900., 4: 450., 5: 225., 6: 112.5}
     tmax = 50*day
 
+# the IMEX Runge-Kutta timestepper makes two linear solves per step,
+# rather than the maxk*maxi solves of the Crank-Nicolson iteration. The
+# number of linear solves per step is logged at the end of the run.
+imex = '--imex' in sys.argv
+
 # setup shallow water parameters
 R = 6371220.
 H = 5960.
@@ -29,7 +34,10 @@ for ref_level, dt in ref_dt.items():
     x = SpatialCoordinate(mesh)
     mesh.init_cell_orientations(x)
 
-    timestepping = TimesteppingParameters(dt=dt)
+    if imex:
+        timestepping = TimesteppingParameters(dt=dt, alpha=ARS232.gamma)
+    else:
+        timestepping = TimesteppingParameters(dt=dt)
 
     output = OutputParameters(dirname=dirname,
                               dumplist_latlon=['D'],
@@ -92,7 +100,11 @@ for ref_level, dt in ref_dt.items():
     sw_forcing = ShallowWaterForcing(state, euler_poincare=False)
 
     # build time stepper
-    stepper = CrankNicolson(state, advected_fields, linear_solver,
-                            sw_forcing)
+    if imex:
+        stepper = ARS232(state, advected_fields, linear_solver,
+                         sw_forcing)
+    else:
+        stepper = CrankNicolson(state, advected_fields, linear_solver,
+                                sw_forcing)
 
     stepper.run(t=0, tmax=tmax)
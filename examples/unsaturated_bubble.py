@@ -252,7 +252,7 @@ if diffusion:
                                                  mu=Constant(10./deltax), bcs=bcs)))
 
 # define condensation
-physics_list = [Fallout(state), Coalescence(state), Evaporation(state), Condensation(state)]
+physics_list = [Fallout(state), WarmRain(state)]
 
 # build time stepper
 stepper = CrankNicolson(state, advected_fields, linear_solver,
@@ -1,12 +1,25 @@
 from abc import ABCMeta, abstractmethod, abstractproperty
+from math import ceil
+import numpy as np
+from mpi4py import MPI
 from firedrake import (Function, LinearVariationalProblem,
-                       LinearVariationalSolver, Projector, Interpolator)
+                       LinearVariationalSolver, Projector, Interpolator,
+                       assemble, VectorFunctionSpace,
+                       SpatialCoordinate, Constant, TestFunction, dx,
+                       sqrt, dot, BrokenElement)
 from firedrake.utils import cached_property
-from gusto.configuration import logger, DEBUG
+from ufl import Argument
+from gusto.configuration import logger, DEBUG, EmbeddedDGOptions
+from gusto.diagnostics import Diagnostics
+from gusto.mass_solvers import LocalMassSolver
+from gusto.point_location import CellWalker, CellWalkLocation
 from gusto.recovery import Recoverer
+from gusto.transport_equation import (AdvectionEquation, EmbeddedDGAdvection,
+                                      IntegrateByParts, is_dg)
 
 
-__all__ = ["NoAdvection", "ForwardEuler", "SSPRK3", "ThetaMethod"]
+__all__ = ["NoAdvection", "ForwardEuler", "SSPRK3", "ThetaMethod",
+           "SemiLagrangian", "MultiTracerAdvection"]
 
 
 def embedded_dg(original_apply):
@@ -56,7 +69,7 @@ class Advection(object, metaclass=ABCMeta):
             self.equation = equation
             # get ubar from the equation class
             self.ubar = self.equation.ubar
-            self.dt = self.state.timestepping.dt
+            self.dt = self.state.dt
 
             # get default solver options if none passed in
             if solver_parameters is None:
@@ -157,10 +170,26 @@ class Advection(object, metaclass=ABCMeta):
         return self.equation.mass_term(self.q1) - self.dt*self.equation.advection_term(self.q1)
 
     def update_ubar(self, xn, xnp1, alpha):
+        """
+        Update the advecting velocity, if this scheme has its own. The
+        timesteppers only update the velocity shared through the state,
+        once for all of the schemes, by :meth:`.State.update_ubar`.
+        """
+        if self.ubar is self.state.ubar:
+            return
         un = xn.split()[0]
         unp1 = xnp1.split()[0]
         self.ubar.assign(un + alpha*(unp1-un))
 
+    def update_dt(self):
+        """
+        Mark the operator for reassembly after ``state.dt`` has been
+        changed. This is only needed if the left hand side depends on
+        the timestep, as for implicit schemes.
+        """
+        if "solver" in self.__dict__ and self.state.dt in self.lhs.coefficients():
+            self.solver.invalidate_jacobian()
+
     @cached_property
     def solver(self):
         # setup solver using lhs and rhs defined in derived class
@@ -206,19 +235,41 @@ class ExplicitAdvection(Advection):
     :arg field: field to be advected
     :arg equation: :class:`.Equation` object, specifying the equation
     that field satisfies
-    :arg subcycles: (optional) integer specifying number of subcycles to perform
-    :arg solver_parameters: solver_parameters
+    :arg subcycles: (optional) integer specifying number of subcycles to
+    perform, or if max_courant is given, the largest number of subcycles
+    :arg max_courant: (optional) if given, the number of subcycles is
+    chosen at each apply as the smallest for which the Courant number of
+    ubar in each subcycle is at most max_courant
+    :arg solver_parameters: solver_parameters, not used if the equation is
+    on a discontinuous space, as then the mass matrix is inverted directly
     :arg limiter: :class:`.Limiter` object.
     """
 
     def __init__(self, state, field, equation=None, *, subcycles=None,
-                 solver_parameters=None, limiter=None):
+                 max_courant=None, solver_parameters=None, limiter=None):
         super().__init__(state, field, equation,
                          solver_parameters=solver_parameters, limiter=limiter)
 
+        self.max_courant = max_courant
+        if max_courant is not None:
+            # the subcycle timestep is a fraction of dt that is changed
+            # at each apply, so the forms do not need rebuilding
+            self.max_subcycles = subcycles
+            self.cycle_fraction = Constant(1.)
+            self.dt = self.dt*self.cycle_fraction
+            self.ncycles = 1
+
+            # the Courant number of ubar in each cell, as for the
+            # CourantNumber diagnostic
+            V = state.spaces("DG0", state.mesh, "DG", 0)
+            area = assemble(TestFunction(V)*dx)
+            self.courant = Function(V)
+            self.courant_interpolator = Interpolator(
+                sqrt(dot(self.ubar, self.ubar))/sqrt(area)*state.dt, self.courant)
+
         # if user has specified a number of subcycles, then save this
         # and rescale dt accordingly; else perform just one cycle using dt
-        if subcycles is not None:
+        elif subcycles is not None:
             self.dt = self.dt/subcycles
             self.ncycles = subcycles
         else:
@@ -226,6 +277,35 @@ class ExplicitAdvection(Advection):
             self.ncycles = 1
         self.x = [Function(self.fs)]*(self.ncycles+1)
 
+    def update_subcycles(self):
+        """
+        Choose the number of subcycles from the maximum Courant number
+        of ubar, if max_courant was given.
+        """
+        if self.max_courant is None:
+            return
+        self.courant_interpolator.interpolate()
+        courant = Diagnostics.max(self.courant)
+        ncycles = max(1, int(ceil(courant/self.max_courant)))
+        if self.max_subcycles is not None:
+            ncycles = min(ncycles, self.max_subcycles)
+
+        if ncycles != self.ncycles:
+            logger.debug("%s: changing from %s to %s subcycles, max Courant number %s"
+                         % (self.field.name(), self.ncycles, ncycles, courant))
+            self.ncycles = ncycles
+            self.cycle_fraction.assign(1./ncycles)
+            self.x = [self.x[0]]*(ncycles+1)
+
+    @cached_property
+    def solver(self):
+        # the lhs is the mass matrix, which for discontinuous spaces
+        # (e.g. the embedded DG and recovered schemes) can be inverted
+        # exactly cell by cell, rather than with a Krylov solver
+        if is_dg(self.equation.V) and isinstance(self.equation.test, Argument):
+            return LocalMassSolver(self.lhs, self.rhs, self.dq)
+        return super().solver
+
     @abstractmethod
     def apply_cycle(self, x_in, x_out):
         """
@@ -246,6 +326,7 @@ class ExplicitAdvection(Advection):
         :arg x: :class:`.Function` object, the input Function.
         :arg x_out: :class:`.Function` object, the output Function.
         """
+        self.update_subcycles()
         self.x[0].assign(x_in)
         for i in range(self.ncycles):
             self.apply_cycle(self.x[i], self.x[i+1])
@@ -355,3 +436,268 @@ class ThetaMethod(Advection):
         self.q1.assign(x_in)
         self.solver.solve()
         x_out.assign(self.dq)
+
+
+class SemiLagrangian(Advection):
+    """
+    Class to implement a semi-Lagrangian advection scheme, which is not
+    restricted by the Courant number. The value of x_out at each node is
+    the value of x_in at the departure point of the trajectory arriving
+    at that node, which is found from ubar with the implicit midpoint
+    rule, after interpolating ubar into the vector valued version of the
+    field's space. In each iteration the points are located once, with
+    a :class:`.CellWalker` that starts each point from the cell of its
+    arrival node and walks it through the neighbouring cells, and the
+    functions are evaluated at them with a :class:`.PointEvaluator`, as
+    a single gather and weighted sum, which is set up once for each
+    location and function space. Each rank only locates its own
+    points. In parallel, the few points whose walk leaves the cells of
+    their rank, including its halo, are sent to the ranks whose bounds
+    contain them, which search their cells for them, and each is then
+    evaluated by the rank that owns it, which sends the value straight
+    back.
+
+    Departure points are wrapped back into the domain in its periodic
+    directions, and on the sphere they are moved back onto the sphere.
+    If a trajectory otherwise leaves the domain, as it can through a
+    boundary that is not a coordinate plane, such as terrain, its
+    departure point is moved back towards the arrival node, halving its
+    distance from it up to max_bisections times, and then onto the
+    arrival node itself.
+
+    The degrees of freedom of the field must be point evaluations, as
+    for the DG and temperature spaces, or the scheme can be used with
+    the embedded DG option. The scheme is not conservative.
+
+    :arg state: :class:`.State` object.
+    :arg field: field to be advected
+    :arg equation: :class:`.Equation` object, specifying the equation
+    that field satisfies
+    :arg iterations: (optional) number of iterations of the implicit
+    midpoint rule for the departure points
+    :arg periodic_lengths: (optional) tuple giving, for each coordinate,
+    the length of the domain if it is periodic in that direction, or
+    None if it is not.
+    :arg max_bisections: (optional) number of times the departure point
+    of a trajectory that leaves the domain is moved halfway back towards
+    its arrival node.
+    :arg limiter: :class:`.Limiter` object.
+    """
+
+    def __init__(self, state, field, equation=None, *, iterations=2,
+                 periodic_lengths=None, max_bisections=10,
+                 solver_parameters=None, limiter=None):
+        super().__init__(state, field, equation,
+                         solver_parameters=solver_parameters, limiter=limiter)
+
+        mesh = state.mesh
+        element = self.fs.ufl_element()
+        if len(self.fs.shape) != len(element.value_shape()):
+            raise NotImplementedError("The semi-Lagrangian scheme needs a space with point evaluation degrees of freedom")
+        if len(self.fs.shape) > 0:
+            element = element.sub_elements()[0]
+
+        self.iterations = iterations
+        self.periodic_lengths = periodic_lengths
+        self.max_bisections = max_bisections
+        self.comm = mesh.comm
+
+        # the coordinates of the owned nodes, a cell containing each of
+        # them, and ubar at them
+        self.Vx = VectorFunctionSpace(mesh, element)
+        x = Function(self.Vx).interpolate(SpatialCoordinate(mesh))
+        self.arrival_points = x.dat.data_ro.copy()
+        self.walker = CellWalker(mesh, periodic_lengths=periodic_lengths)
+        self.arrival_cells = self.walker.node_cells(self.Vx)
+        self.u_arrival = Function(self.Vx)
+        self.u_interpolator = Interpolator(self.ubar, self.u_arrival)
+
+        self.lower = mesh.coordinates.dat.data_ro.min(axis=0)
+        self.comm.Allreduce(MPI.IN_PLACE, self.lower, op=MPI.MIN)
+        self.on_sphere = (mesh.geometric_dimension() > mesh.topological_dimension()
+                          and not hasattr(mesh, "_base_mesh"))
+
+    def lhs(self):
+        pass
+
+    def rhs(self):
+        pass
+
+    def _in_domain(self, points, arrival_points):
+        """
+        Return a copy of points, moved back onto the sphere, or wrapped
+        back into the domain in the periodic directions.
+        """
+        points = points.copy()
+        if self.on_sphere:
+            radius = np.linalg.norm(arrival_points, axis=1)
+            points *= (radius/np.linalg.norm(points, axis=1))[:, None]
+            return points
+        if self.periodic_lengths is not None:
+            for i, length in enumerate(self.periodic_lengths):
+                if length is not None:
+                    points[:, i] = self.lower[i] + np.mod(points[:, i] - self.lower[i], length)
+        return points
+
+    def _bisect(self, location, points, x):
+        """
+        Move the missing points of location back towards their arrival
+        nodes x until they are in the domain.
+        """
+        for i in range(self.max_bisections + 1):
+            missing = location.missing
+            if len(missing) == 0:
+                break
+            if i < self.max_bisections:
+                points[missing] = 0.5*(x[missing] + points[missing])
+            else:
+                points[missing] = x[missing]
+            location.relocate(self._in_domain(points[missing], x[missing]))
+        if len(location.missing) > 0:
+            raise ValueError("Departure points %s are not in the domain"
+                             % points[location.missing])
+
+    def _locate(self, points):
+        """
+        Return a :class:`.CellWalkLocation` of this rank's points,
+        walking from the cells of their arrival nodes. Points that are
+        not in the domain are moved back towards their arrival nodes
+        until they are. The points that are not in this rank's cells are
+        located by the ranks whose bounds contain them.
+        """
+        # a copy, as the points that are not in the domain are moved
+        points = np.array(points)
+        x = self.arrival_points
+        location = CellWalkLocation(self.walker, self._in_domain(points, x),
+                                    self.arrival_cells)
+        while True:
+            self._bisect(location, points, x)
+            # all ranks take part in locating the remote points, and
+            # those that no rank finds are moved back again
+            if self.comm.allreduce(len(location.remote)) == 0:
+                break
+            remote = location.remote
+            location.locate_remote(self._in_domain(points[remote], x[remote]))
+        return location
+
+    def departure_points(self):
+        """
+        Return the :class:`.CellWalkLocation` of the departure points of
+        the trajectories arriving at the nodes, found from ubar with the
+        implicit midpoint rule.
+        """
+        dt = float(self.dt)
+        self.u_interpolator.interpolate()
+        x = self.arrival_points
+        x_dep = x - dt*self.u_arrival.dat.data_ro
+        for i in range(self.iterations):
+            u_mid = self._locate(0.5*(x + x_dep)).evaluate(self.u_arrival)
+            x_dep = x - dt*u_mid
+        return self._locate(x_dep)
+
+    @embedded_dg
+    def apply(self, x_in, x_out):
+        """
+        Function takes x as input, evaluates it at the departure points,
+        and returns x_out as output.
+
+        :arg x: :class:`.Function` object, the input Function.
+        :arg x_out: :class:`.Function` object, the output Function.
+        """
+        values = self.departure_points().evaluate(x_in)
+        x_out.dat.data[:] = values.reshape(x_out.dat.data.shape)
+        if self.limiter is not None:
+            self.limiter.apply(x_out)
+
+
+class MultiTracerAdvection(object):
+    """
+    Class to advect several scalar fields that are in the same function
+    space, and satisfy the same advection equation, together. The fields
+    are copied into one vector valued field, so that each stage of the
+    scheme is a single assembly and solve for all of them, and ubar is
+    only updated once.
+
+    The vector valued field is added to the state's fields, and
+    :attr:`name` is the name to use for this scheme in the
+    ``advected_fields`` of the timestepper, e.g.::
+
+        tracers = MultiTracerAdvection(state, ["water_v", "water_c", "rain"])
+        advected_fields.append((tracers.name, tracers))
+
+    :arg state: :class:`.State` object.
+    :arg field_names: list of names of the fields to advect.
+    :arg scheme: (optional) the explicit :class:`.Advection` class to use.
+    Defaults to :class:`SSPRK3`.
+    :arg equation_form: (optional) string, passed to the
+    :class:`.AdvectionEquation`. Defaults to "advective".
+    :arg ibp: (optional) :class:`.IntegrateByParts`, passed to the
+    :class:`.AdvectionEquation`. Defaults to once.
+    :arg subcycles: (optional) integer specifying number of subcycles to perform
+    :arg max_courant: (optional) target Courant number for choosing the
+    number of subcycles at each apply, passed to the scheme.
+    :arg solver_parameters: (optional) solver_parameters
+    :arg options: (optional) :class:`.EmbeddedDGOptions`, to advect the
+    fields in the broken version of their space, as with
+    :class:`.EmbeddedDGAdvection`. The vector valued field is then
+    interpolated into the broken space and projected back once per
+    apply for all of the fields. The recovered and SUPG options, and
+    limiters, are not supported.
+    """
+
+    def __init__(self, state, field_names, scheme=SSPRK3, *,
+                 equation_form="advective", ibp=IntegrateByParts.ONCE,
+                 subcycles=None, max_courant=None, solver_parameters=None,
+                 options=None):
+
+        self.fields = [state.fields(name) for name in field_names]
+        V = self.fields[0].function_space()
+        if any(f.function_space() != V for f in self.fields):
+            raise ValueError("Fields advected together must all be in the same function space")
+        if len(V.shape) > 0:
+            raise ValueError("Only scalar fields can be advected together")
+
+        self.name = "_".join(field_names)
+        V_vec = VectorFunctionSpace(state.mesh, V.ufl_element(), dim=len(self.fields))
+        self.x = state.fields(self.name, V_vec, dump=False, pickup=False)
+
+        if options is None:
+            equation = AdvectionEquation(state, V_vec, ibp=ibp,
+                                         equation_form=equation_form,
+                                         solver_params=solver_parameters)
+        elif isinstance(options, EmbeddedDGOptions):
+            if options.embedding_space is None:
+                V_dg = BrokenElement(V.ufl_element())
+            else:
+                V_dg = options.embedding_space.ufl_element()
+            V_dg_vec = VectorFunctionSpace(state.mesh, V_dg, dim=len(self.fields))
+            equation = EmbeddedDGAdvection(state, V_vec, ibp=ibp,
+                                           equation_form=equation_form,
+                                           solver_params=solver_parameters,
+                                           options=EmbeddedDGOptions(embedding_space=V_dg_vec))
+        else:
+            raise NotImplementedError("Only the embedded DG option is supported for fields advected together")
+        self.scheme = scheme(state, self.x, equation, subcycles=subcycles,
+                             max_courant=max_courant)
+
+    def update_ubar(self, xn, xnp1, alpha):
+        self.scheme.update_ubar(xn, xnp1, alpha)
+
+    def update_dt(self):
+        self.scheme.update_dt()
+
+    def apply(self, x_in, x_out):
+        """
+        Advect all of the fields, which are taken from and put back into
+        the state's fields. x_in and x_out are the vector valued field.
+
+        :arg x_in: :class:`.Function` object, the input Function.
+        :arg x_out: :class:`.Function` object, the output Function.
+        """
+        # the scalar and vector spaces have the same nodes, so the
+        # fields are the components of the vector valued field
+        for i, f in enumerate(self.fields):
+            x_in.dat.data[:, i] = f.dat.data_ro
+        self.scheme.apply(x_in, x_out)
+        for i, f in enumerate(self.fields):
+            f.dat.data[:] = x_out.dat.data_ro[:, i]
@@ -46,6 +46,25 @@ class TimesteppingParameters(Configuration):
     alpha = 0.5
     maxk = 4
     maxi = 1
+    #: If not None, the maxk/maxi iterations of the semi implicit step
+    #: stop early once the increment from the linear solve, relative
+    #: to the new state, is below this tolerance for every field.
+    picard_rtol = None
+    #: Absolute floor added to the picard_rtol test, so that fields
+    #: that are zero, such as a velocity starting from rest, can
+    #: converge. Either a number used for every field or a dictionary
+    #: mapping field names to numbers, with 0 for missing fields.
+    picard_atol = 0.
+    #: If True, the timestep is recomputed at the start of each step
+    #: so that the maximum Courant number is close to max_courant.
+    adaptive = False
+    max_courant = 0.8
+    #: Bounds for the timestep when adaptive is True. If None, the
+    #: timestep is not bounded from below or above respectively.
+    dt_min = None
+    dt_max = None
+    #: Largest factor by which the timestep may grow in a single step.
+    max_dt_growth = 1.2
 
 
 class OutputParameters(Configuration):
@@ -75,6 +94,17 @@ class OutputParameters(Configuration):
     #: List of ordered pairs (name, points) where name is the field
     # name and points is the points at which to dump them
     point_data = []
+    #: Number of dumps of the diagnostics and point data held in memory
+    #: before they are written to their netCDF files. Buffered dumps are
+    #: also written at each checkpoint and at the end of the run.
+    netcdf_buffer_size = 1
+    #: If True, the VTU and netCDF output is written by a background
+    #: thread while the model continues to timestep.
+    async_output = False
+    #: Number of snapshot buffers for the writes pending when
+    #: async_output is True. Each VTU file and each netCDF write takes
+    #: one, and the model only waits for the writer once all are in use.
+    async_pool_size = 4
 
 
 class CompressibleParameters(Configuration):
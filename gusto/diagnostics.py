@@ -1,12 +1,13 @@
 from firedrake import op2, assemble, dot, dx, FunctionSpace, Function, sqrt, \
     TestFunction, TrialFunction, Constant, grad, inner, \
     LinearVariationalProblem, LinearVariationalSolver, FacetNormal, \
-    ds, ds_b, ds_v, ds_t, dS_v, div, avg, jump, DirichletBC, BrokenElement, \
+    ds, ds_b, ds_v, ds_t, dS_v, div, avg, jump, DirichletBC, \
     TensorFunctionSpace, SpatialCoordinate, VectorFunctionSpace, as_vector
 
+from weakref import WeakKeyDictionary
+
 from abc import ABCMeta, abstractmethod, abstractproperty
 from gusto import thermodynamics
-from gusto.recovery import Recoverer, Boundary_Method
 import numpy as np
 
 __all__ = ["Diagnostics", "CourantNumber", "VelocityX", "VelocityZ", "VelocityY", "Gradient",
@@ -20,6 +21,33 @@ __all__ = ["Diagnostics", "CourantNumber", "VelocityX", "VelocityZ", "VelocityY"
            "PotentialVorticity", "RelativeVorticity", "AbsoluteVorticity"]
 
 
+# kernels for the min and max of the absolute values of a field
+_minify = op2.Kernel("""
+static void minify(double *a, double *b) {
+    a[0] = a[0] > fabs(b[0]) ? fabs(b[0]) : a[0];
+}
+""", "minify")
+
+_maxify = op2.Kernel("""
+static void maxify(double *a, double *b) {
+    a[0] = a[0] < fabs(b[0]) ? fabs(b[0]) : a[0];
+}
+""", "maxify")
+
+# the area (or volume) of each mesh
+_areas = WeakKeyDictionary()
+
+
+def domain_area(mesh):
+    """Return the area of a mesh, which is only assembled once."""
+    try:
+        return _areas[mesh]
+    except KeyError:
+        area = assemble(1*dx(domain=mesh))
+        _areas[mesh] = area
+        return area
+
+
 class Diagnostics(object):
 
     available_diagnostics = ["min", "max", "rms", "l2", "total"]
@@ -27,6 +55,8 @@ class Diagnostics(object):
     def __init__(self, *fields):
 
         self.fields = list(fields)
+        # forms and tensors for the integrals of each field
+        self._integrals = {}
 
     def register(self, *fields):
 
@@ -35,29 +65,93 @@ class Diagnostics(object):
             if f not in fset:
                 self.fields.append(f)
 
+    def statistics(self, state):
+        """
+        Compute the available diagnostics for all of the registered
+        fields. For each field the min, max, rms, l2 and total are
+        computed from a single assembly and pass over the field data,
+        and the values from all of the fields are combined across
+        processes in one collective operation.
+
+        Returns a list of (field name, diagnostic name, value) tuples.
+
+        :arg state: The :class:`State` containing the fields.
+        """
+        fields = [state.fields(name) for name in self.fields]
+        local = np.array([self._local_statistics(f) for f in fields]).reshape(len(fields), 4)
+        comm = state.mesh.comm
+        gathered = np.empty((comm.size,) + local.shape)
+        comm.Allgather(local, gathered)
+        fmin = gathered[:, :, 0].min(axis=0)
+        fmax = gathered[:, :, 1].max(axis=0)
+        sum_squares = gathered[:, :, 2].sum(axis=0)
+        integral = gathered[:, :, 3].sum(axis=0)
+
+        values = []
+        for i, (fname, f) in enumerate(zip(self.fields, fields)):
+            for dname in self.available_diagnostics:
+                if dname == "min":
+                    value = fmin[i]
+                elif dname == "max":
+                    value = fmax[i]
+                elif dname == "rms":
+                    value = np.sqrt(sum_squares[i]/domain_area(f.ufl_domain()))
+                elif dname == "l2":
+                    value = np.sqrt(sum_squares[i])
+                elif dname == "total":
+                    value = integral[i] if len(f.ufl_shape) == 0 else None
+                else:
+                    value = getattr(self, dname)(f)
+                values.append((fname, dname, value))
+        return values
+
+    def _local_statistics(self, f):
+        """
+        Return the min and max of the absolute value of the first
+        component of f over the nodes owned by this process, and the
+        contributions of its cells to the integrals of f.f and f.
+        """
+        data = f.dat.data_ro
+        data = abs(data.reshape(len(data), -1)[:, 0])
+        if len(data) > 0:
+            fmin, fmax = data.min(), data.max()
+        else:
+            fmin, fmax = np.finfo(float).max, np.finfo(float).min
+
+        # assemble both integrands against DG0, so that the owned cell
+        # values can be summed without communication
+        try:
+            form, tensor = self._integrals[f]
+        except KeyError:
+            mesh = f.ufl_domain()
+            V = VectorFunctionSpace(mesh, "DG", 0, dim=2)
+            if len(f.ufl_shape) == 0:
+                integrand = as_vector([inner(f, f), f])
+            else:
+                integrand = as_vector([inner(f, f), 0])
+            form = inner(integrand, TestFunction(V))*dx
+            tensor = Function(V)
+            self._integrals[f] = (form, tensor)
+        assemble(form, tensor=tensor)
+        sum_squares, integral = tensor.dat.data_ro.sum(axis=0)
+
+        return fmin, fmax, sum_squares, integral
+
     @staticmethod
     def min(f):
         fmin = op2.Global(1, np.finfo(float).max, dtype=float)
-        op2.par_loop(op2.Kernel("""
-static void minify(double *a, double *b) {
-    a[0] = a[0] > fabs(b[0]) ? fabs(b[0]) : a[0];
-}
-""", "minify"), f.dof_dset.set, fmin(op2.MIN), f.dat(op2.READ))
+        op2.par_loop(_minify, f.dof_dset.set, fmin(op2.MIN), f.dat(op2.READ))
         return fmin.data[0]
 
     @staticmethod
     def max(f):
         fmax = op2.Global(1, np.finfo(float).min, dtype=float)
-        op2.par_loop(op2.Kernel("""
-static void maxify(double *a, double *b) {
-    a[0] = a[0] < fabs(b[0]) ? fabs(b[0]) : a[0];
-}
-""", "maxify"), f.dof_dset.set, fmax(op2.MAX), f.dat(op2.READ))
+        op2.par_loop(_maxify, f.dof_dset.set, fmax(op2.MAX), f.dat(op2.READ))
         return fmax.data[0]
 
     @staticmethod
     def rms(f):
-        area = assemble(1*dx(domain=f.ufl_domain()))
+        area = domain_area(f.ufl_domain())
         return sqrt(assemble(inner(f, f)*dx)/area)
 
     @staticmethod
@@ -73,10 +167,37 @@ static void maxify(double *a, double *b) {
 
 
 class DiagnosticField(object, metaclass=ABCMeta):
-
-    def __init__(self, required_fields=()):
+    """
+    Base class for diagnostic fields.
+
+    :kwarg required_fields: names of the fields that this diagnostic field
+    is computed from.
+    :kwarg outputs: names of the outputs that write this field, from
+    "vtu", "diagnostics" and "point_data". If None (the default) it is
+    written by all of the outputs that are switched on. The field is
+    only computed when one of these outputs needs it, or when another
+    diagnostic field that is computed depends on it.
+    :kwarg frequency: (optional) integer, if given the field is only
+    computed at every frequency-th dump, with the outputs using its
+    most recently computed value in between.
+    """
+
+    available_outputs = ("vtu", "diagnostics", "point_data")
+
+    def __init__(self, required_fields=(), outputs=None, frequency=None):
         self._initialised = False
         self.required_fields = required_fields
+        if outputs is not None:
+            unknown = set(outputs).difference(self.available_outputs)
+            if unknown:
+                raise ValueError("Unknown outputs %s for diagnostic field, must be from %s"
+                                 % (sorted(unknown), self.available_outputs))
+        self.outputs = outputs
+        self.frequency = frequency
+
+    def is_output_to(self, output):
+        """Is this field written by the named output?"""
+        return self.outputs is None or output in self.outputs
 
     @abstractproperty
     def name(self):
@@ -113,8 +234,7 @@ class CourantNumber(DiagnosticField):
 
     def compute(self, state):
         u = state.fields("u")
-        dt = Constant(state.timestepping.dt)
-        return self.field.project(sqrt(dot(u, u))/sqrt(self.area)*dt)
+        return self.field.project(sqrt(dot(u, u))/sqrt(self.area)*state.dt)
 
 
 class VelocityX(DiagnosticField):
@@ -161,8 +281,8 @@ class VelocityY(DiagnosticField):
 
 class Gradient(DiagnosticField):
 
-    def __init__(self, name):
-        super().__init__()
+    def __init__(self, name, **kwargs):
+        super().__init__(**kwargs)
         self.fname = name
 
     @property
@@ -198,8 +318,8 @@ class Gradient(DiagnosticField):
 
 class SphericalComponent(DiagnosticField):
 
-    def __init__(self, name):
-        super().__init__()
+    def __init__(self, name, **kwargs):
+        super().__init__(**kwargs)
         self.fname = name
 
     def setup(self, state):
@@ -260,8 +380,8 @@ class RadialComponent(SphericalComponent):
 class RichardsonNumber(DiagnosticField):
     name = "RichardsonNumber"
 
-    def __init__(self, density_field, factor=1.):
-        super().__init__(required_fields=(density_field, "u_gradient"))
+    def __init__(self, density_field, factor=1., **kwargs):
+        super().__init__(required_fields=(density_field, "u_gradient"), **kwargs)
         self.density_field = density_field
         self.factor = Constant(factor)
 
@@ -326,8 +446,8 @@ class ShallowWaterPotentialEnergy(Energy):
 
 class ShallowWaterPotentialEnstrophy(DiagnosticField):
 
-    def __init__(self, base_field_name="PotentialVorticity"):
-        super().__init__()
+    def __init__(self, base_field_name="PotentialVorticity", **kwargs):
+        super().__init__(**kwargs)
         self.base_field_name = base_field_name
 
     @property
@@ -366,8 +486,8 @@ class CompressibleKineticEnergy(Energy):
 
 class ExnerPi(DiagnosticField):
 
-    def __init__(self, reference=False):
-        super(ExnerPi, self).__init__()
+    def __init__(self, reference=False, **kwargs):
+        super(ExnerPi, self).__init__(**kwargs)
         self.reference = reference
         if reference:
             self.rho_name = "rhobar"
@@ -397,8 +517,8 @@ class ExnerPi(DiagnosticField):
 
 class Sum(DiagnosticField):
 
-    def __init__(self, field1, field2):
-        super().__init__(required_fields=(field1, field2))
+    def __init__(self, field1, field2, **kwargs):
+        super().__init__(required_fields=(field1, field2), **kwargs)
         self.field1 = field1
         self.field2 = field2
 
@@ -419,8 +539,8 @@ class Sum(DiagnosticField):
 
 class Difference(DiagnosticField):
 
-    def __init__(self, field1, field2):
-        super().__init__(required_fields=(field1, field2))
+    def __init__(self, field1, field2, **kwargs):
+        super().__init__(required_fields=(field1, field2), **kwargs)
         self.field1 = field1
         self.field2 = field2
 
@@ -441,8 +561,8 @@ class Difference(DiagnosticField):
 
 class SteadyStateError(Difference):
 
-    def __init__(self, state, name):
-        DiagnosticField.__init__(self)
+    def __init__(self, state, name, **kwargs):
+        DiagnosticField.__init__(self, **kwargs)
         self.field1 = name
         self.field2 = name+'_init'
         field1 = state.fields(name)
@@ -456,10 +576,10 @@ class SteadyStateError(Difference):
 
 class Perturbation(Difference):
 
-    def __init__(self, name):
+    def __init__(self, name, **kwargs):
         self.field1 = name
         self.field2 = name+'bar'
-        DiagnosticField.__init__(self, required_fields=(self.field1, self.field2))
+        DiagnosticField.__init__(self, required_fields=(self.field1, self.field2), **kwargs)
 
     @property
     def name(self):
@@ -472,20 +592,18 @@ class ThermodynamicDiagnostic(DiagnosticField):
     def setup(self, state):
         if not self._initialised:
             space = state.fields("theta").function_space()
-            broken_space = FunctionSpace(state.mesh, BrokenElement(space.ufl_element()))
-            boundary_method = Boundary_Method.physics if (state.vertical_degree == 0 and state.horizontal_degree == 0) else None
             super().setup(state, space=space)
 
             # now let's attach all of our fields
+            # the recovered rho is shared with the other diagnostics
+            # and the physics
+            derived = state.derived_fields
+            self.derived_fields = derived
             self.u = state.fields("u")
             self.rho = state.fields("rho")
             self.theta = state.fields("theta")
-            self.rho_averaged = Function(space)
-            self.recoverer = Recoverer(self.rho, self.rho_averaged, VDG=broken_space, boundary_method=boundary_method)
-            try:
-                self.r_v = state.fields("water_v")
-            except NotImplementedError:
-                self.r_v = Constant(0.0)
+            self.rho_averaged = derived.rho_averaged
+            self.r_v = derived.r_v
             try:
                 self.r_c = state.fields("water_c")
             except NotImplementedError:
@@ -496,14 +614,14 @@ class ThermodynamicDiagnostic(DiagnosticField):
                 self.rain = Constant(0.0)
 
             # now let's store the most common expressions
-            self.pi = thermodynamics.pi(state.parameters, self.rho_averaged, self.theta)
-            self.T = thermodynamics.T(state.parameters, self.theta, self.pi, r_v=self.r_v)
-            self.p = thermodynamics.p(state.parameters, self.pi)
+            self.pi = derived.pi
+            self.T = derived.T
+            self.p = derived.p
             self.r_l = self.r_c + self.rain
             self.r_t = self.r_v + self.r_c + self.rain
 
     def compute(self, state):
-        self.recoverer.project()
+        self.derived_fields.update_rho_averaged()
 
 
 class Theta_e(ThermodynamicDiagnostic):
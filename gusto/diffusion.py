@@ -18,6 +18,13 @@ class Diffusion(object, metaclass=ABCMeta):
     def __init__(self, state):
         self.state = state
 
+    def update_dt(self):
+        """
+        Mark the operator for reassembly after ``state.dt`` has
+        been changed.
+        """
+        pass
+
     @abstractmethod
     def apply(self, x, x_out):
         """
@@ -47,7 +54,7 @@ class InteriorPenalty(Diffusion):
     def __init__(self, state, V, kappa, mu, bcs=None):
         super(InteriorPenalty, self).__init__(state)
 
-        dt = state.timestepping.dt
+        dt = state.dt
         gamma = TestFunction(V)
         phi = TrialFunction(V)
         self.phi1 = Function(V)
@@ -67,6 +74,9 @@ class InteriorPenalty(Diffusion):
         problem = LinearVariationalProblem(a, action(L, self.phi1), self.phi1, bcs=bcs)
         self.solver = LinearVariationalSolver(problem)
 
+    def update_dt(self):
+        self.solver.invalidate_jacobian()
+
     def apply(self, x_in, x_out):
         self.phi1.assign(x_in)
         self.solver.solve()
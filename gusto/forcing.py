@@ -1,9 +1,12 @@
 from abc import ABCMeta, abstractmethod
 from firedrake import (Function, split, TrialFunction, TestFunction,
+                       TrialFunctions, TestFunctions, DirichletBC,
                        FacetNormal, inner, dx, cross, div, jump, avg, dS_v,
                        LinearVariationalProblem, LinearVariationalSolver,
                        dot, dS, Constant, as_vector, SpatialCoordinate)
 from gusto.configuration import logger, DEBUG
+from gusto.mass_solvers import LocalMassSolver
+from gusto.transport_equation import is_dg
 from gusto import thermodynamics
 
 
@@ -22,10 +25,36 @@ class Forcing(object, metaclass=ABCMeta):
     terms (namely the Euler Poincare term) should not be added.
     :arg extra_terms: extra terms to add to the u component of the forcing
     term - these will be multiplied by the appropriate test function.
+    :arg fused: if True then the forcing of all of the components of the
+    state is found from a single solve with the block diagonal mass
+    matrix of the mixed space, rather than with a separate solve for
+    each component.
+    :arg direct_mass_solve: if True then the mass matrices of the
+    continuous spaces are factorised once with a direct (MUMPS LU)
+    solver, rather than solved iteratively with CG.
+    :arg direction: optional, either "horizontal" or "vertical". If
+    given then the velocity forcing is only tested against that part of
+    the velocity test function, so that the horizontal and vertical
+    forcings sum to the full forcing. The forcing of the other
+    components is included in the horizontal part, and the sponge term
+    in the vertical part.
+    :arg scale_sponge: if True then the sponge term is scaled by the
+    same coefficient as the other terms, as in the stages of an
+    implicit-explicit scheme, rather than by the implicit weight times
+    dt.
     """
 
-    def __init__(self, state, euler_poincare=True, linear=False, extra_terms=None, moisture=None):
+    def __init__(self, state, euler_poincare=True, linear=False, extra_terms=None, moisture=None,
+                 fused=False, direct_mass_solve=False, direction=None, scale_sponge=False):
         self.state = state
+        self.fused = fused
+        self.direct_mass_solve = direct_mass_solve
+        if direction not in [None, "horizontal", "vertical"]:
+            raise ValueError("direction must be 'horizontal' or 'vertical', not %s" % direction)
+        self.direction = direction
+        # whether the forcing of the other components is included
+        self.component_forcing = direction != "vertical"
+        self.scale_sponge = scale_sponge
         if linear:
             self.euler_poincare = False
             logger.warning('Setting euler_poincare to False because you have set linear=True')
@@ -36,14 +65,36 @@ class Forcing(object, metaclass=ABCMeta):
         self.Vu = state.spaces("HDiv")
         # this is the function that the forcing term is applied to
         self.x0 = Function(state.W)
-        self.test = TestFunction(self.Vu)
-        self.trial = TrialFunction(self.Vu)
-        # this is the function that contains the result of solving
-        # <test, trial> = <test, F(x0)>, where F is the forcing term
-        self.uF = Function(self.Vu)
+        if fused:
+            self.tests = TestFunctions(state.W)
+            self.trials = TrialFunctions(state.W)
+            self.test = self.tests[0]
+            self.trial = self.trials[0]
+            # this contains the forcing of all of the components
+            self.xF = Function(state.W)
+            self.uF = self.xF.split()[0]
+        else:
+            self.test = TestFunction(self.Vu)
+            self.trial = TrialFunction(self.Vu)
+            # this is the function that contains the result of solving
+            # <test, trial> = <test, F(x0)>, where F is the forcing term
+            self.uF = Function(self.Vu)
 
         # find out which terms we need
         self.extruded = self.Vu.extruded
+
+        # the forcing terms are tested against the part of the test
+        # function in the given direction, but the mass matrix is not
+        self.mass_test = self.test
+        if direction is not None:
+            if not self.extruded:
+                raise ValueError("The forcing can only be split by direction on an extruded mesh")
+            test_v = dot(self.test, state.k)*state.k
+            if direction == "vertical":
+                self.test = test_v
+            else:
+                self.test = self.test - test_v
+
         self.coriolis = state.Omega is not None or hasattr(state.fields, "coriolis")
         self.sponge = state.mu is not None
         self.hydrostatic = state.hydrostatic
@@ -58,7 +109,10 @@ class Forcing(object, metaclass=ABCMeta):
         self._build_forcing_solvers()
 
     def mass_term(self):
-        return inner(self.test, self.trial)*dx
+        if self.fused:
+            return sum(inner(test, trial)*dx
+                       for test, trial in zip(self.tests, self.trials))
+        return inner(self.mass_test, self.trial)*dx
 
     def coriolis_term(self):
         u0 = split(self.x0)[0]
@@ -95,30 +149,97 @@ class Forcing(object, metaclass=ABCMeta):
         # scale L
         L = self.scaling * L
         # sponge term has a separate scaling factor as it is always implicit
-        if self.sponge:
-            L -= self.impl*self.state.timestepping.dt*self.sponge_term()
+        if self.sponge and self.scale_sponge:
+            L -= self.scaling*self.sponge_term()
+        elif self.sponge:
+            L -= self.impl*self.state.dt*self.sponge_term()
         # hydrostatic term has no scaling factor
         if self.hydrostatic:
             L += (2*self.impl-1)*self.hydrostatic_term()
         return L
 
+    def _mass_solver(self, a, L, x, options_prefix, bcs=None):
+        """
+        Return a solver for x, where a is a mass matrix. The mass
+        matrix does not change, so it is assembled and its
+        preconditioner set up only once. For discontinuous spaces the
+        mass matrix is block diagonal, so it is instead inverted cell
+        by cell.
+        """
+        V = x.function_space()
+        if bcs is None and is_dg(V):
+            return LocalMassSolver(a, L, x)
+
+        problem = LinearVariationalProblem(a, L, x, bcs=bcs,
+                                           constant_jacobian=True)
+
+        if self.direct_mass_solve:
+            solver_parameters = {'ksp_type': 'preonly',
+                                 'pc_type': 'lu',
+                                 'pc_factor_mat_solver_type': 'mumps'}
+        elif len(V) > 1:
+            # the mass matrix of the mixed space is block diagonal
+            solver_parameters = {'ksp_type': 'cg',
+                                 'pc_type': 'fieldsplit',
+                                 'pc_fieldsplit_type': 'additive',
+                                 'fieldsplit_ksp_type': 'preonly',
+                                 'fieldsplit_pc_type': 'bjacobi',
+                                 'fieldsplit_sub_pc_type': 'ilu'}
+        else:
+            solver_parameters = {'ksp_type': 'cg',
+                                 'pc_type': 'bjacobi',
+                                 'sub_pc_type': 'ilu'}
+        if logger.isEnabledFor(DEBUG):
+            solver_parameters["ksp_monitor_true_residual"] = True
+        return LinearVariationalSolver(
+            problem,
+            solver_parameters=solver_parameters,
+            options_prefix=options_prefix
+        )
+
+    def component_forcing_terms(self):
+        """
+        Return a list of (index, term) pairs giving the forcing of the
+        other components of the state, which is added to that component
+        of x_out in :meth:`apply`. term is a function taking the test
+        function and returning the form.
+        """
+        return []
+
+    def directional_forcings(self, scale_sponge=False):
+        """
+        Return the horizontal and vertical parts of this forcing, as a
+        pair of forcings of the same class and options.
+
+        :arg scale_sponge: whether the sponge term of the parts is
+        scaled by the same coefficient as the other terms.
+        """
+        return tuple(type(self)(self.state, euler_poincare=self.euler_poincare,
+                                extra_terms=self.extra_terms, moisture=self.moisture,
+                                fused=self.fused, direct_mass_solve=self.direct_mass_solve,
+                                direction=direction, scale_sponge=scale_sponge)
+                     for direction in ["horizontal", "vertical"])
+
     def _build_forcing_solvers(self):
         a = self.mass_term()
         L = self.forcing_term()
         bcs = None if len(self.state.bcs) == 0 else self.state.bcs
 
-        u_forcing_problem = LinearVariationalProblem(
-            a, L, self.uF, bcs=bcs
-        )
-
-        solver_parameters = {}
-        if logger.isEnabledFor(DEBUG):
-            solver_parameters["ksp_monitor_true_residual"] = True
-        self.u_forcing_solver = LinearVariationalSolver(
-            u_forcing_problem,
-            solver_parameters=solver_parameters,
-            options_prefix="UForcingSolver"
-        )
+        if self.fused:
+            self.forced_components = [0]
+            if self.component_forcing:
+                for i, term in self.component_forcing_terms():
+                    L += term(self.tests[i])
+                    self.forced_components.append(i)
+            if bcs is not None:
+                W = self.state.W
+                bcs = [DirichletBC(W.sub(0), bc.function_arg, bc.sub_domain)
+                       for bc in bcs]
+            self.forcing_solver = self._mass_solver(a, L, self.xF,
+                                                    "ForcingSolver", bcs=bcs)
+        else:
+            self.u_forcing_solver = self._mass_solver(a, L, self.uF,
+                                                      "UForcingSolver", bcs=bcs)
 
     def apply(self, scaling, x_in, x_nl, x_out, **kwargs):
         """
@@ -136,6 +257,16 @@ class Forcing(object, metaclass=ABCMeta):
         implicit = kwargs.get("implicit")
         if implicit is not None:
             self.impl.assign(int(implicit))
+
+        if self.fused:
+            self.forcing_solver.solve()  # places forcing in self.xF
+            x_out.assign(x_in)
+            x_out_split = x_out.split()
+            xF_split = self.xF.split()
+            for i in self.forced_components:
+                x_out_split[i] += xF_split[i]
+            return
+
         self.u_forcing_solver.solve()  # places forcing in self.uF
 
         uF = x_out.split()[0]
@@ -203,12 +334,17 @@ class CompressibleForcing(Forcing):
 
         return self.scaling * L
 
+    def component_forcing_terms(self):
+        terms = super(CompressibleForcing, self).component_forcing_terms()
+        if self.moisture is not None:
+            terms.append((2, lambda q: q * self.theta_forcing() * dx))
+        return terms
+
     def _build_forcing_solvers(self):
 
         super(CompressibleForcing, self)._build_forcing_solvers()
         # build forcing for theta equation
-        if self.moisture is not None:
-            _, _, theta0 = split(self.x0)
+        if self.moisture is not None and self.component_forcing and not self.fused:
             Vt = self.state.spaces("HDiv_v")
             p = TrialFunction(Vt)
             q = TestFunction(Vt)
@@ -218,21 +354,13 @@ class CompressibleForcing(Forcing):
             L = self.theta_forcing()
             L = q * L * dx
 
-            theta_problem = LinearVariationalProblem(a, L, self.thetaF)
-
-            solver_parameters = {}
-            if logger.isEnabledFor(DEBUG):
-                solver_parameters["ksp_monitor_true_residual"] = True
-            self.theta_solver = LinearVariationalSolver(
-                theta_problem,
-                solver_parameters=solver_parameters,
-                option_prefix="ThetaForcingSolver"
-            )
+            self.theta_solver = self._mass_solver(a, L, self.thetaF,
+                                                  "ThetaForcingSolver")
 
     def apply(self, scaling, x_in, x_nl, x_out, **kwargs):
 
         super(CompressibleForcing, self).apply(scaling, x_in, x_nl, x_out, **kwargs)
-        if self.moisture is not None:
+        if self.moisture is not None and self.component_forcing and not self.fused:
             self.theta_solver.solve()
             _, _, theta_out = x_out.split()
             theta_out += self.thetaF
@@ -265,18 +393,8 @@ class IncompressibleForcing(Forcing):
         a = p*q*dx
         L = q*div(u0)*dx
 
-        divergence_problem = LinearVariationalProblem(
-            a, L, self.divu)
-
-        solver_parameters = {}
-
-        if logger.isEnabledFor(DEBUG):
-            solver_parameters["ksp_monitor_true_residual"] = True
-        self.divergence_solver = LinearVariationalSolver(
-            divergence_problem,
-            solver_parameters=solver_parameters,
-            options_prefix="DivergenceSolver"
-        )
+        self.divergence_solver = self._mass_solver(a, L, self.divu,
+                                                   "DivergenceSolver")
 
     def apply(self, scaling, x_in, x_nl, x_out, **kwargs):
 
@@ -304,40 +422,42 @@ class EadyForcing(IncompressibleForcing):
         L -= self.scaling*dbdy*eady_exp*inner(self.test, as_vector([0., 1., 0.]))*dx
         return L
 
+    def b_forcing_term(self, gamma):
+        dbdy = self.state.parameters.dbdy
+        u0, _, _ = split(self.x0)
+        return -self.scaling*gamma*(dbdy*inner(u0, as_vector([0., 1., 0.])))*dx
+
+    def component_forcing_terms(self):
+        terms = super(EadyForcing, self).component_forcing_terms()
+        terms.append((2, self.b_forcing_term))
+        return terms
+
     def _build_forcing_solvers(self):
 
         super(EadyForcing, self)._build_forcing_solvers()
 
+        if self.fused or not self.component_forcing:
+            return
+
         # b_forcing
-        dbdy = self.state.parameters.dbdy
         Vb = self.state.spaces("HDiv_v")
         F = TrialFunction(Vb)
         gamma = TestFunction(Vb)
         self.bF = Function(Vb)
-        u0, _, b0 = split(self.x0)
 
         a = gamma*F*dx
-        L = -self.scaling*gamma*(dbdy*inner(u0, as_vector([0., 1., 0.])))*dx
-
-        b_forcing_problem = LinearVariationalProblem(
-            a, L, self.bF
-        )
+        L = self.b_forcing_term(gamma)
 
-        solver_parameters = {}
-        if logger.isEnabledFor(DEBUG):
-            solver_parameters["ksp_monitor_true_residual"] = True
-        self.b_forcing_solver = LinearVariationalSolver(
-            b_forcing_problem,
-            solver_parameters=solver_parameters,
-            options_prefix="BForcingSolver"
-        )
+        self.b_forcing_solver = self._mass_solver(a, L, self.bF,
+                                                  "BForcingSolver")
 
     def apply(self, scaling, x_in, x_nl, x_out, **kwargs):
 
         super(EadyForcing, self).apply(scaling, x_in, x_nl, x_out, **kwargs)
-        self.b_forcing_solver.solve()  # places forcing in self.bF
-        _, _, b_out = x_out.split()
-        b_out += self.bF
+        if self.component_forcing and not self.fused:
+            self.b_forcing_solver.solve()  # places forcing in self.bF
+            _, _, b_out = x_out.split()
+            b_out += self.bF
 
 
 class CompressibleEadyForcing(CompressibleForcing):
@@ -360,39 +480,43 @@ class CompressibleEadyForcing(CompressibleForcing):
         L += self.scaling*cp*dthetady*(Pi-Pi_0)*inner(self.test, as_vector([0., 1., 0.]))*dx  # Eady forcing
         return L
 
+    def theta_forcing_term(self, gamma):
+        dthetady = self.state.parameters.dthetady
+        u0, _, _ = split(self.x0)
+        return -self.scaling*gamma*(dthetady*inner(u0, as_vector([0., 1., 0.])))*dx
+
+    def component_forcing_terms(self):
+        # as in apply, the moist theta forcing is not included
+        terms = Forcing.component_forcing_terms(self)
+        terms.append((2, self.theta_forcing_term))
+        return terms
+
     def _build_forcing_solvers(self):
 
         super(CompressibleEadyForcing, self)._build_forcing_solvers()
+
+        if self.fused or not self.component_forcing:
+            return
+
         # theta_forcing
-        dthetady = self.state.parameters.dthetady
         Vt = self.state.spaces("HDiv_v")
         F = TrialFunction(Vt)
         gamma = TestFunction(Vt)
         self.thetaF = Function(Vt)
-        u0, _, _ = split(self.x0)
 
         a = gamma*F*dx
-        L = -self.scaling*gamma*(dthetady*inner(u0, as_vector([0., 1., 0.])))*dx
+        L = self.theta_forcing_term(gamma)
 
-        theta_forcing_problem = LinearVariationalProblem(
-            a, L, self.thetaF
-        )
-
-        solver_parameters = {}
-        if logger.isEnabledFor(DEBUG):
-            solver_parameters["ksp_monitor_true_residual"] = True
-        self.theta_forcing_solver = LinearVariationalSolver(
-            theta_forcing_problem,
-            solver_parameters=solver_parameters,
-            options_prefix="ThetaForcingSolver"
-        )
+        self.theta_forcing_solver = self._mass_solver(a, L, self.thetaF,
+                                                      "ThetaForcingSolver")
 
     def apply(self, scaling, x_in, x_nl, x_out, **kwargs):
 
         Forcing.apply(self, scaling, x_in, x_nl, x_out, **kwargs)
-        self.theta_forcing_solver.solve()  # places forcing in self.thetaF
-        _, _, theta_out = x_out.split()
-        theta_out += self.thetaF
+        if self.component_forcing and not self.fused:
+            self.theta_forcing_solver.solve()  # places forcing in self.thetaF
+            _, _, theta_out = x_out.split()
+            theta_out += self.thetaF
 
 
 class ShallowWaterForcing(Forcing):
@@ -9,13 +9,16 @@ from firedrake import MixedFunctionSpace, TrialFunctions, TestFunctions, \
     Function, Constant, assemble, \
     LinearVariationalProblem, LinearVariationalSolver, \
     NonlinearVariationalProblem, NonlinearVariationalSolver, split, solve, \
-    sin, cos, sqrt, asin, atan_2, as_vector, Min, Max, FunctionSpace, BrokenElement, errornorm
+    sin, cos, sqrt, asin, atan_2, as_vector, Min, Max, FunctionSpace, BrokenElement, errornorm, \
+    VectorFunctionSpace, Interpolator, variable, diff
+from mpi4py import MPI
+import numpy as np
 from gusto import thermodynamics
 from gusto.configuration import logger
 from gusto.recovery import Recoverer, Boundary_Method
 
 
-__all__ = ["latlon_coords", "sphere_to_cartesian", "incompressible_hydrostatic_balance", "compressible_hydrostatic_balance", "remove_initial_w", "eady_initial_v", "compressible_eady_initial_v", "calculate_Pi0", "saturated_hydrostatic_balance", "unsaturated_hydrostatic_balance"]
+__all__ = ["latlon_coords", "sphere_to_cartesian", "incompressible_hydrostatic_balance", "HydrostaticBalanceSolver", "compressible_hydrostatic_balance", "remove_initial_w", "eady_initial_v", "compressible_eady_initial_v", "calculate_Pi0", "saturated_hydrostatic_balance", "unsaturated_hydrostatic_balance"]
 
 
 def latlon_coords(mesh):
@@ -94,108 +97,193 @@ def incompressible_hydrostatic_balance(state, b0, p0, top=False, params=None):
     p0.project(pprime)
 
 
-def compressible_hydrostatic_balance(state, theta0, rho0, pi0=None,
-                                     top=False, pi_boundary=Constant(1.0),
-                                     water_t=None,
-                                     solve_for_rho=False,
-                                     params=None):
+class HydrostaticBalanceSolver(object):
     """
-    Compute a hydrostatically balanced density given a potential temperature
-    profile. By default, this uses a vertically-oriented hybridization
-    procedure for solving the resulting discrete systems.
+    Computes a hydrostatically balanced Exner pressure, and optionally
+    density, given a potential temperature profile. By default, this uses
+    a vertically-oriented hybridization procedure for solving the
+    resulting discrete systems.
+
+    The forms and solvers are built once, with the potential temperature,
+    total water and boundary value of pi as coefficients, so that repeated
+    balance solves do not recompile them.
 
     :arg state: The :class:`State` object.
-    :arg theta0: :class:`.Function`containing the potential temperature.
-    :arg rho0: :class:`.Function` to write the initial density into.
     :arg top: If True, set a boundary condition at the top. Otherwise, set
     it at the bottom.
     :arg pi_boundary: a field or expression to use as boundary data for pi on
-    the top or bottom as specified.
-    :arg water_t: the initial total water mixing ratio field.
+    the top or bottom as specified. If this is a number or a
+    :class:`.Constant` then it can be changed in :meth:`solve`.
+    :arg params: the solver parameters for the pi and rho solvers.
     """
 
-    # Calculate hydrostatic Pi
-    VDG = state.spaces("DG")
-    Vv = state.spaces("Vv")
-    W = MixedFunctionSpace((Vv, VDG))
-    v, pi = TrialFunctions(W)
-    dv, dpi = TestFunctions(W)
-
-    n = FacetNormal(state.mesh)
-
-    cp = state.parameters.cp
+    def __init__(self, state, top=False, pi_boundary=Constant(1.0), params=None):
 
-    # add effect of density of water upon theta
-    theta = theta0
+        self.state = state
+        VDG = state.spaces("DG")
+        Vv = state.spaces("Vv")
+        Vt = state.spaces("HDiv_v")
+        W = MixedFunctionSpace((Vv, VDG))
+        self.W = W
+        v, pi = TrialFunctions(W)
+        dv, dpi = TestFunctions(W)
 
-    if water_t is not None:
-        theta = theta0 / (1 + water_t)
+        n = FacetNormal(state.mesh)
 
-    alhs = (
-        (cp*inner(v, dv) - cp*div(dv*theta)*pi)*dx
-        + dpi*div(theta*v)*dx
-    )
+        cp = state.parameters.cp
 
-    if top:
-        bmeasure = ds_t
-        bstring = "bottom"
-    else:
-        bmeasure = ds_b
-        bstring = "top"
+        self.theta0 = Function(Vt)
+        self.water_t = Function(Vt)
+        if isinstance(pi_boundary, (Constant, int, float)):
+            self.pi_boundary = Constant(0.0)
+            self.pi_boundary.assign(pi_boundary)
+        else:
+            self.pi_boundary = pi_boundary
 
-    arhs = -cp*inner(dv, n)*theta*pi_boundary*bmeasure
+        # add effect of density of water upon theta
+        theta = self.theta0 / (1 + self.water_t)
 
-    # Possibly make g vary with spatial coordinates?
-    g = state.parameters.g
+        alhs = (
+            (cp*inner(v, dv) - cp*div(dv*theta)*pi)*dx
+            + dpi*div(theta*v)*dx
+        )
 
-    arhs -= g*inner(dv, state.k)*dx
+        if top:
+            bmeasure = ds_t
+            bstring = "bottom"
+        else:
+            bmeasure = ds_b
+            bstring = "top"
+
+        arhs = -cp*inner(dv, n)*theta*self.pi_boundary*bmeasure
+
+        # Possibly make g vary with spatial coordinates?
+        g = state.parameters.g
+
+        arhs -= g*inner(dv, state.k)*dx
+
+        self.bcs = [DirichletBC(W.sub(0), Constant(0.0), bstring)]
+
+        self.w = Function(W)
+        PiProblem = LinearVariationalProblem(alhs, arhs, self.w, bcs=self.bcs)
+
+        if params is None:
+            params = {'ksp_type': 'preonly',
+                      'pc_type': 'python',
+                      'mat_type': 'matfree',
+                      'pc_python_type': 'gusto.VerticalHybridizationPC',
+                      # Vertical trace system is only coupled vertically in columns
+                      # block ILU is a direct solver!
+                      'vert_hybridization': {'ksp_type': 'preonly',
+                                             'pc_type': 'bjacobi',
+                                             'sub_pc_type': 'ilu'}}
+        self.params = params
+
+        self.PiSolver = LinearVariationalSolver(PiProblem,
+                                                solver_parameters=params,
+                                                options_prefix="pisolver")
+
+        self._bmeasure = bmeasure
+        self._theta = theta
+        self._rho_solver = None
+
+    @property
+    def rho_solver(self):
+        """
+        The solver for the balanced density, which is only built if it
+        is used.
+        """
+        if self._rho_solver is None:
+            state = self.state
+            cp = state.parameters.cp
+            g = state.parameters.g
+            n = FacetNormal(state.mesh)
+            theta = self._theta
+
+            self.w1 = Function(self.W)
+            v, rho = split(self.w1)
+            dv, dpi = TestFunctions(self.W)
+            pi = thermodynamics.pi(state.parameters, rho, self.theta0)
+            F = (
+                (cp*inner(v, dv) - cp*div(dv*theta)*pi)*dx
+                + dpi*div(self.theta0*v)*dx
+                + cp*inner(dv, n)*theta*self.pi_boundary*self._bmeasure
+            )
+            F += g*inner(dv, state.k)*dx
+            rhoproblem = NonlinearVariationalProblem(F, self.w1, bcs=self.bcs)
+            self._rho_solver = NonlinearVariationalSolver(rhoproblem, solver_parameters=self.params,
+                                                          options_prefix="rhosolver")
+        return self._rho_solver
+
+    def solve(self, theta0, rho0, pi0=None, water_t=None, pi_boundary=None,
+              solve_for_rho=False):
+        """
+        Compute the balanced density.
+
+        :arg theta0: :class:`.Function` containing the potential temperature.
+        :arg rho0: :class:`.Function` to write the initial density into.
+        :arg pi0: Optional :class:`.Function` to write the Exner pressure into.
+        :arg water_t: the initial total water mixing ratio field.
+        :arg pi_boundary: Optional new value of pi on the boundary.
+        :arg solve_for_rho: If True, solve the nonlinear problem for the
+        density, rather than computing it from the Exner pressure.
+        """
+
+        for f, value in [(self.theta0, theta0), (self.water_t, water_t)]:
+            if value is None:
+                f.assign(0.0)
+            elif isinstance(value, Function) and value.function_space() == f.function_space():
+                f.assign(value)
+            else:
+                f.interpolate(value)
+        if pi_boundary is not None:
+            if pi_boundary is not self.pi_boundary:
+                if not isinstance(self.pi_boundary, Constant):
+                    raise ValueError("Can only change the value of pi on the boundary if it is a Constant")
+                self.pi_boundary.assign(pi_boundary)
+
+        self.PiSolver.solve()
+        v, Pi = self.w.split()
+        if pi0 is not None:
+            pi0.assign(Pi)
+
+        if solve_for_rho:
+            rho_solver = self.rho_solver
+            v, rho = self.w1.split()
+            v.assign(0.0)
+            rho.interpolate(thermodynamics.rho(self.state.parameters, self.theta0, Pi))
+            rho_solver.solve()
+            v, rho_ = self.w1.split()
+            rho0.assign(rho_)
+        else:
+            rho0.interpolate(thermodynamics.rho(self.state.parameters, self.theta0, Pi))
 
-    bcs = [DirichletBC(W.sub(0), Constant(0.0), bstring)]
 
-    w = Function(W)
-    PiProblem = LinearVariationalProblem(alhs, arhs, w, bcs=bcs)
+def compressible_hydrostatic_balance(state, theta0, rho0, pi0=None,
+                                     top=False, pi_boundary=Constant(1.0),
+                                     water_t=None,
+                                     solve_for_rho=False,
+                                     params=None):
+    """
+    Compute a hydrostatically balanced density given a potential temperature
+    profile. By default, this uses a vertically-oriented hybridization
+    procedure for solving the resulting discrete systems. For repeated
+    balance solves, use a :class:`HydrostaticBalanceSolver`.
 
-    if params is None:
-        params = {'ksp_type': 'preonly',
-                  'pc_type': 'python',
-                  'mat_type': 'matfree',
-                  'pc_python_type': 'gusto.VerticalHybridizationPC',
-                  # Vertical trace system is only coupled vertically in columns
-                  # block ILU is a direct solver!
-                  'vert_hybridization': {'ksp_type': 'preonly',
-                                         'pc_type': 'bjacobi',
-                                         'sub_pc_type': 'ilu'}}
-
-    PiSolver = LinearVariationalSolver(PiProblem,
-                                       solver_parameters=params,
-                                       options_prefix="pisolver")
-
-    PiSolver.solve()
-    v, Pi = w.split()
-    if pi0 is not None:
-        pi0.assign(Pi)
+    :arg state: The :class:`State` object.
+    :arg theta0: :class:`.Function`containing the potential temperature.
+    :arg rho0: :class:`.Function` to write the initial density into.
+    :arg top: If True, set a boundary condition at the top. Otherwise, set
+    it at the bottom.
+    :arg pi_boundary: a field or expression to use as boundary data for pi on
+    the top or bottom as specified.
+    :arg water_t: the initial total water mixing ratio field.
+    """
 
-    if solve_for_rho:
-        w1 = Function(W)
-        v, rho = w1.split()
-        rho.interpolate(thermodynamics.rho(state.parameters, theta0, Pi))
-        v, rho = split(w1)
-        dv, dpi = TestFunctions(W)
-        pi = thermodynamics.pi(state.parameters, rho, theta0)
-        F = (
-            (cp*inner(v, dv) - cp*div(dv*theta)*pi)*dx
-            + dpi*div(theta0*v)*dx
-            + cp*inner(dv, n)*theta*pi_boundary*bmeasure
-        )
-        F += g*inner(dv, state.k)*dx
-        rhoproblem = NonlinearVariationalProblem(F, w1, bcs=bcs)
-        rhosolver = NonlinearVariationalSolver(rhoproblem, solver_parameters=params,
-                                               options_prefix="rhosolver")
-        rhosolver.solve()
-        v, rho_ = w1.split()
-        rho0.assign(rho_)
-    else:
-        rho0.interpolate(thermodynamics.rho(state.parameters, theta0, Pi))
+    solver = HydrostaticBalanceSolver(state, top=top, pi_boundary=pi_boundary,
+                                      params=params)
+    solver.solve(theta0, rho0, pi0=pi0, water_t=water_t,
+                 solve_for_rho=solve_for_rho)
 
 
 def remove_initial_w(u, Vv):
@@ -275,11 +363,66 @@ def calculate_Pi0(state, theta0, rho0):
     return Pi0
 
 
+class PointwiseNewtonSolver(object):
+    """
+    Solves a system of nonlinear equations that holds independently at
+    each DOF, using Newton's method vectorised over all of the DOFs. The
+    Jacobian is found symbolically, and each Newton update is found for
+    all of the unknowns with a single interpolation.
+
+    :arg residual: a function taking UFL expressions for the unknowns and
+                   returning a list of UFL expressions for the residuals.
+    :arg fields: a list of one or two :class:`.Function` objects in the same
+                 space, holding the unknowns. These should contain the initial
+                 guess, and are updated in place.
+    :arg max_count: the maximum number of Newton iterations.
+    :arg rtol: the tolerance on the largest relative update.
+    """
+
+    def __init__(self, residual, fields, max_count=10, rtol=1.e-12):
+
+        self.fields = fields
+        self.max_count = max_count
+        self.rtol = rtol
+
+        unknowns = [variable(f) for f in fields]
+        R = residual(*unknowns)
+        J = [[diff(R_i, u) for u in unknowns] for R_i in R]
+        if len(fields) == 1:
+            update = [R[0] / J[0][0]]
+        elif len(fields) == 2:
+            det = J[0][0] * J[1][1] - J[0][1] * J[1][0]
+            update = [(J[1][1] * R[0] - J[0][1] * R[1]) / det,
+                      (J[0][0] * R[1] - J[1][0] * R[0]) / det]
+        else:
+            raise NotImplementedError("Pointwise Newton solves are only implemented for one or two unknowns")
+
+        V = fields[0].function_space()
+        self.update = Function(VectorFunctionSpace(V.mesh(), V.ufl_element(), dim=len(fields)))
+        self.update_interpolator = Interpolator(as_vector(update), self.update)
+
+    def solve(self):
+        comm = self.update.function_space().mesh().comm
+        for count in range(self.max_count):
+            self.update_interpolator.interpolate()
+            change = 0.0
+            for i, f in enumerate(self.fields):
+                du = self.update.dat.data_ro[:, i]
+                f.dat.data[:] -= du
+                if len(du) > 0:
+                    scale = np.maximum(np.abs(f.dat.data_ro), np.finfo(float).tiny)
+                    change = max(change, np.max(np.abs(du) / scale))
+            if comm.allreduce(change, op=MPI.MAX) < self.rtol:
+                break
+        else:
+            logger.warning("Pointwise Newton solve has not converged within %i iterations" % self.max_count)
+
+
 def saturated_hydrostatic_balance(state, theta_e, water_t, pi0=None,
                                   top=False, pi_boundary=Constant(1.0),
                                   max_outer_solve_count=40,
-                                  max_theta_solve_count=5,
-                                  max_inner_solve_count=3):
+                                  max_theta_solve_count=None,
+                                  max_inner_solve_count=10):
     """
     Given a wet equivalent potential temperature, theta_e, and the total moisture
     content, water_t, compute a hydrostatically balance virtual potential temperature,
@@ -289,7 +432,17 @@ def saturated_hydrostatic_balance(state, theta_e, water_t, pi0=None,
     1) finding rho to balance the theta profile
     2) finding theta_v and r_v to get back theta_e and saturation
     We iteratively solve these steps until we (hopefully)
-    converge to a solution.
+    converge to a solution. The second step holds pointwise, and is
+    solved with Newton's method at all of the DOFs at once.
+
+    Only the second step is inside the Newton iteration. The first step
+    is a separate solve of the hydrostatic balance with a
+    :class:`HydrostaticBalanceSolver`, which is independent in each
+    column through its vertical hybridization, and the two steps are
+    still coupled by the damped outer iteration of up to
+    max_outer_solve_count solves. Solving both steps in one column-wise
+    Newton iteration is not implemented, as the second step uses the
+    density recovered into the potential temperature space.
 
     :arg state: The :class:`State` object.
     :arg theta_e: The initial wet equivalent potential temperature profile.
@@ -299,11 +452,20 @@ def saturated_hydrostatic_balance(state, theta_e, water_t, pi0=None,
               it will be at the bottom.
     :arg pi_boundary: The value of pi on the specified boundary.
     :arg max_outer_solve_count: Max number of outer iterations for balance solver.
-    :arg max_theta_solve_count: Max number of iterations for theta solver (middle part of solve).
-    :arg max_inner_solve_count: Max number of iterations on the inner most
-                                loop for the water vapour solver.
+    :arg max_theta_solve_count: Deprecated and ignored. This was the number
+                                of fixed point iterations for theta, which
+                                is now found together with the water vapour.
+    :arg max_inner_solve_count: Max number of Newton iterations for the
+                                theta and water vapour solver. This was
+                                previously the number of fixed point
+                                iterations for water vapour, defaulting to 3.
     """
 
+    if max_theta_solve_count is not None:
+        logger.warning("max_theta_solve_count is deprecated and ignored: theta and the "
+                       "water vapour are now found together by a Newton solve of at "
+                       "most max_inner_solve_count=%i iterations" % max_inner_solve_count)
+
     theta0 = state.fields('theta')
     rho0 = state.fields('rho')
     water_v0 = state.fields('water_v')
@@ -327,23 +489,25 @@ def saturated_hydrostatic_balance(state, theta_e, water_t, pi0=None,
     Vt_broken = FunctionSpace(state.mesh, BrokenElement(Vt.ufl_element()))
     rho_averaged = Function(Vt)
     rho_recoverer = Recoverer(rho0, rho_averaged, VDG=Vt_broken, boundary_method=boundary_method)
-    w_h = Function(Vt)
-    theta_h = Function(Vt)
     theta_e_test = Function(Vt)
     delta = 0.8
 
     # expressions for finding theta0 and water_v0 from theta_e and water_t
-    pie = thermodynamics.pi(state.parameters, rho_averaged, theta0)
-    p = thermodynamics.p(state.parameters, pie)
-    T = thermodynamics.T(state.parameters, theta0, pie, water_v0)
-    r_v_expr = thermodynamics.r_sat(state.parameters, T, p)
-    theta_e_expr = thermodynamics.theta_e(state.parameters, T, p, water_v0, water_t)
+    def residual(theta, water_v):
+        pie = thermodynamics.pi(state.parameters, rho_averaged, theta)
+        p = thermodynamics.p(state.parameters, pie)
+        T = thermodynamics.T(state.parameters, theta, pie, water_v)
+        return [thermodynamics.theta_e(state.parameters, T, p, water_v, water_t) - theta_e,
+                water_v - thermodynamics.r_sat(state.parameters, T, p)]
+
+    theta_e_expr = residual(theta0, water_v0)[0] + theta_e
+    newton_solver = PointwiseNewtonSolver(residual, [theta0, water_v0],
+                                          max_count=max_inner_solve_count)
+    balance_solver = HydrostaticBalanceSolver(state, top=top, pi_boundary=pi_boundary)
 
     for i in range(max_outer_solve_count):
         # solve for rho with theta_vd and w_v guesses
-        compressible_hydrostatic_balance(state, theta0, rho_h, top=top,
-                                         pi_boundary=pi_boundary, water_t=water_t,
-                                         solve_for_rho=True)
+        balance_solver.solve(theta0, rho_h, water_t=water_t, solve_for_rho=True)
 
         # damp solution
         rho0.assign(rho0 * (1 - delta) + delta * rho_h)
@@ -355,22 +519,8 @@ def saturated_hydrostatic_balance(state, theta_e, water_t, pi0=None,
         # calculate averaged rho
         rho_recoverer.project()
 
-        # now solve for r_v
-        for j in range(max_theta_solve_count):
-            theta_h.interpolate(theta_e / theta_e_expr * theta0)
-            theta0.assign(theta0 * (1 - delta) + delta * theta_h)
-
-            # break when close enough
-            if errornorm(theta_e_test, theta_e) < 1e-6:
-                break
-            for k in range(max_inner_solve_count):
-                w_h.interpolate(r_v_expr)
-                water_v0.assign(water_v0 * (1 - delta) + delta * w_h)
-
-                # break when close enough
-                theta_e_test.assign(theta_e_expr)
-                if errornorm(theta_e_test, theta_e) < 1e-6:
-                    break
+        # now solve for theta and r_v
+        newton_solver.solve()
 
         if i == max_outer_solve_count:
             raise RuntimeError('Hydrostatic balance solve has not converged within %i' % i, 'iterations')
@@ -380,15 +530,13 @@ def saturated_hydrostatic_balance(state, theta_e, water_t, pi0=None,
         pi0.interpolate(pie)
 
     # do one extra solve for rho
-    compressible_hydrostatic_balance(state, theta0, rho0, top=top,
-                                     pi_boundary=pi_boundary,
-                                     water_t=water_t, solve_for_rho=True)
+    balance_solver.solve(theta0, rho0, water_t=water_t, solve_for_rho=True)
 
 
 def unsaturated_hydrostatic_balance(state, theta_d, H, pi0=None,
                                     top=False, pi_boundary=Constant(1.0),
                                     max_outer_solve_count=40,
-                                    max_inner_solve_count=20):
+                                    max_inner_solve_count=10):
     """
     Given vertical profiles for dry potential temperature
     and relative humidity compute hydrostatically balanced
@@ -398,7 +546,12 @@ def unsaturated_hydrostatic_balance(state, theta_d, H, pi0=None,
     1) finding rho to balance the theta profile
     2) finding theta_v and r_v to get back theta_d and H
     We iteratively solve these steps until we (hopefully)
-    converge to a solution.
+    converge to a solution. The second step holds pointwise, and is
+    solved with Newton's method at all of the DOFs at once. As in
+    :func:`saturated_hydrostatic_balance`, the first step is a separate
+    column-wise solve with a :class:`HydrostaticBalanceSolver`, coupled
+    to the second by the outer iteration, and is not part of the Newton
+    iteration.
 
     :arg state: The :class:`State` object.
     :arg theta_d: The initial dry potential temperature profile.
@@ -408,7 +561,10 @@ def unsaturated_hydrostatic_balance(state, theta_d, H, pi0=None,
               it will be at the bottom.
     :arg pi_boundary: The value of pi on the specified boundary.
     :arg max_outer_solve_count: Max number of iterations for outer loop of balance solver.
-    :arg max_inner_solve_count: Max number of iterations for inner loop of balanace solver.
+    :arg max_inner_solve_count: Max number of Newton iterations for the
+                                water vapour solver. This was previously the
+                                number of fixed point iterations, defaulting
+                                to 20.
     """
 
     theta0 = state.fields('theta')
@@ -438,14 +594,19 @@ def unsaturated_hydrostatic_balance(state, theta_d, H, pi0=None,
     rho_averaged = Function(Vt)
     Vt_broken = FunctionSpace(state.mesh, BrokenElement(Vt.ufl_element()))
     rho_recoverer = Recoverer(rho0, rho_averaged, VDG=Vt_broken, boundary_method=method)
-    w_h = Function(Vt)
     delta = 1.0
 
     # make expressions for determining water_v0
-    pie = thermodynamics.pi(state.parameters, rho_averaged, theta0)
-    p = thermodynamics.p(state.parameters, pie)
-    T = thermodynamics.T(state.parameters, theta0, pie, water_v0)
-    r_v_expr = thermodynamics.r_v(state.parameters, H, T, p)
+    def residual(water_v):
+        theta = theta_d * (1 + water_v / epsilon)
+        pie = thermodynamics.pi(state.parameters, rho_averaged, theta)
+        p = thermodynamics.p(state.parameters, pie)
+        T = thermodynamics.T(state.parameters, theta, pie, water_v)
+        return [water_v - thermodynamics.r_v(state.parameters, H, T, p)]
+
+    newton_solver = PointwiseNewtonSolver(residual, [water_v0],
+                                          max_count=max_inner_solve_count)
+    balance_solver = HydrostaticBalanceSolver(state, top=top, pi_boundary=pi_boundary)
 
     # make expressions to evaluate residual
     pi_ev = thermodynamics.pi(state.parameters, rho_averaged, theta0)
@@ -456,9 +617,7 @@ def unsaturated_hydrostatic_balance(state, theta_d, H, pi0=None,
 
     for i in range(max_outer_solve_count):
         # solve for rho with theta_vd and w_v guesses
-        compressible_hydrostatic_balance(state, theta0, rho_h, top=top,
-                                         pi_boundary=pi_boundary, water_t=water_v0,
-                                         solve_for_rho=True)
+        balance_solver.solve(theta0, rho_h, water_t=water_v0, solve_for_rho=True)
 
         # damp solution
         rho0.assign(rho0 * (1 - delta) + delta * rho_h)
@@ -471,17 +630,10 @@ def unsaturated_hydrostatic_balance(state, theta_d, H, pi0=None,
             break
 
         # now solve for r_v
-        for j in range(max_inner_solve_count):
-            w_h.interpolate(r_v_expr)
-            water_v0.assign(water_v0 * (1 - delta) + delta * w_h)
-
-            # compute theta_vd
-            theta0.assign(theta_d * (1 + water_v0 / epsilon))
+        newton_solver.solve()
 
-            # test quality of solution by re-evaluating expression
-            RH.assign(RH_ev)
-            if errornorm(RH, H) < 1e-10:
-                break
+        # compute theta_vd
+        theta0.assign(theta_d * (1 + water_v0 / epsilon))
 
         if i == max_outer_solve_count:
             raise RuntimeError('Hydrostatic balance solve has not converged within %i' % i, 'iterations')
@@ -491,6 +643,4 @@ def unsaturated_hydrostatic_balance(state, theta_d, H, pi0=None,
         pi0.interpolate(pie)
 
     # do one extra solve for rho
-    compressible_hydrostatic_balance(state, theta0, rho0, top=top,
-                                     pi_boundary=pi_boundary,
-                                     water_t=water_v0, solve_for_rho=True)
+    balance_solver.solve(theta0, rho0, water_t=water_v0, solve_for_rho=True)
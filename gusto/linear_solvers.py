@@ -3,17 +3,20 @@ from firedrake import (split, LinearVariationalProblem, Constant,
                        TestFunction, TrialFunction, lhs, rhs, FacetNormal,
                        div, dx, jump, avg, dS_v, dS_h, ds_v, ds_t, ds_b, ds_tb, inner,
                        dot, grad, Function, VectorSpaceBasis, BrokenElement,
-                       FunctionSpace, MixedFunctionSpace)
+                       FunctionSpace, MixedFunctionSpace, DirichletBC,
+                       EnrichedElement)
 from firedrake.petsc import flatten_parameters
-from firedrake.parloops import par_loop, READ, INC
+from firedrake.parloops import par_loop, READ, INC, RW
 from pyop2.profiling import timed_function, timed_region
 
 from gusto.configuration import logger, DEBUG
 from gusto import thermodynamics
 from abc import ABCMeta, abstractmethod, abstractproperty
+import numpy as np
 
 
-__all__ = ["IncompressibleSolver", "ShallowWaterSolver", "CompressibleSolver"]
+__all__ = ["IncompressibleSolver", "ShallowWaterSolver", "CompressibleSolver",
+           "VerticalCompressibleSolver"]
 
 
 class TimesteppingSolver(object, metaclass=ABCMeta):
@@ -44,6 +47,9 @@ class TimesteppingSolver(object, metaclass=ABCMeta):
         if logger.isEnabledFor(DEBUG):
             self.solver_parameters["ksp_monitor_true_residual"] = None
 
+        # the reference profiles that the operator is built from
+        self._reference_profiles_version = state.reference_profiles_version
+
         # setup the solver
         self._setup_solver()
 
@@ -56,6 +62,31 @@ class TimesteppingSolver(object, metaclass=ABCMeta):
     def solve(self):
         pass
 
+    def update_dt(self):
+        """
+        Mark the operators for reassembly after ``state.dt`` has been
+        changed. The forms themselves refer to ``state.dt`` and so do
+        not need rebuilding.
+        """
+        pass
+
+    def update_reference_profiles(self):
+        """
+        Recompute the parts of the operator that depend on the
+        reference profiles, after they have been changed with
+        :meth:`.State.set_reference_profiles`.
+        """
+        pass
+
+    def _check_reference_profiles(self):
+        """
+        Call :meth:`update_reference_profiles` if the reference
+        profiles have been set since the operator was last built.
+        """
+        if self._reference_profiles_version != self.state.reference_profiles_version:
+            self._reference_profiles_version = self.state.reference_profiles_version
+            self.update_reference_profiles()
+
 
 class CompressibleSolver(TimesteppingSolver):
     """
@@ -98,6 +129,13 @@ class CompressibleSolver(TimesteppingSolver):
          solver_parameters that have been passed in, if False then update.
          the default solver parameters with the solver_parameters passed in.
     :arg moisture (optional): list of names of moisture fields.
+    :arg frozen_operator: boolean, if True the hybridized operator is
+         assembled, and the condensed trace system and its preconditioner
+         set up, at the first solve and then reused for all later solves
+         until dt or the reference profiles change. This is valid as the
+         operator only depends on the reference profiles, dt and alpha.
+         If False the problem is left with Firedrake's default treatment
+         of the Jacobian.
     """
 
     solver_parameters = {'mat_type': 'matfree',
@@ -118,9 +156,11 @@ class CompressibleSolver(TimesteppingSolver):
                                                            'sub_pc_type': 'ilu'}}}
 
     def __init__(self, state, quadrature_degree=None, solver_parameters=None,
-                 overwrite_solver_parameters=False, moisture=None):
+                 overwrite_solver_parameters=False, moisture=None,
+                 frozen_operator=False):
 
         self.moisture = moisture
+        self.frozen_operator = frozen_operator
 
         self.state = state
 
@@ -146,11 +186,7 @@ class CompressibleSolver(TimesteppingSolver):
 
     @timed_function("Gusto:SolverSetup")
     def _setup_solver(self):
-        import numpy as np
-
         state = self.state
-        Dt = state.timestepping.dt
-        beta_ = Dt*state.timestepping.alpha
         cp = state.parameters.cp
         mu = state.mu
         Vu = state.spaces("HDiv")
@@ -158,10 +194,11 @@ class CompressibleSolver(TimesteppingSolver):
         Vtheta = state.spaces("HDiv_v")
         Vrho = state.spaces("DG")
 
-        # Store time-stepping coefficients as UFL Constants
-        dt = Constant(Dt)
-        beta = Constant(beta_)
-        beta_cp = Constant(beta_ * cp)
+        # Time-stepping coefficients are built from the state's dt
+        # Constant, so that the forms pick up any change of timestep
+        dt = state.dt
+        beta = dt*Constant(state.timestepping.alpha)
+        beta_cp = beta*Constant(cp)
 
         h_deg = state.horizontal_degree
         v_deg = state.vertical_degree
@@ -236,18 +273,14 @@ class CompressibleSolver(TimesteppingSolver):
         rho_avg_prb = LinearVariationalProblem(a_tr, L_tr(rhobar), rhobar_avg)
         pi_avg_prb = LinearVariationalProblem(a_tr, L_tr(pibar), pibar_avg)
 
-        rho_avg_solver = LinearVariationalSolver(rho_avg_prb,
-                                                 solver_parameters=cg_ilu_parameters,
-                                                 options_prefix='rhobar_avg_solver')
-        pi_avg_solver = LinearVariationalSolver(pi_avg_prb,
-                                                solver_parameters=cg_ilu_parameters,
-                                                options_prefix='pibar_avg_solver')
+        self.rho_avg_solver = LinearVariationalSolver(rho_avg_prb,
+                                                      solver_parameters=cg_ilu_parameters,
+                                                      options_prefix='rhobar_avg_solver')
+        self.pi_avg_solver = LinearVariationalSolver(pi_avg_prb,
+                                                     solver_parameters=cg_ilu_parameters,
+                                                     options_prefix='pibar_avg_solver')
 
-        with timed_region("Gusto:HybridProjectRhobar"):
-            rho_avg_solver.solve()
-
-        with timed_region("Gusto:HybridProjectPibar"):
-            pi_avg_solver.solve()
+        self._project_averages()
 
         # "broken" u, rho, and trace system
         # NOTE: no ds_v integrals since equations are defined on
@@ -287,7 +320,14 @@ class CompressibleSolver(TimesteppingSolver):
         # Function for the hybridized solutions
         self.urhol0 = Function(M)
 
-        hybridized_prb = LinearVariationalProblem(aeqn, Leqn, self.urhol0)
+        # with a constant Jacobian the operator is only reassembled, and
+        # so the preconditioner only set up again, after it has been
+        # invalidated
+        if self.frozen_operator:
+            hybridized_prb = LinearVariationalProblem(aeqn, Leqn, self.urhol0,
+                                                      constant_jacobian=True)
+        else:
+            hybridized_prb = LinearVariationalProblem(aeqn, Leqn, self.urhol0)
         hybridized_solver = LinearVariationalSolver(hybridized_prb,
                                                     solver_parameters=self.solver_parameters,
                                                     options_prefix='ImplicitSolver')
@@ -339,6 +379,8 @@ class CompressibleSolver(TimesteppingSolver):
         Apply the solver with rhs state.xrhs and result state.dy.
         """
 
+        self._check_reference_profiles()
+
         # Solve the hybridized system
         self.hybridized_solver.solve()
 
@@ -370,6 +412,266 @@ class CompressibleSolver(TimesteppingSolver):
         # Copy into theta cpt of dy
         theta.assign(self.theta)
 
+    def _project_averages(self):
+        with timed_region("Gusto:HybridProjectRhobar"):
+            self.rho_avg_solver.solve()
+
+        with timed_region("Gusto:HybridProjectPibar"):
+            self.pi_avg_solver.solve()
+
+    def update_dt(self):
+        self.hybridized_solver.invalidate_jacobian()
+
+    def update_reference_profiles(self):
+        self._project_averages()
+        self.hybridized_solver.invalidate_jacobian()
+
+
+class VerticalCompressibleSolver(TimesteppingSolver):
+    """
+    Timestepping linear solver object for the compressible equations
+    in theta-pi formulation with prognostic variables u, rho, and theta,
+    in which only the vertical acoustic and gravity terms are treated
+    implicitly. It is used by the :class:`.HEVI` timestepper, for the
+    implicit stages of which the horizontal part of the residual is zero.
+
+    The increments of the horizontal velocity degrees of freedom are
+    taken directly from the residual, so that the remaining unknowns are
+    only coupled within each column. This solver follows the following
+    strategy:
+
+    (1) Analytically eliminate theta, and replace the linearised
+        buoyancy with g*theta/thetabar, which assumes that the
+        reference profiles are in hydrostatic balance.
+
+    (2) Solve the resulting mixed system for the vertical velocity in
+        the space Vv and rho. With the default solver parameters this
+        is hybridized in the vertical with the
+        :class:`.VerticalHybridizationPC`, and the multipliers are found
+        column by column with its column solver, so that no globally
+        coupled system is solved.
+
+    (3) Copy the vertical velocity into the vertical degrees of freedom
+        of the velocity increment.
+
+    (4) Reconstruct theta
+
+    :arg state: a :class:`.State` object containing everything else.
+    :arg solver_parameters (optional): solver parameters for the
+         vertical system.
+    :arg overwrite_solver_parameters: boolean, if True use only the
+         solver_parameters that have been passed in, if False then update.
+         the default solver parameters with the solver_parameters passed in.
+    :arg moisture (optional): list of names of moisture fields.
+    """
+
+    solver_parameters = {'ksp_type': 'preonly',
+                         'mat_type': 'matfree',
+                         'pc_type': 'python',
+                         'pc_python_type': 'gusto.VerticalHybridizationPC',
+                         'vert_hybridization': {'column_solver': True}}
+
+    def __init__(self, state, solver_parameters=None,
+                 overwrite_solver_parameters=False, moisture=None):
+
+        self.moisture = moisture
+        super().__init__(state, solver_parameters, overwrite_solver_parameters)
+
+    @timed_function("Gusto:SolverSetup")
+    def _setup_solver(self):
+        state = self.state
+        g = state.parameters.g
+        cp = state.parameters.cp
+        mu = state.mu
+        Vu = state.spaces("HDiv")
+        Vv = state.spaces("Vv")
+        Vtheta = state.spaces("HDiv_v")
+        Vrho = state.spaces("DG")
+        mesh = state.mesh
+
+        # The vertical part of the enriched HDiv element comes after
+        # the horizontal part, so the local dofs of Vv in each cell are
+        # the last local dofs of HDiv. The kernels that zero and copy
+        # the vertical dofs rely on this.
+        u_element = Vu.ufl_element()
+        if not (isinstance(u_element, EnrichedElement)
+                and u_element._elements[-1] == Vv.ufl_element()):
+            raise NotImplementedError("The vertical solver needs an HDiv element whose last part is the element of Vv")
+        nv = Vv.finat_element.space_dimension()
+        nh = Vu.finat_element.space_dimension() - nv
+        self._zero_vertical_kernel = """
+        for (int i=0; i<{nv}; ++i)
+            u[{nh} + i] = 0.0;
+        """.format(nh=nh, nv=nv)
+        self._copy_vertical_kernel = """
+        for (int i=0; i<{nv}; ++i)
+            u[{nh} + i] = v[i];
+        """.format(nh=nh, nv=nv)
+
+        # Time-stepping coefficients are built from the state's dt
+        # Constant, so that the forms pick up any change of timestep
+        dt = state.dt
+        beta = dt*Constant(state.timestepping.alpha)
+        beta_cp = beta*Constant(cp)
+
+        # Split up the rhs vector (symbolically)
+        u_in, rho_in, theta_in = split(state.xrhs)
+
+        # The horizontal part of the velocity increment, which is
+        # known, and only enters the mass continuity equation
+        self.u_h = Function(Vu)
+
+        M = MixedFunctionSpace((Vv, Vrho))
+        w, phi = TestFunctions(M)
+        u, rho = TrialFunctions(M)
+
+        n = FacetNormal(mesh)
+
+        # Get background fields
+        thetabar = state.fields("thetabar")
+        rhobar = state.fields("rhobar")
+        pibar_rho = thermodynamics.pi_rho(state.parameters, rhobar, thetabar)
+        pibar_theta = thermodynamics.pi_theta(state.parameters, rhobar, thetabar)
+
+        # rhobar in the theta space, which is continuous in the
+        # vertical, so that the vertical mass flux needs no facet terms
+        # and the system stays local to each cell
+        self.rhobar_v = Function(Vtheta)
+        gamma = TestFunction(Vtheta)
+        rhobar_eqn = gamma*(TrialFunction(Vtheta) - rhobar)*dx
+
+        cg_ilu_parameters = {'ksp_type': 'cg',
+                             'pc_type': 'bjacobi',
+                             'sub_pc_type': 'ilu'}
+
+        rhobar_problem = LinearVariationalProblem(lhs(rhobar_eqn), rhs(rhobar_eqn),
+                                                  self.rhobar_v)
+        self.rhobar_solver = LinearVariationalSolver(rhobar_problem,
+                                                     solver_parameters=cg_ilu_parameters,
+                                                     options_prefix='rhobar_v_solver')
+        self.rhobar_solver.solve()
+
+        # Analytical (approximate) elimination of theta
+        k = state.k             # Upward pointing unit vector
+        theta = -dot(k, u)*dot(k, grad(thetabar))*beta + theta_in
+
+        # The pi prime term (here, bars are for mean and no bars are
+        # for linear perturbations)
+        pi = pibar_theta*theta + pibar_rho*rho
+
+        # Add effect of density of water upon theta
+        if self.moisture is not None:
+            water_t = Function(Vtheta).assign(0.0)
+            for water in self.moisture:
+                water_t += self.state.fields(water)
+            thetabar_w = thetabar / (1 + water_t)
+        else:
+            thetabar_w = thetabar
+
+        eqn = (
+            # vertical momentum equation, using cp*thetabar*dpibar/dz = -g
+            # for the theta prime part of the pressure gradient
+            inner(w, u - u_in)*dx
+            - beta*g*inner(w, k)*theta/thetabar*dx
+            - beta_cp*div(thetabar_w*w)*pi*dx
+            # mass continuity equation
+            + phi*(rho - rho_in)*dx
+            + beta*phi*div(self.rhobar_v*u)*dx
+            # horizontal mass flux of the known horizontal velocity
+            - beta*inner(grad(phi), self.u_h)*rhobar*dx
+            + beta*jump(phi*self.u_h, n=n)*avg(rhobar)*dS_v
+        )
+
+        # contribution of the sponge term, which the HEVI stages scale
+        # with the rest of the vertical forcing
+        if mu is not None:
+            eqn += beta*mu*inner(w, k)*inner(u, k)*dx
+
+        # Function for the vertical velocity and density
+        self.urho = Function(M)
+
+        bcs = [DirichletBC(M.sub(0), 0.0, "bottom"),
+               DirichletBC(M.sub(0), 0.0, "top")]
+
+        # The operator only depends on the reference profiles, dt and
+        # alpha, so it is assembled and its preconditioner set up once,
+        # and then reused until it is invalidated
+        vertical_problem = LinearVariationalProblem(lhs(eqn), rhs(eqn), self.urho,
+                                                    bcs=bcs, constant_jacobian=True)
+        self.vertical_solver = LinearVariationalSolver(vertical_problem,
+                                                       solver_parameters=self.solver_parameters,
+                                                       options_prefix='VerticalImplicitSolver')
+
+        # Reconstruction of theta
+        theta = TrialFunction(Vtheta)
+        u, _ = split(self.urho)
+
+        self.theta = Function(Vtheta)
+        theta_eqn = gamma*(theta - theta_in
+                           + dot(k, u)*dot(k, grad(thetabar))*beta)*dx
+
+        theta_problem = LinearVariationalProblem(lhs(theta_eqn), rhs(theta_eqn), self.theta)
+        self.theta_solver = LinearVariationalSolver(theta_problem,
+                                                    solver_parameters=cg_ilu_parameters,
+                                                    options_prefix='thetabacksubstitution')
+
+        self.bcs = self.state.bcs
+
+    @timed_function("Gusto:LinearSolve")
+    def solve(self):
+        """
+        Apply the solver with rhs state.xrhs and result state.dy.
+        """
+
+        self._check_reference_profiles()
+
+        u_in = self.state.xrhs.split()[0]
+        u, rho, theta = self.state.dy.split()
+
+        # The horizontal velocity increment is the residual
+        self.u_h.assign(u_in)
+        self._zero_vertical(self.u_h)
+
+        with timed_region("Gusto:VerticalSolve"):
+            self.vertical_solver.solve()
+
+        u1, rho1 = self.urho.split()
+        u.assign(self.u_h)
+        self._copy_vertical(u, u1)
+
+        # Reapply bcs to ensure they are satisfied
+        for bc in self.bcs:
+            bc.apply(u)
+
+        rho.assign(rho1)
+
+        # Reconstruct theta
+        with timed_region("Gusto:ThetaRecon"):
+            self.theta_solver.solve()
+
+        theta.assign(self.theta)
+
+    def _zero_vertical(self, u):
+        """
+        Set the vertical degrees of freedom of u, in the HDiv space, to
+        zero.
+        """
+        par_loop(self._zero_vertical_kernel, dx, {"u": (u, RW)})
+
+    def _copy_vertical(self, u, v):
+        """
+        Copy v, in the space Vv, into the vertical degrees of freedom of
+        u, in the HDiv space.
+        """
+        par_loop(self._copy_vertical_kernel, dx, {"u": (u, RW), "v": (v, READ)})
+
+    def update_dt(self):
+        self.vertical_solver.invalidate_jacobian()
+
+    def update_reference_profiles(self):
+        self.rhobar_solver.solve()
+        self.vertical_solver.invalidate_jacobian()
+
 
 class IncompressibleSolver(TimesteppingSolver):
     """Timestepping linear solver object for the incompressible
@@ -409,16 +711,15 @@ class IncompressibleSolver(TimesteppingSolver):
     @timed_function("Gusto:SolverSetup")
     def _setup_solver(self):
         state = self.state      # just cutting down line length a bit
-        Dt = state.timestepping.dt
-        beta_ = Dt*state.timestepping.alpha
         mu = state.mu
         Vu = state.spaces("HDiv")
         Vb = state.spaces("HDiv_v")
         Vp = state.spaces("DG")
 
-        # Store time-stepping coefficients as UFL Constants
-        dt = Constant(Dt)
-        beta = Constant(beta_)
+        # Time-stepping coefficients are built from the state's dt
+        # Constant, so that the forms pick up any change of timestep
+        dt = state.dt
+        beta = dt*Constant(state.timestepping.alpha)
 
         # Split up the rhs vector (symbolically)
         u_in, p_in, b_in = split(state.xrhs)
@@ -503,6 +804,9 @@ class IncompressibleSolver(TimesteppingSolver):
 
         b.assign(self.b)
 
+    def update_dt(self):
+        self.up_solver.invalidate_jacobian()
+
 
 class ShallowWaterSolver(TimesteppingSolver):
     """
@@ -530,10 +834,10 @@ class ShallowWaterSolver(TimesteppingSolver):
         state = self.state
         H_ = state.parameters.H
         g_ = state.parameters.g
-        beta_ = state.timestepping.dt*state.timestepping.alpha
 
-        # Store time-stepping coefficients as UFL Constants
-        beta = Constant(beta_)
+        # Store time-stepping coefficients as UFL Constants, building
+        # beta from the state's dt so that a change of timestep is seen
+        beta = state.dt*Constant(state.timestepping.alpha)
         H = Constant(H_)
         g = Constant(g_)
 
@@ -572,3 +876,6 @@ class ShallowWaterSolver(TimesteppingSolver):
         """
 
         self.uD_solver.solve()
+
+    def update_dt(self):
+        self.uD_solver.invalidate_jacobian()
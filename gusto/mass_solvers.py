@@ -0,0 +1,29 @@
+from firedrake import Function, Tensor, assemble
+
+
+__all__ = ["LocalMassSolver"]
+
+
+class LocalMassSolver(object):
+    """
+    Solver for a problem whose left hand side is the mass matrix of a
+    discontinuous space. As the mass matrix is then block diagonal, its
+    inverse is assembled cell by cell once, using Slate, so that each
+    solve is an assembly of the right hand side followed by a
+    multiplication with the inverse.
+
+    :arg a: the mass matrix form.
+    :arg L: the right hand side form.
+    :arg x: :class:`.Function` to put the solution in.
+    """
+
+    def __init__(self, a, L, x):
+        self.L = L
+        self.x = x
+        self.b = Function(x.function_space())
+        self.Minv = assemble(Tensor(a).inv)
+
+    def solve(self):
+        assemble(self.L, tensor=self.b)
+        with self.b.dat.vec_ro as b, self.x.dat.vec_wo as x:
+            self.Minv.petscmat.mult(b, x)
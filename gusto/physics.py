@@ -1,19 +1,155 @@
 from abc import ABCMeta, abstractmethod
 from gusto.transport_equation import EmbeddedDGAdvection
-from gusto.recovery import Recoverer, Boundary_Method
+from gusto.recovery import Boundary_Method
 from gusto.advection import SSPRK3
 from firedrake.slope_limiter.vertex_based_limiter import VertexBasedLimiter
 from gusto.limiters import ThetaLimiter, NoLimiter
 from gusto.configuration import logger, EmbeddedDGOptions, RecoveredOptions
 from firedrake import (Interpolator, conditional, Function,
                        min_value, max_value, as_vector, BrokenElement, FunctionSpace,
-                       Constant, pi, Projector)
+                       VectorFunctionSpace, Constant, pi, Projector)
 from gusto import thermodynamics
 from math import gamma
 from enum import Enum
 
 
-__all__ = ["Condensation", "Fallout", "Coalescence", "Evaporation", "AdvectedMoments"]
+__all__ = ["Condensation", "Fallout", "Coalescence", "Evaporation", "WarmRain", "AdvectedMoments"]
+
+
+def _latent_heating(parameters, rho_averaged, theta, water_v, water_l):
+    """
+    Returns expressions for the temperature, the pressure and the factor
+    multiplying the phase change rate in the potential temperature update.
+    """
+    R_d = parameters.R_d
+    cp = parameters.cp
+    cv = parameters.cv
+    c_pv = parameters.c_pv
+    c_pl = parameters.c_pl
+    c_vv = parameters.c_vv
+    R_v = parameters.R_v
+
+    Pi = thermodynamics.pi(parameters, rho_averaged, theta)
+    T = thermodynamics.T(parameters, theta, Pi, r_v=water_v)
+    p = thermodynamics.p(parameters, Pi)
+    L_v = thermodynamics.Lv(parameters, T)
+    R_m = R_d + R_v * water_v
+    c_pml = cp + c_pv * water_v + c_pl * water_l
+    c_vml = cv + c_vv * water_v + c_pl * water_l
+
+    factor = (cv * L_v / (c_vml * cp * T)
+              - R_v * cv * c_pml / (R_m * cp * c_vml))
+
+    return T, p, factor
+
+
+def _condensation(parameters, dt, rho_averaged, theta, water_v, water_c, water_l):
+    """
+    Returns the limited condensation rate and a function taking a rate
+    and returning the updated theta, water_v and water_c.
+    """
+    cp = parameters.cp
+    R_v = parameters.R_v
+
+    T, p, factor = _latent_heating(parameters, rho_averaged, theta, water_v, water_l)
+    L_v = thermodynamics.Lv(parameters, T)
+
+    # use Teten's formula to calculate w_sat
+    w_sat = thermodynamics.r_sat(parameters, T, p)
+
+    # make appropriate condensation rate
+    dot_r_cond = ((water_v - w_sat)
+                  / (dt * (1.0 + ((L_v ** 2.0 * w_sat)
+                                  / (cp * R_v * T ** 2.0)))))
+
+    # adjust cond rate so negative concentrations don't occur
+    rate = conditional(dot_r_cond < 0,
+                       max_value(dot_r_cond, - water_c / dt),
+                       min_value(dot_r_cond, water_v / dt))
+
+    def update(cond_rate):
+        return (theta * (1.0 + dt * cond_rate * factor),
+                water_v - dt * cond_rate,
+                water_c + dt * cond_rate)
+
+    return rate, update
+
+
+def _coalescence(dt, water_c, rain, accretion, accumulation):
+    """
+    Returns the limited coalescence rate and a function taking a rate
+    and returning the updated water_c and rain.
+    """
+    k_1 = Constant(0.001)  # accretion rate in 1/s
+    k_2 = Constant(2.2)  # accumulation rate in 1/s
+    a = Constant(0.001)  # min cloud conc in kg/kg
+    b = Constant(0.875)  # power for rain in accumulation
+
+    # make default rates to be zero
+    accr_rate = Constant(0.0)
+    accu_rate = Constant(0.0)
+
+    if accretion:
+        accr_rate = k_1 * (water_c - a)
+    if accumulation:
+        accu_rate = k_2 * water_c * rain ** b
+
+    # adjust coalesce rate using min_value so negative cloud concentration doesn't occur
+    rate = conditional(rain < 0.0,  # if rain is negative do only accretion
+                       conditional(accr_rate < 0.0,
+                                   0.0,
+                                   min_value(accr_rate, water_c / dt)),
+                       # don't turn rain back into cloud
+                       conditional(accr_rate + accu_rate < 0.0,
+                                   0.0,
+                                   # if accretion rate is negative do only accumulation
+                                   conditional(accr_rate < 0.0,
+                                               min_value(accu_rate, water_c / dt),
+                                               min_value(accr_rate + accu_rate, water_c / dt))))
+
+    def update(coalesce_rate):
+        return (water_c - dt * coalesce_rate,
+                rain + dt * coalesce_rate)
+
+    return rate, update
+
+
+def _evaporation(parameters, dt, rho_averaged, theta, water_v, rain, water_l):
+    """
+    Returns the limited evaporation rate and a function taking a rate
+    and returning the updated theta, water_v and rain.
+    """
+    T, p, factor = _latent_heating(parameters, rho_averaged, theta, water_v, water_l)
+
+    # use Teten's formula to calculate w_sat
+    w_sat = thermodynamics.r_sat(parameters, T, p)
+
+    # expression for ventilation factor
+    a = Constant(1.6)
+    b = Constant(124.9)
+    c = Constant(0.2046)
+    C = a + b * (rho_averaged * rain) ** c
+
+    # make appropriate condensation rate
+    f = Constant(5.4e5)
+    g = Constant(2.55e6)
+    h = Constant(0.525)
+    dot_r_evap = (((1 - water_v / w_sat) * C * (rho_averaged * rain) ** h)
+                  / (rho_averaged * (f + g / (p * w_sat))))
+
+    # adjust evap rate so negative rain doesn't occur
+    rate = conditional(dot_r_evap < 0,
+                       0.0,
+                       conditional(rain < 0.0,
+                                   0.0,
+                                   min_value(dot_r_evap, rain / dt)))
+
+    def update(evap_rate):
+        return (theta * (1.0 - dt * evap_rate * factor),
+                water_v + dt * evap_rate,
+                rain - dt * evap_rate)
+
+    return rate, update
 
 
 class Physics(object, metaclass=ABCMeta):
@@ -56,7 +192,6 @@ class Condensation(Physics):
         self.theta = state.fields('theta')
         self.water_v = state.fields('water_v')
         self.water_c = state.fields('water_c')
-        rho = state.fields('rho')
         try:
             rain = state.fields('rain')
             water_l = self.water_c + rain
@@ -67,60 +202,28 @@ class Condensation(Physics):
         Vt = self.theta.function_space()
 
         # make rho variables
-        # we recover rho into theta space
-        if state.vertical_degree == 0 and state.horizontal_degree == 0:
-            boundary_method = Boundary_Method.physics
-        else:
-            boundary_method = None
-        Vt_broken = FunctionSpace(state.mesh, BrokenElement(Vt.ufl_element()))
-        rho_averaged = Function(Vt)
-        self.rho_recoverer = Recoverer(rho, rho_averaged, VDG=Vt_broken, boundary_method=boundary_method)
-
-        # define some parameters as attributes
-        dt = state.timestepping.dt
-        R_d = state.parameters.R_d
-        cp = state.parameters.cp
-        cv = state.parameters.cv
-        c_pv = state.parameters.c_pv
-        c_pl = state.parameters.c_pl
-        c_vv = state.parameters.c_vv
-        R_v = state.parameters.R_v
-
-        # make useful fields
-        Pi = thermodynamics.pi(state.parameters, rho_averaged, self.theta)
-        T = thermodynamics.T(state.parameters, self.theta, Pi, r_v=self.water_v)
-        p = thermodynamics.p(state.parameters, Pi)
-        L_v = thermodynamics.Lv(state.parameters, T)
-        R_m = R_d + R_v * self.water_v
-        c_pml = cp + c_pv * self.water_v + c_pl * water_l
-        c_vml = cv + c_vv * self.water_v + c_pl * water_l
-
-        # use Teten's formula to calculate w_sat
-        w_sat = thermodynamics.r_sat(state.parameters, T, p)
-
-        # make appropriate condensation rate
-        dot_r_cond = ((self.water_v - w_sat)
-                      / (dt * (1.0 + ((L_v ** 2.0 * w_sat)
-                                      / (cp * R_v * T ** 2.0)))))
+        # we use rho recovered into theta space, which is shared
+        rho_averaged = state.derived_fields.rho_averaged
+
+        dt = state.dt
+        rate, update = _condensation(state.parameters, dt, rho_averaged,
+                                     self.theta, self.water_v, self.water_c,
+                                     water_l)
 
         # make cond_rate function, that needs to be the same for all updates in one time step
         cond_rate = Function(Vt)
 
         # adjust cond rate so negative concentrations don't occur
-        self.lim_cond_rate = Interpolator(conditional(dot_r_cond < 0,
-                                                      max_value(dot_r_cond, - self.water_c / dt),
-                                                      min_value(dot_r_cond, self.water_v / dt)), cond_rate)
+        self.lim_cond_rate = Interpolator(rate, cond_rate)
 
         # tell the prognostic fields what to update to
-        self.water_v_new = Interpolator(self.water_v - dt * cond_rate, Vt)
-        self.water_c_new = Interpolator(self.water_c + dt * cond_rate, Vt)
-        self.theta_new = Interpolator(self.theta
-                                      * (1.0 + dt * cond_rate
-                                         * (cv * L_v / (c_vml * cp * T)
-                                            - R_v * cv * c_pml / (R_m * cp * c_vml))), Vt)
+        theta_new, water_v_new, water_c_new = update(cond_rate)
+        self.water_v_new = Interpolator(water_v_new, Vt)
+        self.water_c_new = Interpolator(water_c_new, Vt)
+        self.theta_new = Interpolator(theta_new, Vt)
 
     def apply(self):
-        self.rho_recoverer.project()
+        self.state.derived_fields.update_rho_averaged()
         for i in range(self.iterations):
             self.lim_cond_rate.interpolate()
             self.theta.assign(self.theta_new.interpolate())
@@ -226,7 +329,10 @@ class Fallout(Physics):
             advect_options = EmbeddedDGOptions()
 
         # need to define advection equation before limiter (as it is needed for the ThetaLimiter)
-        advection_equation = EmbeddedDGAdvection(state, Vt, equation_form="advective", outflow=True, options=advect_options)
+        # the rain is advected by its fall velocity, rather than the
+        # shared advecting velocity
+        advection_equation = EmbeddedDGAdvection(state, Vt, equation_form="advective", outflow=True,
+                                                 options=advect_options, ubar=self.v)
 
         # decide which limiter to use
         if self.limit:
@@ -246,7 +352,6 @@ class Fallout(Physics):
     def apply(self):
         if self.moments != AdvectedMoments.M0:
             self.determine_v.project()
-        self.advection_method.update_ubar(self.v, self.v, 0)
         self.advection_method.apply(self.rain, self.rain)
 
 
@@ -276,42 +381,20 @@ class Coalescence(Physics):
         # declare function space
         Vt = self.water_c.function_space()
 
-        # define some parameters as attributes
-        dt = state.timestepping.dt
-        k_1 = Constant(0.001)  # accretion rate in 1/s
-        k_2 = Constant(2.2)  # accumulation rate in 1/s
-        a = Constant(0.001)  # min cloud conc in kg/kg
-        b = Constant(0.875)  # power for rain in accumulation
-
-        # make default rates to be zero
-        accr_rate = Constant(0.0)
-        accu_rate = Constant(0.0)
-
-        if accretion:
-            accr_rate = k_1 * (self.water_c - a)
-        if accumulation:
-            accu_rate = k_2 * self.water_c * self.rain ** b
+        dt = state.dt
+        rate, update = _coalescence(dt, self.water_c, self.rain,
+                                    accretion, accumulation)
 
         # make coalescence rate function, that needs to be the same for all updates in one time step
         coalesce_rate = Function(Vt)
 
         # adjust coalesce rate using min_value so negative cloud concentration doesn't occur
-        self.lim_coalesce_rate = Interpolator(conditional(self.rain < 0.0,  # if rain is negative do only accretion
-                                                          conditional(accr_rate < 0.0,
-                                                                      0.0,
-                                                                      min_value(accr_rate, self.water_c / dt)),
-                                                          # don't turn rain back into cloud
-                                                          conditional(accr_rate + accu_rate < 0.0,
-                                                                      0.0,
-                                                                      # if accretion rate is negative do only accumulation
-                                                                      conditional(accr_rate < 0.0,
-                                                                                  min_value(accu_rate, self.water_c / dt),
-                                                                                  min_value(accr_rate + accu_rate, self.water_c / dt)))),
-                                              coalesce_rate)
+        self.lim_coalesce_rate = Interpolator(rate, coalesce_rate)
 
         # tell the prognostic fields what to update to
-        self.water_c_new = Interpolator(self.water_c - dt * coalesce_rate, Vt)
-        self.rain_new = Interpolator(self.rain + dt * coalesce_rate, Vt)
+        water_c_new, rain_new = update(coalesce_rate)
+        self.water_c_new = Interpolator(water_c_new, Vt)
+        self.rain_new = Interpolator(rain_new, Vt)
 
     def apply(self):
         self.lim_coalesce_rate.interpolate()
@@ -335,7 +418,6 @@ class Evaporation(Physics):
         self.theta = state.fields('theta')
         self.water_v = state.fields('water_v')
         self.rain = state.fields('rain')
-        rho = state.fields('rho')
         try:
             water_c = state.fields('water_c')
             water_l = self.rain + water_c
@@ -346,72 +428,111 @@ class Evaporation(Physics):
         Vt = self.theta.function_space()
 
         # make rho variables
-        # we recover rho into theta space
-        if state.vertical_degree == 0 and state.horizontal_degree == 0:
-            boundary_method = Boundary_Method.physics
-        else:
-            boundary_method = None
-        Vt_broken = FunctionSpace(state.mesh, BrokenElement(Vt.ufl_element()))
-        rho_averaged = Function(Vt)
-        self.rho_recoverer = Recoverer(rho, rho_averaged, VDG=Vt_broken, boundary_method=boundary_method)
-
-        # define some parameters as attributes
-        dt = state.timestepping.dt
-        R_d = state.parameters.R_d
-        cp = state.parameters.cp
-        cv = state.parameters.cv
-        c_pv = state.parameters.c_pv
-        c_pl = state.parameters.c_pl
-        c_vv = state.parameters.c_vv
-        R_v = state.parameters.R_v
-
-        # make useful fields
-        Pi = thermodynamics.pi(state.parameters, rho_averaged, self.theta)
-        T = thermodynamics.T(state.parameters, self.theta, Pi, r_v=self.water_v)
-        p = thermodynamics.p(state.parameters, Pi)
-        L_v = thermodynamics.Lv(state.parameters, T)
-        R_m = R_d + R_v * self.water_v
-        c_pml = cp + c_pv * self.water_v + c_pl * water_l
-        c_vml = cv + c_vv * self.water_v + c_pl * water_l
-
-        # use Teten's formula to calculate w_sat
-        w_sat = thermodynamics.r_sat(state.parameters, T, p)
-
-        # expression for ventilation factor
-        a = Constant(1.6)
-        b = Constant(124.9)
-        c = Constant(0.2046)
-        C = a + b * (rho_averaged * self.rain) ** c
-
-        # make appropriate condensation rate
-        f = Constant(5.4e5)
-        g = Constant(2.55e6)
-        h = Constant(0.525)
-        dot_r_evap = (((1 - self.water_v / w_sat) * C * (rho_averaged * self.rain) ** h)
-                      / (rho_averaged * (f + g / (p * w_sat))))
+        # we use rho recovered into theta space, which is shared
+        rho_averaged = state.derived_fields.rho_averaged
+
+        dt = state.dt
+        rate, update = _evaporation(state.parameters, dt, rho_averaged,
+                                    self.theta, self.water_v, self.rain,
+                                    water_l)
 
         # make evap_rate function, needs to be the same for all updates in one time step
         evap_rate = Function(Vt)
 
         # adjust evap rate so negative rain doesn't occur
-        self.lim_evap_rate = Interpolator(conditional(dot_r_evap < 0,
-                                                      0.0,
-                                                      conditional(self.rain < 0.0,
-                                                                  0.0,
-                                                                  min_value(dot_r_evap, self.rain / dt))),
-                                          evap_rate)
+        self.lim_evap_rate = Interpolator(rate, evap_rate)
 
         # tell the prognostic fields what to update to
-        self.water_v_new = Interpolator(self.water_v + dt * evap_rate, Vt)
-        self.rain_new = Interpolator(self.rain - dt * evap_rate, Vt)
-        self.theta_new = Interpolator(self.theta
-                                      * (1.0 - dt * evap_rate
-                                         * (cv * L_v / (c_vml * cp * T)
-                                            - R_v * cv * c_pml / (R_m * cp * c_vml))), Vt)
+        theta_new, water_v_new, rain_new = update(evap_rate)
+        self.water_v_new = Interpolator(water_v_new, Vt)
+        self.rain_new = Interpolator(rain_new, Vt)
+        self.theta_new = Interpolator(theta_new, Vt)
 
     def apply(self):
-        self.rho_recoverer.project()
+        self.state.derived_fields.update_rho_averaged()
         self.lim_evap_rate.interpolate()
         self.theta.assign(self.theta_new.interpolate())
         self.water_v.assign(self.water_v_new.interpolate())
         self.rain.assign(self.rain_new.interpolate())
+
+
+class WarmRain(Physics):
+    """
+    The warm rain microphysics processes, combined into a single
+    pointwise update. This is equivalent to applying
+    :class:`.Coalescence`, :class:`.Evaporation` and then
+    :class:`.Condensation`, but every process is evaluated for each
+    DOF in one generated kernel, which reads each of the fields once.
+    If there is no rain field, only condensation is applied.
+
+    :arg state: :class:`.State.` object.
+    :arg accretion: Boolean which determines
+                    whether the accretion
+                    process is used.
+    :arg accumulation: Boolean which determines
+                    whether the accumulation
+                    process is used.
+    :arg evaporation: Boolean which determines
+                    whether the evaporation of
+                    rain is used.
+    :arg iterations: number of iterations to do
+         of condensation scheme per time step.
+    """
+
+    def __init__(self, state, accretion=True, accumulation=True,
+                 evaporation=True, iterations=1):
+        super().__init__(state)
+
+        # obtain our fields
+        self.fields = [state.fields('theta'),
+                       state.fields('water_v'),
+                       state.fields('water_c')]
+        try:
+            self.fields.append(state.fields('rain'))
+        except NotImplementedError:
+            pass
+
+        # declare function space
+        Vt = self.fields[0].function_space()
+
+        # make rho variables
+        # we use rho recovered into theta space, which is shared
+        rho_averaged = state.derived_fields.rho_averaged
+
+        dt = state.dt
+        parameters = state.parameters
+        theta, water_v, water_c = self.fields[:3]
+
+        if len(self.fields) == 4:
+            rain = self.fields[3]
+
+            rate, update = _coalescence(dt, water_c, rain,
+                                        accretion, accumulation)
+            water_c, rain = update(rate)
+
+            if evaporation:
+                rate, update = _evaporation(parameters, dt, rho_averaged,
+                                            theta, water_v, rain,
+                                            rain + water_c)
+                theta, water_v, rain = update(rate)
+
+        for i in range(iterations):
+            water_l = water_c if len(self.fields) == 3 else water_c + rain
+            rate, update = _condensation(parameters, dt, rho_averaged,
+                                         theta, water_v, water_c, water_l)
+            theta, water_v, water_c = update(rate)
+
+        new_fields = [theta, water_v, water_c]
+        if len(self.fields) == 4:
+            new_fields.append(rain)
+
+        # all of the updated fields are found by a single interpolation
+        V = VectorFunctionSpace(state.mesh, Vt.ufl_element(), dim=len(self.fields))
+        self.x_new = Function(V)
+        self.update = Interpolator(as_vector(new_fields), self.x_new)
+
+    def apply(self):
+        self.state.derived_fields.update_rho_averaged()
+        self.update.interpolate()
+        for i, f in enumerate(self.fields):
+            f.dat.data[:] = self.x_new.dat.data_ro[:, i]
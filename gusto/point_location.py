@@ -0,0 +1,575 @@
+from mpi4py import MPI
+from finat import TensorFiniteElement
+import numpy as np
+
+
+__all__ = ["PointLocation", "CellWalker", "CellWalkLocation", "PointEvaluator"]
+
+
+class PointLocation(object):
+    def __init__(self, V, points, dont_raise=False, walker=None):
+        """Locate a set of points in a mesh. Each point is assigned to
+        the lowest rank that finds it in one of its owned cells.
+
+        :arg V: A :class:`FunctionSpace` on the mesh.
+        :arg points: Array of points, with shape (npoints, dim), which
+            is the same on every rank.
+        :kwarg dont_raise: If True, points that are not in the domain
+            are not owned by any rank, and their indices are listed in
+            :attr:`missing`, rather than raising an error.
+        :kwarg walker: The :class:`CellWalker` of the mesh, which is
+            used to search the owned cells. One is made if it is not
+            given.
+        """
+        self.V = V
+        if walker is None:
+            walker = CellWalker(V.mesh())
+        comm = V.mesh().comm
+        cells, X, found = walker.locate(points)
+
+        owner = np.where(found, comm.rank, comm.size).astype(np.int32)
+        comm.Allreduce(MPI.IN_PLACE, owner, op=MPI.MIN)
+        missing = np.flatnonzero(owner == comm.size).astype(np.int32)
+        if len(missing) > 0 and not dont_raise:
+            raise ValueError("Point data points %s are not in the domain"
+                             % points[missing])
+        owned = np.flatnonzero(owner == comm.rank)
+
+        #: The indices of the points owned by this rank.
+        self.indices = owned.astype(np.int32)
+        #: The cells containing the owned points.
+        self.cells = cells[owned]
+        #: The reference coordinates of the owned points.
+        self.reference_coordinates = X[owned]
+        #: The indices of the points that are not in the domain.
+        self.missing = missing
+        self.npoints = len(points)
+
+
+class CellWalker(object):
+
+    #: The status of a point that is in the cell it has walked to.
+    FOUND = 0
+    #: The status of a point that has walked out of the domain.
+    OUTSIDE = 1
+    #: The status of a point that has walked out of the cells of this
+    #: rank, or that was not found in max_steps cells.
+    ELSEWHERE = 2
+
+    # for each base cell, the reference centroid, and the matrix and
+    # vector giving how far a reference coordinate is outside of each
+    # local facet, in the FIAT numbering of the facets
+    reference_cells = {
+        "interval": ([0.5], [[-1., 1.]], [0., -1.]),
+        "triangle": ([1./3., 1./3.], [[1., -1., 0.], [1., 0., -1.]], [-1., 0., 0.]),
+        "quadrilateral": ([0.5, 0.5], [[-1., 1., 0., 0.], [0., 0., -1., 1.]],
+                          [0., -1., 0., -1.])
+    }
+
+    def __init__(self, mesh, periodic_lengths=None, max_steps=1000,
+                 tolerance=1.e-10):
+        """Locate points in a mesh by walking each of them from a
+        starting cell through neighbouring cells, for all of the points
+        at once. In each step the reference coordinates of the points in
+        their current cells are found with Newton's method, and each
+        point that is outside of its cell moves to the neighbour across
+        the facet it is furthest outside of. In an extruded mesh the
+        neighbours in the column are the cells of the layers above and
+        below. Only the cells of this rank, including its halo, are
+        visited, so the cost is proportional to the number of points and
+        the number of cells they cross. Points without a starting cell
+        are located in the owned cells with :meth:`locate`.
+
+        :arg mesh: The mesh.
+        :kwarg periodic_lengths: Tuple giving, for each coordinate, the
+            length of the domain if it is periodic in that direction, or
+            None if it is not. A point is compared with the nearest of
+            its periodic images to each cell.
+        :kwarg max_steps: The largest number of cells a point visits.
+        :kwarg tolerance: How far, in reference coordinates, a point can
+            be outside of a cell and still be found in it.
+        """
+        self.extruded = hasattr(mesh, "_base_mesh")
+        base_mesh = mesh._base_mesh if self.extruded else mesh
+        cellname = base_mesh.ufl_cell().cellname()
+        if cellname not in self.reference_cells:
+            raise NotImplementedError("Cannot walk through %s cells" % cellname)
+        centroid, facet_matrix, facet_vector = self.reference_cells[cellname]
+        self.nlayers = mesh.layers - 1 if self.extruded else 1
+        self.centroid = np.array(centroid + [0.5] if self.extruded else centroid)
+        self.facet_matrix = np.array(facet_matrix)
+        self.facet_vector = np.array(facet_vector)
+        self.nfacets = len(facet_vector)
+        self.periodic_lengths = periodic_lengths
+        self.max_steps = max_steps
+        self.tolerance = tolerance
+        #: The total number of cells visited by all points.
+        self.visits = 0
+
+        # the coordinates of the nodes of each cell
+        coordinates = mesh.coordinates
+        Vc = coordinates.function_space()
+        element = Vc.finat_element
+        if isinstance(element, TensorFiniteElement):
+            element = element.base_element
+        self.element = element.fiat_equivalent
+        tdim = len(self.centroid)
+        self.value_key = (0,)*tdim
+        self.derivative_keys = [tuple(int(i == j) for j in range(tdim))
+                                for i in range(tdim)]
+        self.cell_coordinates = coordinates.dat.data_ro_with_halos[self.cell_nodes(Vc)]
+        self.centres = self.cell_coordinates.mean(axis=1)
+
+        # the bounds of the owned cells, padded so that they contain the
+        # curved cells of a manifold mesh, and the bounds of the owned
+        # cells of each rank
+        self.comm = mesh.comm
+        self.ncells = base_mesh.cell_set.size*self.nlayers
+        owned = self.cell_coordinates[:self.ncells]
+        lower = owned.min(axis=1)
+        upper = owned.max(axis=1)
+        padding = 0.1*(upper - lower).max(axis=1)[:, None]
+        self.lower = lower - padding
+        self.upper = upper + padding
+        gdim = coordinates.dat.data_ro.shape[1]
+        if self.ncells > 0:
+            bounds = (self.lower.min(axis=0), self.upper.max(axis=0))
+        else:
+            bounds = (np.full(gdim, np.inf), np.full(gdim, -np.inf))
+        self.rank_lower, self.rank_upper = map(np.array, zip(*self.comm.allgather(bounds)))
+
+        # the neighbour of each base cell across each of its facets, or
+        # -2 if the facet is on the boundary of the domain, or -1 if the
+        # neighbour is not on this rank
+        neighbours = np.full((base_mesh.cell_set.total_size, self.nfacets), -1,
+                             dtype=np.int32)
+        facets = base_mesh.exterior_facets
+        cells = facets.facet_cell_map.values_with_halo.reshape(-1)
+        local = facets.local_facet_dat.data_ro_with_halos.reshape(-1)
+        neighbours[cells, local] = -2
+        facets = base_mesh.interior_facets
+        cells = facets.facet_cell_map.values_with_halo.reshape(-1, 2)
+        local = facets.local_facet_dat.data_ro_with_halos.reshape(-1, 2)
+        neighbours[cells[:, 0], local[:, 0]] = cells[:, 1]
+        neighbours[cells[:, 1], local[:, 1]] = cells[:, 0]
+        self.neighbours = neighbours
+
+    def cell_nodes(self, V):
+        """Return the nodes of V in each cell of this rank, including
+        its halo, with the cells of an extruded mesh numbered by column
+        and then by layer.
+
+        :arg V: A :class:`FunctionSpace` on the mesh.
+        """
+        cell_node_map = V.cell_node_map()
+        if not self.extruded:
+            return cell_node_map.values_with_halo
+        layers = np.arange(self.nlayers)
+        nodes = (cell_node_map.values_with_halo[:, None, :]
+                 + layers[None, :, None]*cell_node_map.offset[None, None, :])
+        return nodes.reshape(-1, nodes.shape[-1])
+
+    def node_cells(self, V):
+        """Return a cell containing each of the owned nodes of V.
+
+        :arg V: A :class:`FunctionSpace` on the mesh.
+        """
+        nodes = self.cell_nodes(V)
+        cells = np.empty(V.node_set.total_size, dtype=np.int32)
+        cells[nodes] = np.arange(len(nodes), dtype=np.int32)[:, None]
+        return cells[:V.node_set.size]
+
+    @classmethod
+    def supports(cls, mesh):
+        """Can points be located in the mesh by a :class:`CellWalker`?
+
+        :arg mesh: The mesh.
+        """
+        base_mesh = mesh._base_mesh if hasattr(mesh, "_base_mesh") else mesh
+        return base_mesh.ufl_cell().cellname() in cls.reference_cells
+
+    def _nearest_image(self, points, cells):
+        """Return the periodic images of the points nearest to the
+        centres of the cells. The cells may have any shape that
+        broadcasts against the points, less their last dimension."""
+        if self.periodic_lengths is None:
+            return points
+        centres = self.centres[cells]
+        points = points + np.zeros_like(centres)
+        for i, length in enumerate(self.periodic_lengths):
+            if length is not None:
+                points[..., i] = centres[..., i] + np.mod(points[..., i] - centres[..., i] + 0.5*length,
+                                                          length) - 0.5*length
+        return points
+
+    def _reference_coordinates(self, points, cells, iterations=10):
+        """Return the reference coordinates of the points in the cells,
+        from Newton's method. In a manifold mesh these are the reference
+        coordinates of the nearest point of the cell's surface."""
+        C = self.cell_coordinates[cells]
+        X = np.tile(self.centroid, (len(points), 1))
+        for i in range(iterations):
+            tabulation = self.element.tabulate(1, X)
+            F = np.einsum("ip,pid->pd", tabulation[self.value_key], C) - points
+            J = np.stack([np.einsum("ip,pid->pd", tabulation[key], C)
+                          for key in self.derivative_keys], axis=2)
+            if J.shape[1] > J.shape[2]:
+                F = np.einsum("pdt,pd->pt", J, F)
+                J = np.einsum("pdt,pds->pts", J, J)
+            dX = np.linalg.solve(J, F[:, :, None])[:, :, 0]
+            X -= dX
+            if not np.abs(dX).max() > 1.e-12:
+                break
+        return X
+
+    def _outside(self, X):
+        """Return how far the reference coordinates are outside of each
+        facet of the cell, with the bottom and top of an extruded cell
+        after the facets of its base cell."""
+        if not self.extruded:
+            return X.dot(self.facet_matrix) + self.facet_vector
+        Z = X[:, -1:]
+        return np.hstack([X[:, :-1].dot(self.facet_matrix) + self.facet_vector,
+                          -Z, Z - 1.])
+
+    def _neighbours(self, cells, facets):
+        """Return the neighbours of the cells across the facets, or -2
+        for the boundary of the domain, or -1 for a cell of another
+        rank."""
+        if not self.extruded:
+            return self.neighbours[cells, facets]
+        base_cells, layers = np.divmod(cells, self.nlayers)
+        neighbours = np.empty_like(cells)
+        horizontal = facets < self.nfacets
+        base_neighbours = self.neighbours[base_cells[horizontal], facets[horizontal]]
+        neighbours[horizontal] = np.where(base_neighbours >= 0,
+                                          base_neighbours*self.nlayers + layers[horizontal],
+                                          base_neighbours)
+        vertical = ~horizontal
+        layers = layers[vertical] + 2*(facets[vertical] - self.nfacets) - 1
+        neighbours[vertical] = np.where((layers >= 0) & (layers < self.nlayers),
+                                        base_cells[vertical]*self.nlayers + layers,
+                                        -2)
+        return neighbours
+
+    def walk(self, points, cells):
+        """Walk the points from the cells. Return the cells the points
+        finish in, their reference coordinates in those cells, and the
+        status of each point, which is :attr:`FOUND`, :attr:`OUTSIDE` or
+        :attr:`ELSEWHERE`.
+
+        :arg points: Array of points, with shape (npoints, dim).
+        :arg cells: The cells to start from, with the numbering of
+            :meth:`cell_nodes`.
+        """
+        cells = np.array(cells, dtype=np.int32)
+        X = np.zeros((len(points), len(self.centroid)))
+        status = np.full(len(points), self.ELSEWHERE, dtype=np.int32)
+        active = np.arange(len(points))
+        for step in range(self.max_steps):
+            if len(active) == 0:
+                break
+            self.visits += len(active)
+            current = cells[active]
+            X_active = self._reference_coordinates(
+                self._nearest_image(points[active], current), current)
+            outside = self._outside(X_active)
+            facets = outside.argmax(axis=1)
+            distance = outside[np.arange(len(active)), facets]
+            lost = ~np.isfinite(X_active).all(axis=1)
+            inside = ~lost & (distance <= self.tolerance)
+            X[active[inside]] = X_active[inside]
+            status[active[inside]] = self.FOUND
+
+            moving = ~lost & ~inside
+            neighbours = self._neighbours(current[moving], facets[moving])
+            active = active[moving]
+            status[active[neighbours == -2]] = self.OUTSIDE
+            cells[active] = np.where(neighbours >= 0, neighbours, cells[active])
+            active = active[neighbours >= 0]
+        return cells, X, status
+
+    def locate(self, points, chunk_size=2**20):
+        """Locate the points in the owned cells of this rank, without a
+        starting cell. Each point is tested against all of the cells
+        whose padded bounds contain it, for all of the points at once,
+        and is put in the cell it is least far outside of. Return the
+        cells, the reference coordinates of the points in them, and
+        whether each point was found.
+
+        :arg points: Array of points, with shape (npoints, dim).
+        :kwarg chunk_size: The largest number of point and cell pairs
+            whose bounds are compared at once.
+        """
+        npoints = len(points)
+        cells = np.full(npoints, -1, dtype=np.int32)
+        X = np.zeros((npoints, len(self.centroid)))
+        chunk = max(1, chunk_size//max(1, self.ncells))
+        owned = np.arange(self.ncells)
+        for start in range(0, npoints, chunk):
+            chunk_points = points[start:start + chunk]
+            images = np.broadcast_to(
+                self._nearest_image(chunk_points[:, None, :], owned[None, :]),
+                (len(chunk_points), self.ncells, chunk_points.shape[1]))
+            inside = ((images >= self.lower) & (images <= self.upper)).all(axis=2)
+            point, cell = np.nonzero(inside)
+            if len(point) == 0:
+                continue
+            X_pairs = self._reference_coordinates(images[point, cell], cell)
+            distance = self._outside(X_pairs).max(axis=1)
+            found = np.isfinite(X_pairs).all(axis=1) & (distance <= self.tolerance)
+            point, cell, X_pairs, distance = (point[found], cell[found],
+                                              X_pairs[found], distance[found])
+            # the pair of each point with the least distance
+            order = np.lexsort((distance, point))
+            _, first = np.unique(point[order], return_index=True)
+            best = order[first]
+            cells[start + point[best]] = cell[best]
+            X[start + point[best]] = X_pairs[best]
+        return cells, X, cells >= 0
+
+    def candidate_ranks(self, points):
+        """Return, as a boolean array with shape (npoints, nranks),
+        whether each point is within the bounds of the owned cells of
+        each rank.
+
+        :arg points: Array of points, with shape (npoints, dim).
+        """
+        return ((points[:, None, :] >= self.rank_lower)
+                & (points[:, None, :] <= self.rank_upper)).all(axis=2)
+
+
+def exchange(comm, arrays, counts=None):
+    """Send arrays[r] to rank r, for each rank r, and return the list
+    of arrays received from each rank. The arrays are sent point to
+    point, only between ranks that have something to send.
+
+    :arg comm: The communicator.
+    :arg arrays: List of one array for each rank, whose shapes only
+        differ in their first dimension, and which have the same dtype.
+    :kwarg counts: The lengths of the arrays that will be received from
+        each rank. If they are not given they are exchanged first, with
+        all ranks.
+    """
+    if counts is None:
+        counts = comm.alltoall([len(a) for a in arrays])
+    shape = arrays[0].shape[1:]
+    dtype = arrays[0].dtype
+    received = [np.empty((n,) + shape, dtype=dtype) for n in counts]
+    requests = []
+    # keep the send buffers alive until the sends have completed
+    buffers = []
+    for rank, (send, recv) in enumerate(zip(arrays, received)):
+        if rank == comm.rank:
+            recv[...] = send
+            continue
+        if len(recv) > 0:
+            requests.append(comm.Irecv(recv, source=rank))
+        if len(send) > 0:
+            buffers.append(np.ascontiguousarray(send))
+            requests.append(comm.Isend(buffers[-1], dest=rank))
+    MPI.Request.Waitall(requests)
+    return received
+
+
+class CellWalkLocation(object):
+    def __init__(self, walker, points, cells):
+        """Locate a set of this rank's points, with a :class:`CellWalker`
+        starting from a given cell for each point. Points that walk out
+        of the cells of this rank can then be located by the ranks whose
+        bounds contain them, with :meth:`locate_remote`, and are
+        evaluated by the rank that owns each of them, with values sent
+        point to point to this rank.
+
+        :arg walker: The :class:`CellWalker`.
+        :arg points: Array of points, with shape (npoints, dim).
+        :arg cells: The cells to start from.
+        """
+        self.walker = walker
+        self.start_cells = np.asarray(cells)
+        #: The indices of the points found in the cells of this rank.
+        self.indices = np.empty(0, dtype=np.int32)
+        #: The cells containing the found points.
+        self.cells = np.empty(0, dtype=np.int32)
+        #: The reference coordinates of the found points.
+        self.reference_coordinates = np.empty((0, len(walker.centroid)))
+        #: The indices of the points that are not in the domain.
+        self.missing = np.arange(len(points), dtype=np.int32)
+        #: The indices of the points that are not in the cells of this
+        #: rank, and have not yet been located by :meth:`locate_remote`.
+        self.remote = np.empty(0, dtype=np.int32)
+        #: For each rank that owns some of the remote points, the
+        #: indices of the points located in its owned cells.
+        self.owners = {}
+        # the points of other ranks located in the owned cells of this
+        # rank, and for each of those ranks their positions in served
+        self.served = _LocatedPoints(np.empty(0, dtype=np.int32),
+                                     np.empty((0, len(walker.centroid))))
+        self.served_ranks = {}
+        self.npoints = len(points)
+        self._evaluators = {}
+        self.relocate(points)
+
+    def relocate(self, points):
+        """Locate the missing points again, at new positions.
+
+        :arg points: Array of the new positions of the missing points,
+            in the order of :attr:`missing`.
+        """
+        walker = self.walker
+        cells, X, status = walker.walk(points, self.start_cells[self.missing])
+        found = status == walker.FOUND
+        self.indices = np.concatenate([self.indices, self.missing[found]]).astype(np.int32)
+        self.cells = np.concatenate([self.cells, cells[found]]).astype(np.int32)
+        self.reference_coordinates = np.concatenate([self.reference_coordinates, X[found]])
+        self.remote = np.concatenate(
+            [self.remote, self.missing[status == walker.ELSEWHERE]]).astype(np.int32)
+        self.missing = self.missing[status == walker.OUTSIDE]
+        self._evaluators = {}
+
+    def locate_remote(self, points):
+        """Locate the remote points in the owned cells of other ranks.
+        This is collective. Each point is sent to the ranks whose bounds
+        contain it, and is owned by the lowest of them that finds it.
+        Points that no rank finds are added to :attr:`missing`.
+
+        :arg points: Array of the positions of the remote points, in the
+            order of :attr:`remote`.
+        """
+        walker = self.walker
+        comm = walker.comm
+        candidates = walker.candidate_ranks(points)
+        requested = [points[candidates[:, rank]] for rank in range(comm.size)]
+        received = exchange(comm, requested)
+        located = [walker.locate(p) for p in received]
+
+        # the lowest candidate rank that finds each point owns it
+        found = exchange(comm, [f.astype(np.int8) for _, _, f in located],
+                         counts=[len(p) for p in requested])
+        claimed = np.zeros(candidates.shape, dtype=bool)
+        for rank, f in enumerate(found):
+            claimed[candidates[:, rank], rank] = f.astype(bool)
+        owner = np.where(claimed.any(axis=1), claimed.argmax(axis=1), -1)
+        owned = exchange(comm, [(owner[candidates[:, rank]] == rank).astype(np.int8)
+                                for rank in range(comm.size)],
+                         counts=[len(p) for p in received])
+
+        for rank in range(comm.size):
+            cells, X, _ = located[rank]
+            keep = owned[rank].astype(bool)
+            if keep.any():
+                start = len(self.served.cells)
+                self.served = _LocatedPoints(
+                    np.concatenate([self.served.cells, cells[keep]]).astype(np.int32),
+                    np.concatenate([self.served.reference_coordinates, X[keep]]))
+                self.served_ranks[rank] = np.concatenate(
+                    [self.served_ranks.get(rank, np.empty(0, dtype=np.int32)),
+                     np.arange(start, len(self.served.cells), dtype=np.int32)])
+            mine = self.remote[owner == rank]
+            if len(mine) > 0:
+                self.owners[rank] = np.concatenate(
+                    [self.owners.get(rank, np.empty(0, dtype=np.int32)), mine])
+        self.missing = np.concatenate([self.missing, self.remote[owner == -1]]).astype(np.int32)
+        self.remote = np.empty(0, dtype=np.int32)
+        self._evaluators = {}
+
+    def evaluators(self, V):
+        """Return the :class:`PointEvaluator` of this rank's points
+        found in its cells, and the one of the points it owns for other
+        ranks, in V. These are cached until the points are relocated.
+
+        :arg V: The :class:`FunctionSpace`.
+        """
+        if V not in self._evaluators:
+            self._evaluators[V] = (PointEvaluator(V, self),
+                                   PointEvaluator(V, self.served))
+        return self._evaluators[V]
+
+    def evaluate(self, f):
+        """Return the values of a function at all of this rank's points.
+        The values at the points owned by other ranks are sent point to
+        point by those ranks, so every rank that has remote points, or
+        owns points for other ranks, must call this for the same
+        location.
+
+        :arg f: The :class:`Function` to evaluate.
+        """
+        local, served = self.evaluators(f.function_space())
+        values = np.zeros((self.npoints,) + f.ufl_shape, dtype=f.dat.dtype)
+        values[self.indices] = local.evaluate(f)
+        if len(self.owners) > 0 or len(self.served_ranks) > 0:
+            comm = self.walker.comm
+            served_values = served.evaluate(f)
+            empty = np.empty(0, dtype=np.int32)
+            received = exchange(comm,
+                                [served_values[self.served_ranks.get(rank, empty)]
+                                 for rank in range(comm.size)],
+                                counts=[len(self.owners.get(rank, empty))
+                                        for rank in range(comm.size)])
+            for rank, indices in self.owners.items():
+                values[indices] = received[rank]
+        return values
+
+
+class _LocatedPoints(object):
+    def __init__(self, cells, reference_coordinates):
+        """Points located in the cells of this rank, for a
+        :class:`PointEvaluator`.
+
+        :arg cells: The cells containing the points.
+        :arg reference_coordinates: The reference coordinates of the
+            points in their cells.
+        """
+        self.cells = cells
+        self.reference_coordinates = reference_coordinates
+
+
+class PointEvaluator(object):
+    def __init__(self, V, location):
+        """Evaluate functions in a space at located points, by
+        precomputing the nodes and basis function values for each
+        point, so that evaluation is a gather and a weighted sum.
+
+        :arg V: The :class:`FunctionSpace`, which must have an identity
+            mapped element.
+        :arg location: The :class:`PointLocation` or
+            :class:`CellWalkLocation` of the points.
+        """
+        self.location = location
+        element = V.finat_element
+        if isinstance(element, TensorFiniteElement):
+            element = element.base_element
+        fiat_element = element.fiat_equivalent
+        X = location.reference_coordinates
+        tdim = X.shape[1]
+        # basis function values, with shape (npoints, nbasis)
+        if len(X) > 0:
+            self.weights = fiat_element.tabulate(0, X)[(0,)*tdim].T
+        else:
+            self.weights = np.zeros((0, fiat_element.space_dimension()))
+
+        cell_node_map = V.cell_node_map()
+        if V.extruded:
+            nlayers = V.mesh().layers - 1
+            base_cells, layers = np.divmod(location.cells, nlayers)
+            self.nodes = (cell_node_map.values_with_halo[base_cells]
+                          + np.outer(layers, cell_node_map.offset))
+        else:
+            self.nodes = cell_node_map.values_with_halo[location.cells]
+
+    @staticmethod
+    def supports(V):
+        """Can functions in V be evaluated by a :class:`PointEvaluator`?
+
+        :arg V: The :class:`FunctionSpace`.
+        """
+        return V.ufl_element().mapping() == "identity"
+
+    def evaluate(self, f):
+        """Evaluate a function at the points owned by this rank.
+
+        :arg f: The :class:`Function` to evaluate.
+        """
+        # include the halo values, as owned cells may use halo nodes
+        data = f.dat.data_ro_with_halos
+        return np.einsum("pi,pi...->p...", self.weights, data[self.nodes])
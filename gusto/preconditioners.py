@@ -18,6 +18,98 @@ from pyop2.utils import as_tuple
 __all__ = ["VerticalHybridizationPC"]
 
 
+class ColumnSolver(object):
+    """ A direct solver for a system on a vertical trace space, in which
+    each unknown is only coupled to the unknowns in its own column, on
+    its own and the adjacent levels. The system is then block tridiagonal
+    in each column, with one block per level, and all of the columns are
+    solved together with a block Thomas algorithm vectorised over the
+    columns.
+
+    :arg V: the trace :class:`.FunctionSpace`, which must be discontinuous
+            in the horizontal and continuous and linear in the vertical.
+    """
+
+    def __init__(self, V):
+
+        mesh = V.mesh()
+        if mesh.variable_layers:
+            raise NotImplementedError("The column solver is not implemented for variable layers")
+
+        # find the nodes in each column, ordered by level
+        cell_node_map = V.cell_node_map()
+        hdim = mesh._base_mesh.topological_dimension()
+        bottom = V.finat_element.entity_dofs()[(hdim, 0)][0]
+        nlevels = mesh.layers
+        levels = np.arange(nlevels).reshape(1, -1, 1)
+        values = cell_node_map.values[:, bottom]
+        offset = cell_node_map.offset[bottom]
+        self.nodes = values[:, None, :] + levels*offset[None, None, :]
+
+        # the column, level and horizontal index of each owned node
+        ncolumns, nlevels, nh = self.nodes.shape
+        nnodes = V.dof_dset.size
+        self.node_column = np.full(nnodes, -1, dtype=int)
+        self.node_level = np.zeros(nnodes, dtype=int)
+        self.node_h = np.zeros(nnodes, dtype=int)
+        self.node_column[self.nodes] = np.arange(ncolumns).reshape(-1, 1, 1)
+        self.node_level[self.nodes] = levels
+        self.node_h[self.nodes] = np.arange(nh).reshape(1, 1, -1)
+
+    def update(self, A):
+        """Extract the blocks of the system from an assembled matrix, and
+        factorise it.
+
+        :arg A: the assembled AIJ PETSc matrix.
+        """
+
+        ncolumns, nlevels, nh = self.nodes.shape
+        indptr, indices, data = A.getValuesCSR()
+        rstart, _ = A.getOwnershipRange()
+        rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+        cols = indices - rstart
+
+        # blocks[c, lev, k] is the block coupling level lev to level lev+k-1
+        bands = self.node_level[cols] - self.node_level[rows] + 1
+        column = self.node_column[rows]
+        if (np.any(column < 0) or np.any(column != self.node_column[cols])
+                or np.any(abs(bands - 1) > 1)):
+            raise ValueError("The system must only couple adjacent levels in the same column")
+        blocks = np.zeros((ncolumns, nlevels, 3, nh, nh))
+        blocks[column, self.node_level[rows], bands,
+               self.node_h[rows], self.node_h[cols]] = data
+
+        # LU factorise each column, storing the inverses of the pivot
+        # blocks and the multipliers of the eliminations
+        self.upper = blocks[:, :, 2]
+        self.multipliers = np.zeros((ncolumns, nlevels, nh, nh))
+        self.pivot_inverses = np.zeros((ncolumns, nlevels, nh, nh))
+        self.pivot_inverses[:, 0] = np.linalg.inv(blocks[:, 0, 1])
+        for lev in range(1, nlevels):
+            self.multipliers[:, lev] = np.matmul(blocks[:, lev, 0], self.pivot_inverses[:, lev-1])
+            self.pivot_inverses[:, lev] = np.linalg.inv(
+                blocks[:, lev, 1] - np.matmul(self.multipliers[:, lev], self.upper[:, lev-1]))
+
+    def solve(self, b, x):
+        """Solve the system in every column.
+
+        :arg b: the array of right hand side values at the owned nodes.
+        :arg x: the array to write the solution at the owned nodes into.
+        """
+
+        ncolumns, nlevels, nh = self.nodes.shape
+        y = b[self.nodes]
+        for lev in range(1, nlevels):
+            y[:, lev] -= np.einsum("cij,cj->ci", self.multipliers[:, lev], y[:, lev-1])
+
+        z = np.empty_like(y)
+        z[:, -1] = np.einsum("cij,cj->ci", self.pivot_inverses[:, -1], y[:, -1])
+        for lev in range(nlevels - 2, -1, -1):
+            r = y[:, lev] - np.einsum("cij,cj->ci", self.upper[:, lev], z[:, lev+1])
+            z[:, lev] = np.einsum("cij,cj->ci", self.pivot_inverses[:, lev], r)
+        x[self.nodes] = z
+
+
 class VerticalHybridizationPC(PCBase):
     """ A Slate-based python preconditioner for solving
     the hydrostatic pressure equation (after rewriting as
@@ -33,6 +125,10 @@ class VerticalHybridizationPC(PCBase):
     solver options. The original unknowns are recovered element-wise
     by solving local linear systems.
 
+    Since the multipliers are only coupled within each column, setting
+    the option ``vert_hybridization_column_solver`` instead solves
+    their system directly, with a :class:`ColumnSolver`.
+
     All elimination and recovery kernels are generated using
     the Slate DSL in Firedrake.
     """
@@ -215,17 +311,30 @@ class VerticalHybridizationPC(PCBase):
         Smat = self.S.petscmat
 
         nullspace = self.ctx.appctx.get("vert_trace_nullspace", None)
-        if nullspace is not None:
-            nsp = nullspace(Vv_tr)
-            Smat.setNullSpace(nsp.nullspace(comm=pc.comm))
-
-        # Set up the KSP for the system of Lagrange multipliers
-        trace_ksp = PETSc.KSP().create(comm=pc.comm)
-        trace_ksp.setOptionsPrefix(prefix)
-        trace_ksp.setOperators(Smat)
-        trace_ksp.setUp()
-        trace_ksp.setFromOptions()
-        self.trace_ksp = trace_ksp
+
+        if PETSc.Options().getBool(prefix + "column_solver", False):
+            # Solve the system for the Lagrange multipliers directly,
+            # column by column
+            if nullspace is not None:
+                raise NotImplementedError("The column solver is not implemented with a nullspace")
+            if mat_type != "aij":
+                raise ValueError("The column solver needs an aij matrix for the multipliers")
+            self.column_solver = ColumnSolver(Vv_tr)
+            self.column_solver.update(Smat)
+            self.trace_ksp = None
+        else:
+            if nullspace is not None:
+                nsp = nullspace(Vv_tr)
+                Smat.setNullSpace(nsp.nullspace(comm=pc.comm))
+
+            # Set up the KSP for the system of Lagrange multipliers
+            trace_ksp = PETSc.KSP().create(comm=pc.comm)
+            trace_ksp.setOptionsPrefix(prefix)
+            trace_ksp.setOperators(Smat)
+            trace_ksp.setUp()
+            trace_ksp.setFromOptions()
+            self.column_solver = None
+            self.trace_ksp = trace_ksp
 
         split_mixed_op = dict(split_form(Atilde.form))
         split_trace_op = dict(split_form(K.form))
@@ -302,6 +411,8 @@ class VerticalHybridizationPC(PCBase):
 
         self._assemble_S()
         self.S.force_evaluation()
+        if self.column_solver is not None:
+            self.column_solver.update(self.S.petscmat)
 
     def apply(self, pc, x, y):
         """We solve the forward eliminated problem for the
@@ -344,13 +455,17 @@ class VerticalHybridizationPC(PCBase):
 
         with timed_region("VertHybridSolve"):
             # Solve the system for the Lagrange multipliers
-            with self.schur_rhs.dat.vec_ro as b:
-                if self.trace_ksp.getInitialGuessNonzero():
-                    acc = self.trace_solution.dat.vec
-                else:
-                    acc = self.trace_solution.dat.vec_wo
-                with acc as x_trace:
-                    self.trace_ksp.solve(b, x_trace)
+            if self.column_solver is not None:
+                self.column_solver.solve(self.schur_rhs.dat.data_ro,
+                                         self.trace_solution.dat.data)
+            else:
+                with self.schur_rhs.dat.vec_ro as b:
+                    if self.trace_ksp.getInitialGuessNonzero():
+                        acc = self.trace_solution.dat.vec
+                    else:
+                        acc = self.trace_solution.dat.vec_wo
+                    with acc as x_trace:
+                        self.trace_ksp.solve(b, x_trace)
 
         # Reconstruct the unknowns
         self._reconstruct()
@@ -385,10 +500,13 @@ class VerticalHybridizationPC(PCBase):
         super(VerticalHybridizationPC, self).view(pc, viewer)
         viewer.pushASCIITab()
         viewer.printfASCII("Solves K * P^-1 * K.T using local eliminations.\n")
-        viewer.printfASCII("KSP solver for the multipliers:\n")
-        viewer.pushASCIITab()
-        self.trace_ksp.view(viewer)
-        viewer.popASCIITab()
+        if self.column_solver is not None:
+            viewer.printfASCII("Solving for the multipliers directly in each column.\n")
+        else:
+            viewer.printfASCII("KSP solver for the multipliers:\n")
+            viewer.pushASCIITab()
+            self.trace_ksp.view(viewer)
+            viewer.popASCIITab()
         viewer.printfASCII("Locally reconstructing the broken solutions from the multipliers.\n")
         viewer.pushASCIITab()
         viewer.printfASCII("Project the broken hdiv solution into the HDiv space.\n")
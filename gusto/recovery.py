@@ -1,13 +1,13 @@
 """
 The recovery operators used for lowest-order advection schemes.
 """
-from firedrake import (expression, function, Function, FunctionSpace, Projector,
+from firedrake import (expression, function, Function, FunctionSpace,
                        VectorFunctionSpace, SpatialCoordinate, as_vector,
                        dx, Interpolator, BrokenElement, interval, Constant,
                        TensorProductElement, FiniteElement, DirichletBC,
-                       VectorElement, conditional, max_value)
+                       VectorElement, TensorFunctionSpace, conditional, max_value)
 from firedrake.utils import cached_property
-from firedrake.parloops import par_loop, READ, INC, WRITE
+from firedrake.parloops import par_loop, READ, INC, WRITE, RW
 from gusto.configuration import logger
 from pyop2 import ON_TOP, ON_BOTTOM
 import ufl
@@ -137,7 +137,6 @@ class Boundary_Recoverer(object):
 
         self.v_DG1 = v_DG1
         self.v_CG1 = v_CG1
-        self.v_DG1_old = Function(v_DG1.function_space())
         self.coords_to_adjust = coords_to_adjust
 
         self.method = method
@@ -290,13 +289,15 @@ class Boundary_Recoverer(object):
                             end
                             """).format(**shapes)
 
-            elimin_domain = ("{{[i, ii_loop, jj_loop, kk, ll_loop, mm, iii_loop, kkk_loop, iiii, iiiii]: "
+            matrix_domain = ("{{[i, ii_loop, jj_loop, n, kk, ll_loop, mm, p, q, iii_loop, kkk_loop, iiii, jjjj, kkkk]: "
                              "0 <= i < {nDOFs} and 0 <= ii_loop < {nDOFs} and "
-                             "ii_loop + 1 <= jj_loop < {nDOFs} and ii_loop <= kk < {nDOFs} and "
-                             "ii_loop + 1 <= ll_loop < {nDOFs} and ii_loop <= mm < {nDOFs} + 1 and "
-                             "0 <= iii_loop < {nDOFs} and {nDOFs} - iii_loop <= kkk_loop < {nDOFs} + 1 and "
-                             "0 <= iiii < {nDOFs} and 0 <= iiiii < {nDOFs}}}").format(**shapes)
-            elimin_insts = ("""
+                             "ii_loop + 1 <= jj_loop < {nDOFs} and 0 <= n < {nDOFs} and "
+                             "ii_loop <= kk < {nDOFs} and ii_loop + 1 <= ll_loop < {nDOFs} and "
+                             "ii_loop <= mm < {nDOFs} and 0 <= p < {nDOFs} and "
+                             "0 <= q < {nDOFs} and 0 <= iii_loop < {nDOFs} and "
+                             "{nDOFs} - iii_loop <= kkk_loop < {nDOFs} and "
+                             "0 <= iiii < {nDOFs} and 0 <= jjjj < {nDOFs} and 0 <= kkkk < {nDOFs}}}").format(**shapes)
+            matrix_insts = ("""
                             <int> ii = 0
                             <int> jj = 0
                             <int> ll = 0
@@ -307,34 +308,46 @@ class Boundary_Recoverer(object):
                             <float64> temp_f = 0.0
                             <float64> temp_A = 0.0
                             <float64> c = 0.0
-                            <float64> f[{nDOFs}] = 0.0
-                            <float64> a[{nDOFs}] = 0.0
+                            <float64> f[{nDOFs},{nDOFs}] = 0.0
+                            <float64> a[{nDOFs},{nDOFs}] = 0.0
                             <float64> A[{nDOFs},{nDOFs}] = 0.0
+                            <float64> P[{nDOFs},{nDOFs}] = 0.0
                             """
-                            # We are aiming to find the vector a that solves A*a = f, for matrix A and vector f.
+                            # The recovered field values are P*a, where a solves A*a = f, f holds the original
+                            # field values and the rows of A and P are the Taylor expansion terms evaluated at the
+                            # effective and the actual coordinates. A and P only depend upon the coordinates, so
+                            # here we find the matrix P*A^-1, by solving A*a = f with f as the identity matrix.
                             # This is done by performing row operations (swapping and scaling) to obtain A in upper diagonal form.
                             # N.B. several for loops must be executed in numerical order (loopy does not necessarily do this).
                             # For these loops we must manually iterate the index.
                             """
                             if NUM_EXT[0] > 0.0
                             """
-                            # only do Gaussian elimination for elements with effective coordinates
+                            # only find the matrix for elements with effective coordinates
                             """
                                 for i
                             """
-                            # fill f with the original field values and A with the effective coordinate values
+                            # fill f with the identity matrix, A with the effective coordinate values and P with the actual coordinate values
                             """
-                                    f[i] = DG1_OLD[i]
+                                    f[i,i] = 1.0
                                     A[i,0] = 1.0
                                     A[i,1] = EFF_COORDS[i,0]
+                                    P[i,0] = 1.0
+                                    P[i,1] = ACT_COORDS[i,0]
                                     if {nDOFs} > 3
                                         A[i,2] = EFF_COORDS[i,1]
                                         A[i,3] = EFF_COORDS[i,0]*EFF_COORDS[i,1]
+                                        P[i,2] = ACT_COORDS[i,1]
+                                        P[i,3] = ACT_COORDS[i,0]*ACT_COORDS[i,1]
                                         if {nDOFs} > 7
                                             A[i,4] = EFF_COORDS[i,{dim}-1]
                                             A[i,5] = EFF_COORDS[i,0]*EFF_COORDS[i,{dim}-1]
                                             A[i,6] = EFF_COORDS[i,1]*EFF_COORDS[i,{dim}-1]
                                             A[i,7] = EFF_COORDS[i,0]*EFF_COORDS[i,1]*EFF_COORDS[i,{dim}-1]
+                                            P[i,4] = ACT_COORDS[i,{dim}-1]
+                                            P[i,5] = ACT_COORDS[i,0]*ACT_COORDS[i,{dim}-1]
+                                            P[i,6] = ACT_COORDS[i,1]*ACT_COORDS[i,{dim}-1]
+                                            P[i,7] = ACT_COORDS[i,0]*ACT_COORDS[i,1]*ACT_COORDS[i,{dim}-1]
                                         end
                                     end
                                 end
@@ -361,11 +374,13 @@ class Boundary_Recoverer(object):
                             """
                                     if i_max != ii
                             """
-                            # swap the elements of f
+                            # swap the rows of f
                             """
-                                        temp_f = f[ii]  {{id=set_temp_f, dep=*}}
-                                        f[ii] = f[i_max]  {{id=set_f_imax, dep=set_temp_f}}
-                                        f[i_max] = temp_f  {{id=set_f_ii, dep=set_f_imax}}
+                                        for n
+                                            temp_f = f[ii,n]  {{id=set_temp_f, dep=*}}
+                                            f[ii,n] = f[i_max,n]  {{id=set_f_imax, dep=set_temp_f}}
+                                            f[i_max,n] = temp_f  {{id=set_f_ii, dep=set_f_imax}}
+                                        end
                             """
                             # swap the elements of A
                             # N.B. kk runs from ii to (nDOFs-1) as elements below diagonal should be 0
@@ -392,53 +407,63 @@ class Boundary_Recoverer(object):
                                             for mm
                                                 A[ll, mm] = A[ll, mm] + c * A[ii,mm]
                                             end
-                                            f[ll] = f[ll] + c * f[ii]
+                                            for p
+                                                f[ll, p] = f[ll, p] + c * f[ii, p]
+                                            end
                                         end
                                         ll = ll + 1
                                     end
                                     ii = ii + 1
                                 end
                             """
-                            # do back substitution of upper diagonal A to obtain a
+                            # do back substitution of upper diagonal A to obtain a, for each column of f
                             """
-                                iii = 0
-                                for iii_loop
+                                for q
+                                    iii = 0
+                                    for iii_loop
                             """
                             # jjj starts at the bottom row and works upwards
                             """
-                                    jjj = {nDOFs} - iii - 1  {{id=assign_jjj, dep=*}}
-                                    a[jjj] = f[jjj]   {{id=set_a, dep=assign_jjj}}
-                                    for kkk_loop
-                                        a[jjj] = a[jjj] - A[jjj,kkk_loop] * a[kkk_loop]
+                                        jjj = {nDOFs} - iii - 1  {{id=assign_jjj, dep=*}}
+                                        a[jjj,q] = f[jjj,q]   {{id=set_a, dep=assign_jjj}}
+                                        for kkk_loop
+                                            a[jjj,q] = a[jjj,q] - A[jjj,kkk_loop] * a[kkk_loop,q]
+                                        end
+                                        a[jjj,q] = a[jjj,q] / A[jjj,jjj]
+                                        iii = iii + 1
                                     end
-                                    a[jjj] = a[jjj] / A[jjj,jjj]
-                                    iii = iii + 1
                                 end
                             """
-                            # Having found a, this gives us the coefficients for the Taylor expansion with the actual coordinates.
+                            # the matrix taking the original field values to the recovered ones is P*a
                             """
                                 for iiii
-                                    if {nDOFs} == 2
-                                        DG1[iiii] = a[0] + a[1]*ACT_COORDS[iiii,0]
-                                    elif {nDOFs} == 4
-                                        DG1[iiii] = a[0] + a[1]*ACT_COORDS[iiii,0] + a[2]*ACT_COORDS[iiii,1] + a[3]*ACT_COORDS[iiii,0]*ACT_COORDS[iiii,1]
-                                    elif {nDOFs} == 8
-                                        DG1[iiii] = a[0] + a[1]*ACT_COORDS[iiii,0] + a[2]*ACT_COORDS[iiii,1] + a[3]*ACT_COORDS[iiii,0]*ACT_COORDS[iiii,1] + a[4]*ACT_COORDS[iiii,{dim}-1] + a[5]*ACT_COORDS[iiii,0]*ACT_COORDS[iiii,{dim}-1] + a[6]*ACT_COORDS[iiii,1]*ACT_COORDS[iiii,{dim}-1] + a[7]*ACT_COORDS[iiii,0]*ACT_COORDS[iiii,1]*ACT_COORDS[iiii,{dim}-1]
+                                    for jjjj
+                                        MATRIX[0,iiii,jjjj] = sum(kkkk, P[iiii,kkkk]*a[kkkk,jjjj])
                                     end
                                 end
-                            """
-                            # if element is not external, just use old field values.
-                            """
-                            else
-                                for iiiii
-                                    DG1[iiiii] = DG1_OLD[iiiii]
-                                end
                             end
                             """).format(**shapes)
 
+            apply_domain = ("{{[i, j, k]: 0 <= i < {nDOFs} and 0 <= j < {nDOFs} and 0 <= k < {nDOFs}}}").format(**shapes)
+            apply_insts = ("""
+                           <float64> DG1_OLD[{nDOFs}] = 0.0
+                           """
+                           # if element is not external, just keep the old field values.
+                           """
+                           if NUM_EXT[0] > 0.0
+                               for i
+                                   DG1_OLD[i] = DG1[i]  {{id=copy_old}}
+                               end
+                               for j
+                                   DG1[j] = sum(k, MATRIX[0,j,k]*DG1_OLD[k])  {{dep=copy_old}}
+                               end
+                           end
+                           """).format(**shapes)
+
             _num_ext_kernel = (num_ext_domain, num_ext_instructions)
             _eff_coords_kernel = (coords_domain, coords_insts)
-            self._gaussian_elimination_kernel = (elimin_domain, elimin_insts)
+            _matrix_kernel = (matrix_domain, matrix_insts)
+            self._apply_kernel = (apply_domain, apply_insts)
 
             # find number of external DOFs per cell
             par_loop(_num_ext_kernel, dx,
@@ -455,6 +480,17 @@ class Boundary_Recoverer(object):
                       "EXT_V1": (self.coords_to_adjust, READ)},
                      is_loopy_kernel=True)
 
+            # the effective coordinates are fixed, so find the matrix
+            # giving the recovered values in each boundary cell once
+            VT = TensorFunctionSpace(mesh, "DG", 0, shape=(shapes["nDOFs"], shapes["nDOFs"]))
+            self.recovery_matrix = Function(VT)
+            par_loop(_matrix_kernel, dx,
+                     {"MATRIX": (self.recovery_matrix, WRITE),
+                      "ACT_COORDS": (self.act_coords, READ),
+                      "EFF_COORDS": (self.eff_coords, READ),
+                      "NUM_EXT": (self.num_ext, READ)},
+                     is_loopy_kernel=True)
+
         elif self.method == Boundary_Method.physics:
             top_bottom_domain = ("{[i]: 0 <= i < 1}")
             bottom_instructions = ("""
@@ -484,12 +520,9 @@ class Boundary_Recoverer(object):
                      is_loopy_kernel=True,
                      iterate=ON_TOP)
         else:
-            self.v_DG1_old.assign(self.v_DG1)
-            par_loop(self._gaussian_elimination_kernel, dx,
-                     {"DG1_OLD": (self.v_DG1_old, READ),
-                      "DG1": (self.v_DG1, WRITE),
-                      "ACT_COORDS": (self.act_coords, READ),
-                      "EFF_COORDS": (self.eff_coords, READ),
+            par_loop(self._apply_kernel, dx,
+                     {"DG1": (self.v_DG1, RW),
+                      "MATRIX": (self.recovery_matrix, READ),
                       "NUM_EXT": (self.num_ext, READ)},
                      is_loopy_kernel=True)
 
@@ -560,29 +593,28 @@ class Recoverer(object):
                                                                  method=Boundary_Method.dynamics)
                 else:
                     VuDG1 = VectorFunctionSpace(mesh, "DG", 1)
+                    VuCG1 = VectorFunctionSpace(mesh, "CG", 1)
+                    if self.V != VuCG1:
+                        raise NotImplementedError("This boundary recovery method requires v_out to be in vector CG1.")
                     coords_to_adjust = find_coords_to_adjust(V0, VuDG1)
 
                     # now, break the problem down into components
+                    # the scalar and vector spaces share their nodes, so
+                    # the components are copied pointwise rather than projected
                     v_scalars = []
-                    v_out_scalars = []
+                    self.v_out_scalars = []
                     self.boundary_recoverers = []
-                    self.project_to_scalars_CG = []
                     self.extra_averagers = []
-                    coords_to_adjust_list = []
                     for i in range(self.V.value_size):
                         v_scalars.append(Function(VDG1))
-                        v_out_scalars.append(Function(VCG1))
-                        coords_to_adjust_list.append(Function(VDG1).project(coords_to_adjust[i]))
-                        self.project_to_scalars_CG.append(Projector(self.v_out[i], v_out_scalars[i]))
-                        self.boundary_recoverers.append(Boundary_Recoverer(v_out_scalars[i], v_scalars[i],
+                        self.v_out_scalars.append(Function(VCG1))
+                        coords_to_adjust_i = Function(VDG1)
+                        coords_to_adjust_i.dat.data[:] = coords_to_adjust.dat.data_ro[:, i]
+                        self.boundary_recoverers.append(Boundary_Recoverer(self.v_out_scalars[i], v_scalars[i],
                                                                            method=Boundary_Method.dynamics,
-                                                                           coords_to_adjust=coords_to_adjust_list[i]))
+                                                                           coords_to_adjust=coords_to_adjust_i))
                         # need an extra averager that works on the scalar fields rather than the vector one
-                        self.extra_averagers.append(Averager(v_scalars[i], v_out_scalars[i]))
-
-                    # the boundary recoverer needs to be done on a scalar fields
-                    # so need to extract component and restore it after the boundary recovery is done
-                    self.project_to_vector = Projector(as_vector(v_out_scalars), self.v_out)
+                        self.extra_averagers.append(Averager(v_scalars[i], self.v_out_scalars[i]))
 
     def project(self):
         """
@@ -594,11 +626,11 @@ class Recoverer(object):
         self.averager.project()
         if self.boundary_method is not None:
             if self.V.value_size > 1:
-                for i in range(self.V.value_size):
-                    self.project_to_scalars_CG[i].project()
+                for i, v_out_scalar in enumerate(self.v_out_scalars):
+                    v_out_scalar.dat.data[:] = self.v_out.dat.data_ro[:, i]
                     self.boundary_recoverers[i].apply()
                     self.extra_averagers[i].project()
-                self.project_to_vector.project()
+                    self.v_out.dat.data[:, i] = v_out_scalar.dat.data_ro
             else:
                 self.boundary_recoverer.apply()
                 self.averager.project()
@@ -1,17 +1,26 @@
+from abc import ABCMeta, abstractmethod
 from os import path, makedirs
 import itertools
 from netCDF4 import Dataset
+from mpi4py import MPI
+from queue import Queue
+from threading import Thread
 import sys
 import time
 from gusto.diagnostics import Diagnostics, Perturbation, SteadyStateError
+from gusto.recovery import Recoverer, Boundary_Method
+from gusto import thermodynamics
 from firedrake import (FiniteElement, TensorProductElement, HDiv, DirichletBC,
                        FunctionSpace, MixedFunctionSpace, VectorFunctionSpace,
                        interval, Function, Mesh, functionspaceimpl,
                        File, SpatialCoordinate, sqrt, Constant, inner,
                        dx, op2, par_loop, READ, WRITE, DumbCheckpoint,
-                       FILE_CREATE, FILE_READ, interpolate, CellNormal, cross, as_vector)
+                       FILE_CREATE, FILE_READ, interpolate, CellNormal, cross, as_vector,
+                       BrokenElement)
+from firedrake.utils import cached_property
 import numpy as np
 from gusto.configuration import logger, set_log_handler
+from gusto.point_location import CellWalker, PointLocation, PointEvaluator
 
 __all__ = ["State"]
 
@@ -54,9 +63,260 @@ class FieldCreator(object):
         return iter(self.fields)
 
 
-class PointDataOutput(object):
-    def __init__(self, filename, ndt, field_points, description,
-                 field_creator, comm, create=True):
+class DerivedFields(object):
+    def __init__(self, state):
+        """Fields and expressions derived from the prognostic fields,
+        which are shared between the physics processes and the
+        diagnostic fields. A derived field is only recomputed when the
+        prognostic fields have been modified since it was last
+        computed, as recorded by :meth:`State.fields_updated`.
+
+        :arg state: The :class:`State`.
+        """
+        self.state = state
+        self._rho_version = None
+
+    def _version(self, name):
+        # also use the PyOP2 version of the data, if there is one, to
+        # catch modifications made outside of the timeloop
+        f = self.state.fields(name)
+        return (self.state.fields_version, getattr(f.dat, "dat_version", None))
+
+    @cached_property
+    def rho_averaged(self):
+        """The density, recovered into the potential temperature
+        space. Call :meth:`update_rho_averaged` before using it."""
+        state = self.state
+        space = state.fields("theta").function_space()
+        broken_space = FunctionSpace(state.mesh, BrokenElement(space.ufl_element()))
+        if state.vertical_degree == 0 and state.horizontal_degree == 0:
+            boundary_method = Boundary_Method.physics
+        else:
+            boundary_method = None
+        rho_averaged = Function(space)
+        self._rho_recoverer = Recoverer(state.fields("rho"), rho_averaged,
+                                        VDG=broken_space,
+                                        boundary_method=boundary_method)
+        return rho_averaged
+
+    def update_rho_averaged(self):
+        """Recover the density into the potential temperature space,
+        unless it has not changed since it was last recovered."""
+        rho_averaged = self.rho_averaged
+        version = self._version("rho")
+        if version != self._rho_version:
+            self._rho_recoverer.project()
+            self._rho_version = version
+        return rho_averaged
+
+    @cached_property
+    def r_v(self):
+        """The water vapour mixing ratio, or zero if there is none."""
+        try:
+            return self.state.fields("water_v")
+        except NotImplementedError:
+            return Constant(0.0)
+
+    @cached_property
+    def pi(self):
+        """The Exner pressure, from the recovered density."""
+        return thermodynamics.pi(self.state.parameters, self.rho_averaged,
+                                 self.state.fields("theta"))
+
+    @cached_property
+    def T(self):
+        """The temperature, from the recovered density."""
+        return thermodynamics.T(self.state.parameters, self.state.fields("theta"),
+                                self.pi, r_v=self.r_v)
+
+    @cached_property
+    def p(self):
+        """The pressure, from the recovered density."""
+        return thermodynamics.p(self.state.parameters, self.pi)
+
+
+class AsyncWriter(object):
+    def __init__(self, pool_size):
+        """Run file writes on a background thread, so that they overlap
+        with the timestepping. The fields for each write are first
+        copied into a set of buffers taken from a pool of pool_size
+        sets, which is returned to the pool once the write is done.
+        Submitting a write only blocks while every set of buffers is in
+        use.
+
+        Writes are done in the order in which they are submitted, so
+        collective writes must be submitted in the same order on every
+        rank.
+
+        :arg pool_size: The number of sets of buffers, which is the
+            maximum number of pending writes.
+        """
+        self.pool = Queue()
+        for _ in range(pool_size):
+            self.pool.put({})
+        self.tasks = Queue()
+        self.error = None
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            task, buffers = self.tasks.get()
+            try:
+                if task is None:
+                    return
+                if self.error is None:
+                    task()
+            except Exception as e:
+                self.error = e
+            finally:
+                if buffers is not None:
+                    self.pool.put(buffers)
+                self.tasks.task_done()
+
+    def _check(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise RuntimeError("Asynchronous output failed") from error
+
+    def submit(self, task, *functions, key=None):
+        """Snapshot functions and queue a write of them.
+
+        :arg task: A callable that does the write, taking the snapshots
+            of functions as its arguments.
+        :arg functions: The functions to snapshot.
+        :kwarg key: A hashable identifying the writer of the functions,
+            used to reuse the buffers of its earlier writes.
+        """
+        self._check()
+        # wait for a free set of buffers
+        buffers = self.pool.get()
+        snapshots = []
+        for i, f in enumerate(functions):
+            buf = buffers.get((key, i))
+            if buf is None or buf.function_space() != f.function_space():
+                buf = Function(f.function_space(), name=f.name())
+                buffers[(key, i)] = buf
+            buf.assign(f)
+            snapshots.append(buf)
+        self.tasks.put((lambda: task(*snapshots), buffers))
+
+    def flush(self):
+        """Wait for all pending writes to complete."""
+        self.tasks.join()
+        self._check()
+
+    def close(self):
+        """Complete all pending writes and stop the writer thread."""
+        self.tasks.put((None, None))
+        self.thread.join()
+        self._check()
+
+
+class AsyncFile(File):
+    def __init__(self, filename, writer, **kwargs):
+        """A :class:`firedrake.File` that is written by an
+        :class:`AsyncWriter`. The fields are copied when :meth:`write`
+        is called, and the copies are then written in the background.
+
+        :arg filename: The name of the output file (must end in .pvd).
+        :arg writer: The :class:`AsyncWriter`.
+        :kwarg kwargs: Further arguments to :class:`firedrake.File`.
+        """
+        super().__init__(filename, **kwargs)
+        self.writer = writer
+
+    def write(self, *functions, **kwargs):
+        """Copy the functions and queue a write of the copies.
+
+        :arg functions: The functions to write.
+        :kwarg kwargs: Further arguments to :meth:`firedrake.File.write`.
+        """
+        write = super().write
+        self.writer.submit(lambda *copies: write(*copies, **kwargs),
+                           *functions, key=self)
+
+
+class NetCDFOutput(object, metaclass=ABCMeta):
+    def __init__(self, filename, comm, buffer_size=1, writer=None):
+        """Base class for netCDF output appended along the time
+        dimension. On rank 0 the file is kept open for the whole run,
+        and records are buffered in memory so that they can be written
+        as one slab of buffer_size time levels.
+
+        :arg filename: The filename.
+        :arg comm: The communicator.
+        :kwarg buffer_size: The number of records to hold before
+            writing them to the file.
+        :kwarg writer: Optional :class:`AsyncWriter` to do the writes.
+        """
+        self.filename = filename
+        self.comm = comm
+        self.buffer_size = buffer_size
+        self.writer = writer
+        self.dataset = None
+        # time index of the first buffered record, found from the file
+        # when it is opened unless set here
+        self.idx = None
+        self.records = []
+
+    def append(self, record):
+        """Buffer a record, writing out the buffer once it is full.
+
+        :arg record: The record, as expected by :meth:`_write`.
+        """
+        if self.comm.rank == 0:
+            self.records.append(record)
+            if len(self.records) >= self.buffer_size:
+                self.flush()
+
+    def flush(self):
+        """Write out any buffered records."""
+        if self.comm.rank == 0 and len(self.records) > 0:
+            records, self.records = self.records, []
+            if self.writer is not None:
+                self.writer.submit(lambda: self._flush(records))
+            else:
+                self._flush(records)
+
+    def close(self):
+        """Write out any buffered records and close the file."""
+        self.flush()
+        if self.comm.rank == 0:
+            if self.writer is not None:
+                self.writer.submit(self._close)
+            else:
+                self._close()
+
+    def _flush(self, records):
+        if self.dataset is None:
+            self.dataset = Dataset(self.filename, "a")
+            if self.idx is None:
+                self.idx = self.dataset.dimensions["time"].size
+        self._write(self.dataset, self.idx, records)
+        self.idx += len(records)
+        self.dataset.sync()
+
+    def _close(self):
+        if self.dataset is not None:
+            self.dataset.close()
+            self.dataset = None
+
+    @abstractmethod
+    def _write(self, dataset, idx, records):
+        """Write records to the open dataset.
+
+        :arg dataset: The open :class:`netCDF4.Dataset`.
+        :arg idx: The time index of the first record.
+        :arg records: The list of buffered records.
+        """
+        pass
+
+
+class PointDataOutput(NetCDFOutput):
+    def __init__(self, filename, field_points, description,
+                 field_creator, comm, create=True, buffer_size=1,
+                 writer=None):
         """Create a dump file that stores fields evaluated at points.
 
         :arg filename: The filename.
@@ -65,12 +325,38 @@ class PointDataOutput(object):
         :arg field_creator: The field creator (only used to determine
             datatype and shape of fields).
         :kwarg create: If False, assume that filename already exists
+        :kwarg buffer_size: The number of dumps to hold before writing.
+        :kwarg writer: Optional :class:`AsyncWriter` to do the writes.
         """
-        # Overwrite on creation.
-        self.dump_count = 0
-        self.filename = filename
+        super().__init__(filename, comm, buffer_size=buffer_size,
+                         writer=writer)
+        # Overwrite on creation. On pickup the time index is read from
+        # the existing file, so that records are appended.
+        if create:
+            self.idx = 0
         self.field_points = field_points
-        self.comm = comm
+
+        # locate each set of points once, and make an evaluator for each
+        # space in which fields are evaluated at them. Fields that can't
+        # be evaluated this way fall back to Function.at.
+        locations = {}
+        evaluators = {}
+        walker = None
+        self.evaluators = []
+        for field_name, points in field_points:
+            V = field_creator(field_name).function_space()
+            if not (PointEvaluator.supports(V) and CellWalker.supports(V.mesh())):
+                self.evaluators.append(None)
+                continue
+            if id(points) not in locations:
+                if walker is None:
+                    walker = CellWalker(V.mesh())
+                locations[id(points)] = PointLocation(V, points, walker=walker)
+            key = (V, id(points))
+            if key not in evaluators:
+                evaluators[key] = PointEvaluator(V, locations[id(points)])
+            self.evaluators.append(evaluators[key])
+
         if not create:
             return
         if self.comm.rank == 0:
@@ -112,34 +398,63 @@ class PointDataOutput(object):
         :arg t: Simulation time at which dump occurs.
         """
 
-        val_list = []
-        for field_name, points in self.field_points:
-            val_list.append((field_name, np.asarray(field_creator(field_name).at(points))))
-
-        if self.comm.rank == 0:
-            with Dataset(self.filename, "a") as dataset:
-                # Add new time index
-                dataset.variables["time"][self.dump_count] = t
-                for field_name, vals in val_list:
-                    group = dataset.groups[field_name]
-                    var = group.variables[field_name]
-                    var[self.dump_count, :] = vals
-
-        self.dump_count += 1
-
+        # evaluate fields at the points owned by this rank, and gather
+        # them all onto rank 0 with a single reduction
+        shapes = []
+        local = []
+        for (field_name, points), evaluator in zip(self.field_points, self.evaluators):
+            if evaluator is None:
+                continue
+            f = field_creator(field_name)
+            shape = (evaluator.location.npoints,) + f.ufl_shape
+            vals = np.zeros(shape, dtype=f.dat.dtype)
+            vals[evaluator.location.indices] = evaluator.evaluate(f)
+            shapes.append(shape)
+            local.append(vals.ravel())
+        if len(local) > 0:
+            local = np.concatenate(local)
+            vals = np.zeros_like(local) if self.comm.rank == 0 else None
+            self.comm.Reduce(local, vals, op=MPI.SUM, root=0)
 
-class DiagnosticsOutput(object):
-    def __init__(self, filename, diagnostics, description, comm, create=True):
+        val_list = []
+        offset = 0
+        for (field_name, points), evaluator in zip(self.field_points, self.evaluators):
+            if evaluator is None:
+                val_list.append((field_name, np.asarray(field_creator(field_name).at(points))))
+                continue
+            shape = shapes.pop(0)
+            if self.comm.rank == 0:
+                size = np.prod(shape, dtype=int)
+                val_list.append((field_name, vals[offset:offset + size].reshape(shape)))
+                offset += size
+
+        self.append((t, val_list))
+
+    def _write(self, dataset, idx, records):
+        n = len(records)
+        # Add new time indices
+        dataset.variables["time"][idx:idx + n] = [t for t, _ in records]
+        for i, (field_name, _) in enumerate(self.field_points):
+            group = dataset.groups[field_name]
+            var = group.variables[field_name]
+            var[idx:idx + n, ...] = np.stack([val_list[i][1] for _, val_list in records])
+
+
+class DiagnosticsOutput(NetCDFOutput):
+    def __init__(self, filename, diagnostics, description, comm, create=True,
+                 buffer_size=1, writer=None):
         """Create a dump file that stores diagnostics.
 
         :arg filename: The filename.
         :arg diagnostics: The :class:`Diagnostics` object.
         :arg description: A description.
         :kwarg create: If False, assume that filename already exists
+        :kwarg buffer_size: The number of dumps to hold before writing.
+        :kwarg writer: Optional :class:`AsyncWriter` to do the writes.
         """
-        self.filename = filename
+        super().__init__(filename, comm, buffer_size=buffer_size,
+                         writer=writer)
         self.diagnostics = diagnostics
-        self.comm = comm
         if not create:
             return
         if self.comm.rank == 0:
@@ -162,21 +477,15 @@ class DiagnosticsOutput(object):
         :arg t: The current time.
         """
 
-        diagnostics = []
-        for fname in self.diagnostics.fields:
-            field = state.fields(fname)
-            for dname in self.diagnostics.available_diagnostics:
-                diagnostic = getattr(self.diagnostics, dname)
-                diagnostics.append((fname, dname, diagnostic(field)))
+        self.append((t, self.diagnostics.statistics(state)))
 
-        if self.comm.rank == 0:
-            with Dataset(self.filename, "a") as dataset:
-                idx = dataset.dimensions["time"].size
-                dataset.variables["time"][idx:idx + 1] = t
-                for fname, dname, value in diagnostics:
-                    group = dataset.groups[fname]
-                    var = group.variables[dname]
-                    var[idx:idx + 1] = value
+    def _write(self, dataset, idx, records):
+        n = len(records)
+        dataset.variables["time"][idx:idx + n] = [t for t, _ in records]
+        for i, (fname, dname, _) in enumerate(records[0][1]):
+            group = dataset.groups[fname]
+            var = group.variables[dname]
+            var[idx:idx + n] = [diagnostics[i][2] for _, diagnostics in records]
 
 
 class State(object):
@@ -257,6 +566,9 @@ class State(object):
 
         # Allocate state
         self._allocate_state()
+        self.fields_version = 0
+        self.reference_profiles_version = 0
+        self.derived_fields = DerivedFields(self)
         if self.output.dumplist is None:
             self.output.dumplist = fieldlist
         self.fields = FieldCreator(fieldlist, self.xn, self.output.dumplist)
@@ -271,6 +583,8 @@ class State(object):
             self.bcs.append(DirichletBC(V, 0.0, id))
 
         self.dumpfile = None
+        self.netcdf_outputs = []
+        self.writer = None
 
         # figure out if we're on a sphere
         try:
@@ -303,6 +617,10 @@ class State(object):
         #  Constant to hold current time
         self.t = Constant(0.0)
 
+        # Constant to hold the timestep, shared by all the forms that
+        # depend on it so that it can be changed during a run
+        self.dt = Constant(self.timestepping.dt)
+
         # setup logger
         logger.setLevel(output.log_level)
         set_log_handler(mesh.comm)
@@ -330,7 +648,8 @@ class State(object):
         self.diagnostic_fields = schedule
         for diagnostic in self.diagnostic_fields:
             diagnostic.setup(self)
-            self.diagnostics.register(diagnostic.name)
+            if diagnostic.is_output_to("diagnostics"):
+                self.diagnostics.register(diagnostic.name)
 
     def setup_dump(self, t, tmax, pickup=False):
         """
@@ -344,6 +663,9 @@ class State(object):
         otherwise dump and checkpoint to disk. (default is False).
         """
 
+        # the fields may have been set up since they were last used
+        self.fields_updated()
+
         if any([self.output.dump_vtus, self.output.dumplist_latlon,
                 self.output.dump_diagnostics, self.output.point_data,
                 self.output.checkpoint and not pickup]):
@@ -358,13 +680,15 @@ class State(object):
                     if not running_tests:
                         makedirs(self.dumpdir)
 
+        # the output files can be written in the background
+        if self.output.async_output:
+            self.writer = AsyncWriter(self.output.async_pool_size)
+
         if self.output.dump_vtus:
 
             # setup pvd output file
             outfile = path.join(self.dumpdir, "field_output.pvd")
-            self.dumpfile = File(
-                outfile, project_output=self.output.project_fields,
-                comm=self.mesh.comm)
+            self.dumpfile = self._vtu_file(outfile)
 
             # make list of fields to dump
             self.to_dump = [field for field in self.fields if field.dump]
@@ -377,9 +701,7 @@ class State(object):
         if len(self.output.dumplist_latlon) > 0:
             mesh_ll = get_latlon_mesh(self.mesh)
             outfile_ll = path.join(self.dumpdir, "field_output_latlon.pvd")
-            self.dumpfile_ll = File(outfile_ll,
-                                    project_output=self.output.project_fields,
-                                    comm=self.mesh.comm)
+            self.dumpfile_ll = self._vtu_file(outfile_ll)
 
             # make functions on latlon mesh, as specified by dumplist_latlon
             self.to_dump_latlon = []
@@ -391,6 +713,8 @@ class State(object):
                     val=f.topological, name=name+'_ll')
                 self.to_dump_latlon.append(field)
 
+        self.netcdf_outputs = []
+
         # we create new netcdf files to write to, unless pickup=True, in
         # which case we just need the filenames
         if self.output.dump_diagnostics:
@@ -399,17 +723,22 @@ class State(object):
                                                        self.diagnostics,
                                                        self.output.dirname,
                                                        self.mesh.comm,
-                                                       create=not pickup)
+                                                       create=not pickup,
+                                                       buffer_size=self.output.netcdf_buffer_size,
+                                                       writer=self.writer)
+            self.netcdf_outputs.append(self.diagnostic_output)
 
         if len(self.output.point_data) > 0:
             pointdata_filename = self.dumpdir+"/point_data.nc"
-            ndt = int(tmax/self.timestepping.dt)
-            self.pointdata_output = PointDataOutput(pointdata_filename, ndt,
+            self.pointdata_output = PointDataOutput(pointdata_filename,
                                                     self.output.point_data,
                                                     self.output.dirname,
                                                     self.fields,
                                                     self.mesh.comm,
-                                                    create=not pickup)
+                                                    create=not pickup,
+                                                    buffer_size=self.output.netcdf_buffer_size,
+                                                    writer=self.writer)
+            self.netcdf_outputs.append(self.pointdata_output)
 
         # if we want to checkpoint and are not picking up from a previous
         # checkpoint file, setup the dumb checkpointing
@@ -424,9 +753,25 @@ class State(object):
         if self.output.checkpoint:
             self.chkptcount = itertools.count()
 
+        # make diagnostic field counter, for diagnostic fields that
+        # are not computed at every dump
+        self.diagnosticcount = itertools.count()
+
         # dump initial fields
         self.dump(t)
 
+    def _vtu_file(self, filename):
+        # the vtu output interpolates to the output space, which is
+        # collective, so in parallel it can only be done on the writer
+        # thread if MPI allows calls from several threads at once
+        if self.writer is not None and (self.mesh.comm.size == 1
+                                        or MPI.Query_thread() == MPI.THREAD_MULTIPLE):
+            return AsyncFile(filename, self.writer,
+                             project_output=self.output.project_fields,
+                             comm=self.mesh.comm)
+        return File(filename, project_output=self.output.project_fields,
+                    comm=self.mesh.comm)
+
     def pickup_from_checkpoint(self):
         """
         :arg t: the current model time (default is zero).
@@ -440,6 +785,7 @@ class State(object):
                     chk.load(field)
                 t = chk.read_attribute("/", "time")
                 next(self.dumpcount)
+            self.fields_updated()
             # Setup new checkpoint
             self.chkpt = DumbCheckpoint(path.join(self.dumpdir, "chkpt"), mode=FILE_CREATE)
         else:
@@ -449,13 +795,25 @@ class State(object):
 
     def dump(self, t):
         """
-        Dump output
+        Dump output. With :attr:`.OutputParameters.async_output` set,
+        the diagnostics and the point data are still computed here, as
+        they are collective, but the resulting data and copies of the
+        fields are written to the netCDF and VTU files by a background
+        thread while the model continues to timestep. In parallel, the
+        VTU files are only written in the background if MPI was
+        initialised with MPI_THREAD_MULTIPLE. The checkpoint is always
+        written here: its HDF5 writes are collective, and wait for the
+        pending netCDF writes, as HDF5 must not be called from two
+        threads at once.
         """
         output = self.output
 
+        dump_vtus = output.dump_vtus and (next(self.dumpcount) % output.dumpfreq) == 0
+
         # Diagnostics:
-        # Compute diagnostic fields
-        for field in self.diagnostic_fields:
+        # Compute the diagnostic fields needed for this dump
+        for field in self.diagnostics_to_compute(next(self.diagnosticcount),
+                                                 dump_vtus):
             field(self)
 
         if output.dump_diagnostics:
@@ -468,11 +826,16 @@ class State(object):
 
         # Dump all the fields to the checkpointing file (backup version)
         if output.checkpoint and (next(self.chkptcount) % output.chkptfreq) == 0:
+            # bring the netcdf files up to date with the checkpoint
+            for netcdf_output in self.netcdf_outputs:
+                netcdf_output.flush()
+            if self.writer is not None:
+                self.writer.flush()
             for field in self.to_pickup:
                 self.chkpt.store(field)
             self.chkpt.write_attribute("/", "time", t)
 
-        if output.dump_vtus and (next(self.dumpcount) % output.dumpfreq) == 0:
+        if dump_vtus:
             # dump fields
             self.dumpfile.write(*self.to_dump)
 
@@ -480,6 +843,62 @@ class State(object):
             if len(output.dumplist_latlon) > 0:
                 self.dumpfile_ll.write(*self.to_dump_latlon)
 
+    def diagnostics_to_compute(self, count, dump_vtus):
+        """
+        Return the diagnostic fields to compute at a dump, in order of
+        evaluation. These are the fields that are due at this dump and
+        are written by one of its outputs, and the diagnostic fields
+        that they depend on.
+
+        A diagnostic field that is skipped keeps the value from the last
+        dump that computed it, so its :class:`.Function` is stale if it
+        is read outside of the output, for example by a physics scheme.
+        Such a field should be given outputs, or a frequency, for which
+        it is computed when it is needed.
+
+        :arg count: the number of this dump.
+        :arg dump_vtus: True if the vtu output is written at this dump.
+        """
+        output = self.output
+        to_output = []
+        if dump_vtus:
+            to_output.append(("vtu", set(f.name() for f in self.to_dump)
+                              | set(output.dumplist_latlon)))
+        if output.dump_diagnostics:
+            to_output.append(("diagnostics", set(self.diagnostics.fields)))
+        if len(output.point_data) > 0:
+            to_output.append(("point_data", set(name for name, _ in output.point_data)))
+
+        # walk the schedule backwards so that the fields needed by a
+        # diagnostic field are found before they are reached
+        needed = set()
+        for field in reversed(self.diagnostic_fields):
+            if field.name not in needed:
+                if field.frequency is not None and count % field.frequency != 0:
+                    continue
+                if not any(field.is_output_to(name) and field.name in names
+                           for name, names in to_output):
+                    continue
+                needed.add(field.name)
+            needed.update(field.required_fields)
+
+        return [field for field in self.diagnostic_fields if field.name in needed]
+
+    def close_output(self):
+        """
+        Complete any pending output at the end of a run, and close the
+        netcdf and checkpoint files.
+        """
+        for netcdf_output in self.netcdf_outputs:
+            netcdf_output.close()
+
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+        if self.output.checkpoint:
+            self.chkpt.close()
+
     def initialise(self, initial_conditions):
         """
         Initialise state variables
@@ -490,6 +909,7 @@ class State(object):
             f_init = getattr(self.fields, name)
             f_init.assign(ic)
             f_init.rename(name)
+        self.fields_updated()
 
     def set_reference_profiles(self, reference_profiles):
         """
@@ -501,6 +921,8 @@ class State(object):
             field = getattr(self.fields, name)
             ref = self.fields(name+'bar', field.function_space(), False)
             ref.interpolate(profile)
+        # the linear solvers rebuild their operators at the next solve
+        self.reference_profiles_version += 1
 
     def _build_spaces(self, mesh, vertical_degree, horizontal_degree, family):
         """
@@ -557,8 +979,50 @@ class State(object):
         self.xp = Function(W)
         self.xnp1 = Function(W)
         self.xrhs = Function(W)
-        self.xb = Function(W)  # store the old state for diagnostics
+        self._xb = None  # store the old state for diagnostics, see xb
         self.dy = Function(W)
+        # the advecting velocity, shared by the transport equations
+        self.ubar = Function(self.spaces("HDiv"))
+
+    @property
+    def xb(self):
+        """
+        The state at the start of the last timestep. This is only
+        allocated, and then kept up to date, once it has been asked for
+        (e.g. by a diagnostic field).
+        """
+        if self._xb is None:
+            self._xb = Function(self.W)
+            self._xb.assign(self.xn)
+        return self._xb
+
+    def update_ubar(self, xn, xnp1, alpha):
+        """
+        Set the shared advecting velocity ubar from the velocities in
+        xn and xnp1.
+
+        :arg xn: the state at the start of the timestep.
+        :arg xnp1: the current estimate of the state at the end of the
+        timestep.
+        :arg alpha: the off-centering parameter.
+        """
+        un = xn.split()[0]
+        unp1 = xnp1.split()[0]
+        self.ubar.assign(un + alpha*(unp1-un))
+
+    def fields_updated(self):
+        """
+        Record that the prognostic fields have been modified, so that
+        the derived fields are recomputed when they are next used.
+        """
+        self.fields_version += 1
+
+    def store_old_state(self):
+        """
+        Copy the current state into xb, if it is used.
+        """
+        if self._xb is not None:
+            self._xb.assign(self.xn)
 
 
 def get_latlon_mesh(mesh):
@@ -1,9 +1,14 @@
 from abc import ABCMeta, abstractmethod, abstractproperty
+from math import sqrt
+from firedrake import Function
 from pyop2.profiling import timed_stage
+from gusto.advection import ForwardEuler, NoAdvection, SemiLagrangian
 from gusto.configuration import logger
-from gusto.linear_solvers import IncompressibleSolver
+from gusto.diagnostics import CourantNumber, Diagnostics
+from gusto.linear_solvers import IncompressibleSolver, VerticalCompressibleSolver
 
-__all__ = ["CrankNicolson", "AdvectionDiffusion"]
+__all__ = ["CrankNicolson", "HEVI", "IMEXRungeKutta", "ARS232", "ARK2",
+           "AdvectionDiffusion"]
 
 
 class BaseTimestepper(object, metaclass=ABCMeta):
@@ -43,22 +48,65 @@ class BaseTimestepper(object, metaclass=ABCMeta):
         else:
             self.prescribed_fields = []
 
+        # the number of linear solves made by the semi implicit steps
+        self.linear_solves = 0
+
+        if state.timestepping.adaptive:
+            # the timestep is chosen from the Courant number, so use
+            # the CourantNumber diagnostic field if there is one, or
+            # else a private one that is not written to any output
+            courant = [f for f in state.diagnostic_fields
+                       if isinstance(f, CourantNumber)]
+            if len(courant) > 0:
+                self.courant = courant[0]
+            else:
+                self.courant = CourantNumber(outputs=())
+            # the timestep before it was shortened to finish at tmax
+            self.untruncated_dt = state.timestepping.dt
+
     @abstractproperty
     def passive_advection(self):
         """list of fields that are passively advected (and possibly diffused)"""
         pass
 
-    def _apply_bcs(self):
+    def _apply_bcs(self, x=None):
         """
-        Set the zero boundary conditions in the velocity.
+        Set the zero boundary conditions in the velocity of x, which
+        is state.xnp1 if not given.
         """
-        unp1 = self.state.xnp1.split()[0]
+        if x is None:
+            x = self.state.xnp1
+        unp1 = x.split()[0]
 
         bcs = self.state.bcs
 
         for bc in bcs:
             bc.apply(unp1)
 
+    def _increment_converged(self, x=None):
+        """
+        Returns True if the increment state.dy from the last linear solve
+        satisfies norm(dy_i) <= picard_rtol*norm(x_i) + picard_atol_i
+        for every field x_i of x, which is state.xnp1 if not given.
+        Always returns False if picard_rtol is None.
+        """
+        timestepping = self.state.timestepping
+        rtol = timestepping.picard_rtol
+        if rtol is None:
+            return False
+        if x is None:
+            x = self.state.xnp1
+        atol = timestepping.picard_atol
+        for name, dy, xi in zip(self.state.fieldlist,
+                                self.state.dy.split(), x.split()):
+            if isinstance(atol, dict):
+                atol_i = atol.get(name, 0.)
+            else:
+                atol_i = atol
+            if dy.dat.norm > rtol*xi.dat.norm + atol_i:
+                return False
+        return True
+
     def setup_timeloop(self, state, t, tmax, pickup):
         """
         Setup the timeloop by setting up diagnostics, dumping the fields and
@@ -73,6 +121,55 @@ class BaseTimestepper(object, metaclass=ABCMeta):
             state.setup_dump(t, tmax, pickup)
         return t
 
+    def update_dt(self, dt):
+        """
+        Change the timestep to dt. All of the forms refer to the shared
+        ``state.dt`` Constant, so the schemes only need to be told to
+        reassemble any operators that depend on it.
+        """
+        state = self.state
+        state.timestepping.dt = dt
+        state.dt.assign(dt)
+        for _, advection in self.advected_fields:
+            advection.update_dt()
+        for _, diffusion in self.diffused_fields:
+            diffusion.update_dt()
+
+    def adapt_dt(self, t, tmax):
+        """
+        Choose the timestep for the next step from the maximum Courant
+        number of the current state, so that it is close to the target
+        max_courant, within the bounds given in the timestepping
+        parameters. The final step is shortened to finish at tmax.
+        Returns the new timestep.
+        """
+        state = self.state
+        timestepping = state.timestepping
+        dt = timestepping.dt
+
+        if not self.courant._initialised:
+            self.courant.setup(state)
+            self.courant.field.dump = False
+        self.courant.compute(state)
+        courant = Diagnostics.max(self.courant.field)
+
+        if courant > 0.:
+            new_dt = dt*timestepping.max_courant/courant
+        else:
+            new_dt = dt*timestepping.max_dt_growth
+        new_dt = min(new_dt, dt*timestepping.max_dt_growth)
+        if timestepping.dt_max is not None:
+            new_dt = min(new_dt, timestepping.dt_max)
+        if timestepping.dt_min is not None:
+            new_dt = max(new_dt, timestepping.dt_min)
+        self.untruncated_dt = new_dt
+        new_dt = min(new_dt, tmax - t)
+
+        if new_dt > 0. and new_dt != dt:
+            logger.info("changing timestep from dt=%s to dt=%s, max Courant number %s" % (dt, new_dt, courant))
+            self.update_dt(new_dt)
+        return new_dt
+
     @abstractmethod
     def semi_implicit_step(self):
         """
@@ -92,6 +189,15 @@ class BaseTimestepper(object, metaclass=ABCMeta):
         t = self.setup_timeloop(state, t, tmax, pickup)
 
         dt = state.timestepping.dt
+        if state.timestepping.adaptive:
+            dt = self.adapt_dt(t, tmax)
+
+        # xnp1 holds the state at the end of the last step, so it only
+        # needs updating at the start of a step if xn has been changed
+        # since (by diffusion or physics), or on the first step
+        xn_modified = True
+        steps = 0
+        linear_solves = self.linear_solves
 
         while t < tmax - 0.5*dt:
             logger.info("at start of timestep, t=%s, dt=%s" % (t, dt))
@@ -99,39 +205,61 @@ class BaseTimestepper(object, metaclass=ABCMeta):
             t += dt
             state.t.assign(t)
 
-            state.xnp1.assign(state.xn)
+            if xn_modified:
+                state.xnp1.assign(state.xn)
 
             for name, evaluation in self.prescribed_fields:
                 state.fields(name).project(evaluation(t))
 
             self.semi_implicit_step()
+            steps += 1
 
+            if len(self.passive_advection) > 0:
+                # first computes ubar from state.xn and state.xnp1
+                state.update_ubar(state.xn, state.xnp1, state.timestepping.alpha)
             for name, advection in self.passive_advection:
                 field = getattr(state.fields, name)
-                # first computes ubar from state.xn and state.xnp1
-                advection.update_ubar(state.xn, state.xnp1, state.timestepping.alpha)
                 # advects a field from xn and puts result in xnp1
                 advection.apply(field, field)
 
-            state.xb.assign(state.xn)
+            state.store_old_state()
             state.xn.assign(state.xnp1)
+            state.fields_updated()
+            xn_modified = False
 
             with timed_stage("Diffusion"):
                 for name, diffusion in self.diffused_fields:
                     field = getattr(state.fields, name)
                     diffusion.apply(field, field)
+                    xn_modified = xn_modified or name in state.fieldlist
+                if len(self.diffused_fields) > 0:
+                    state.fields_updated()
 
+            # the physics processes do not modify the density, so the
+            # recovered density in state.derived_fields stays valid
             with timed_stage("Physics"):
                 for physics in self.physics_list:
                     physics.apply()
+                    xn_modified = True
 
             with timed_stage("Dump output"):
                 state.dump(t)
 
-        if state.output.checkpoint:
-            state.chkpt.close()
+            if state.timestepping.adaptive:
+                dt = self.adapt_dt(t, tmax)
+
+        # the last step may have been shortened to finish at tmax, so
+        # restore the timestep for any later run
+        if state.timestepping.adaptive and state.timestepping.dt != self.untruncated_dt:
+            self.update_dt(self.untruncated_dt)
+
+        state.close_output()
 
         logger.info("TIMELOOP complete. t=%s, tmax=%s" % (t, tmax))
+        if steps > 0:
+            logger.info("%s linear solves in %s steps, %s per step"
+                        % (self.linear_solves - linear_solves, steps,
+                           (self.linear_solves - linear_solves)/steps))
 
 
 class CrankNicolson(BaseTimestepper):
@@ -173,7 +301,9 @@ class CrankNicolson(BaseTimestepper):
         # list of fields that are advected as part of the nonlinear iteration
         self.active_advection = [(name, scheme) for name, scheme in advected_fields if name in state.fieldlist]
 
-        state.xb.assign(state.xn)
+    def update_dt(self, dt):
+        super().update_dt(dt)
+        self.linear_solver.update_dt()
 
     @property
     def passive_advection(self):
@@ -193,17 +323,20 @@ class CrankNicolson(BaseTimestepper):
             self.forcing.apply((1-alpha)*dt, state.xn, state.xn,
                                state.xstar, implicit=False)
 
+        converged = False
+        nsolves = 0
+
         for k in range(state.timestepping.maxk):
 
             with timed_stage("Advection"):
+                # first computes ubar from state.xn and state.xnp1
+                state.update_ubar(state.xn, state.xnp1, alpha)
                 for name, advection in self.active_advection:
-                    # first computes ubar from state.xn and state.xnp1
-                    advection.update_ubar(state.xn, state.xnp1, alpha)
                     # advects a field from xstar and puts result in xp
                     advection.apply(self.xstar_fields[name], self.xp_fields[name])
 
-            state.xrhs.assign(0.)  # xrhs is the residual which goes in the linear solve
-
+            # xrhs is the residual which goes in the linear solve, the
+            # forcing overwrites it so it does not need zeroing first
             for i in range(state.timestepping.maxi):
 
                 with timed_stage("Apply forcing terms"):
@@ -217,9 +350,328 @@ class CrankNicolson(BaseTimestepper):
                     self.linear_solver.solve()  # solves linear system and places result in state.dy
 
                 state.xnp1 += state.dy
+                nsolves += 1
+                self.linear_solves += 1
+
+                converged = self._increment_converged()
+                if converged:
+                    break
 
             self._apply_bcs()
 
+            if converged:
+                break
+
+        if state.timestepping.picard_rtol is not None:
+            logger.info("semi implicit step: %s outer iterations, %s linear solves, converged=%s"
+                        % (k+1, nsolves, converged))
+
+
+class IMEXRungeKutta(BaseTimestepper):
+    """
+    Base class for implicit-explicit additive Runge-Kutta
+    discretisations. The advection terms are treated explicitly, with
+    forward Euler evaluations of the equations of the advection schemes,
+    and the forcing terms implicitly. Each implicit stage makes maxi
+    calls of the linear solver, rather than the maxk*maxi calls of the
+    :class:`CrankNicolson` iteration.
+
+    The implicit tableau must be singly diagonally implicit, with its
+    diagonal entries equal to the timestepping parameter alpha, as this
+    is the implicit weight used by the linear solver.
+
+    The advection terms are evaluated with :class:`.ForwardEuler`
+    schemes built from the equations, solver parameters and limiters
+    of the supplied schemes, so subcycled and semi-Lagrangian schemes
+    are not supported. Nor are hydrostatic forcing terms, or sponge
+    terms unless the forcing is built with ``scale_sponge=True``, as
+    the forcing otherwise scales them for the Crank-Nicolson iteration
+    rather than by the stage coefficients.
+
+    :arg state: a :class:`.State` object
+    :arg advected_fields: iterable of ``(field_name, scheme)`` pairs
+        indicating the fields to advect, and the
+        :class:`~.Advection` to use.
+    :arg linear_solver: a :class:`.TimesteppingSolver` object
+    :arg forcing: a :class:`.Forcing` object
+    :arg diffused_fields: optional iterable of ``(field_name, scheme)``
+        pairs indictaing the fields to diffusion, and the
+        :class:`~.Diffusion` to use.
+    :arg physics_list: optional list of classes that implement `physics` schemes
+    :arg prescribed_fields: an order list of tuples, pairing a field name with a
+         function that returns the field as a function of time.
+    """
+
+    def __init__(self, state, advected_fields, linear_solver, forcing,
+                 diffused_fields=None, physics_list=None, prescribed_fields=None):
+
+        super().__init__(state, advected_fields, diffused_fields, physics_list, prescribed_fields)
+        self.linear_solver = linear_solver
+        self.forcing = forcing
+
+        if isinstance(self.linear_solver, IncompressibleSolver):
+            self.incompressible = True
+        else:
+            self.incompressible = False
+
+        if forcing.hydrostatic or (forcing.sponge and not forcing.scale_sponge):
+            raise NotImplementedError("%s does not support sponge or hydrostatic forcing terms"
+                                      % type(self).__name__)
+
+        a_explicit, b_explicit, a_implicit, b_implicit = self.tableaux
+        nstages = len(b_explicit)
+        alpha = state.timestepping.alpha
+        for i in range(nstages):
+            if a_implicit[i][i] != 0. and abs(a_implicit[i][i] - alpha) > 1.e-12:
+                raise ValueError("%s needs the timestepping parameter alpha to be %s"
+                                 % (type(self).__name__, a_implicit[i][i]))
+
+        # the stage values, and the tendencies multiplied by dt, which
+        # are only stored if they are used in a later stage or the update
+        W = state.W
+        self.x_stages = [Function(W) for i in range(nstages)]
+        self.explicit_tendencies = [
+            Function(W) if b_explicit[j] != 0. or any(a[j] != 0. for a in a_explicit[j+1:])
+            else None for j in range(nstages)]
+        self.implicit_tendencies = [
+            Function(W) if b_implicit[j] != 0. or any(a[j] != 0. for a in a_implicit[j+1:])
+            else None for j in range(nstages)]
+
+        # the explicit advection terms of the fields in the semi
+        # implicit step are evaluated with the equations of their schemes
+        self.active_advection = [
+            (state.fieldlist.index(name), self._forward_euler(scheme))
+            for name, scheme in advected_fields
+            if name in state.fieldlist and not isinstance(scheme, NoAdvection)]
+
+    def _forward_euler(self, scheme):
+        """
+        Return a :class:`.ForwardEuler` scheme that makes the same
+        discretisation of the advection terms as scheme.
+        """
+        if isinstance(scheme, SemiLagrangian):
+            raise ValueError("%s cannot use a semi-Lagrangian scheme for %s"
+                             % (type(self).__name__, scheme.field.name()))
+        if getattr(scheme, "max_courant", None) is not None or getattr(scheme, "ncycles", 1) > 1:
+            raise ValueError("%s cannot use a subcycled scheme for %s"
+                             % (type(self).__name__, scheme.field.name()))
+        if isinstance(scheme, ForwardEuler):
+            return scheme
+        return ForwardEuler(self.state, scheme.field, scheme.equation,
+                            solver_parameters=scheme.solver_parameters,
+                            limiter=scheme.limiter)
+
+    @abstractproperty
+    def tableaux(self):
+        """
+        The Butcher tableaux of the scheme as a tuple (a_explicit,
+        b_explicit, a_implicit, b_implicit), where the a are lists of
+        the rows of the coefficient matrices and the b are the weights.
+        """
+        pass
+
+    def update_dt(self, dt):
+        super().update_dt(dt)
+        self.linear_solver.update_dt()
+
+    @property
+    def passive_advection(self):
+        """
+        Advected fields that are not part of the semi implicit step are
+        passively advected
+        """
+        return [(name, scheme) for name, scheme in
+                self.advected_fields if name not in self.state.fieldlist]
+
+    def _explicit_tendency(self, x, tendency):
+        """
+        Evaluate dt times the advection terms at x and place them in
+        tendency.
+        """
+        state = self.state
+        alpha = state.timestepping.alpha
+        tendency.assign(0.)
+        x_split = x.split()
+        tendency_split = tendency.split()
+
+        # the advecting velocity is the velocity of x
+        state.update_ubar(x, x, alpha)
+        for i, advection in self.active_advection:
+            advection.apply(x_split[i], tendency_split[i])
+            tendency_split[i] -= x_split[i]
+
+    def semi_implicit_step(self):
+        state = self.state
+        dt = state.timestepping.dt
+        a_explicit, b_explicit, a_implicit, b_implicit = self.tableaux
+
+        nsolves = 0
+        converged = True
+
+        for i, x in enumerate(self.x_stages):
+
+            # the explicit part of the stage is put in xstar
+            state.xstar.assign(state.xn)
+            for j in range(i):
+                if a_explicit[i][j] != 0.:
+                    state.xstar += a_explicit[i][j]*self.explicit_tendencies[j]
+                if a_implicit[i][j] != 0.:
+                    state.xstar += a_implicit[i][j]*self.implicit_tendencies[j]
+            x.assign(state.xstar)
+
+            gamma = a_implicit[i][i]
+            implicit_tendency = self.implicit_tendencies[i]
+            if gamma != 0.:
+                for k in range(state.timestepping.maxi):
+
+                    with timed_stage("Apply forcing terms"):
+                        self.forcing.apply(gamma*dt, state.xstar, x,
+                                           state.xrhs, implicit=True,
+                                           incompressible=self.incompressible)
+
+                    state.xrhs -= x
+
+                    with timed_stage("Implicit solve"):
+                        self.linear_solver.solve()  # solves linear system and places result in state.dy
+
+                    x += state.dy
+                    nsolves += 1
+                    self.linear_solves += 1
+                    self._apply_bcs(x)
+
+                    converged = self._increment_converged(x)
+                    if converged:
+                        break
+
+                # the implicit tendency follows from the stage equation
+                if implicit_tendency is not None:
+                    implicit_tendency.assign(x)
+                    implicit_tendency -= state.xstar
+                    implicit_tendency /= gamma
+
+            elif implicit_tendency is not None:
+                with timed_stage("Apply forcing terms"):
+                    self.forcing.apply(dt, x, x, implicit_tendency, implicit=True)
+                implicit_tendency -= x
+
+            if self.explicit_tendencies[i] is not None:
+                with timed_stage("Advection"):
+                    self._explicit_tendency(x, self.explicit_tendencies[i])
+
+        state.xnp1.assign(state.xn)
+        for j in range(len(self.x_stages)):
+            if b_explicit[j] != 0.:
+                state.xnp1 += b_explicit[j]*self.explicit_tendencies[j]
+            if b_implicit[j] != 0.:
+                state.xnp1 += b_implicit[j]*self.implicit_tendencies[j]
+        self._apply_bcs()
+
+        if state.timestepping.picard_rtol is not None:
+            logger.info("semi implicit step: %s linear solves, converged=%s"
+                        % (nsolves, converged))
+
+
+class ARS232(IMEXRungeKutta):
+    """
+    The ARS(2,3,2) implicit-explicit Runge-Kutta scheme of Ascher, Ruuth
+    and Spiteri (1997), which is second order and makes two implicit
+    stage solves per step. It needs the timestepping parameter alpha to
+    be ``ARS232.gamma``.
+    """
+
+    gamma = 1. - 1./sqrt(2.)
+    delta = -2.*sqrt(2.)/3.
+
+    tableaux = ([[0., 0., 0.],
+                 [gamma, 0., 0.],
+                 [delta, 1. - delta, 0.]],
+                [0., 1. - gamma, gamma],
+                [[0., 0., 0.],
+                 [0., gamma, 0.],
+                 [0., 1. - gamma, gamma]],
+                [0., 1. - gamma, gamma])
+
+
+class ARK2(IMEXRungeKutta):
+    """
+    The ARK2 implicit-explicit Runge-Kutta scheme of Giraldo, Kelly and
+    Constantinescu (2013), which is second order and makes two implicit
+    stage solves per step. It needs the timestepping parameter alpha to
+    be ``ARK2.gamma``.
+    """
+
+    gamma = 1. - 1./sqrt(2.)
+    delta = 1./(2.*sqrt(2.))
+    a = (3. + 2.*sqrt(2.))/6.
+
+    tableaux = ([[0., 0., 0.],
+                 [2.*gamma, 0., 0.],
+                 [1. - a, a, 0.]],
+                [delta, delta, gamma],
+                [[0., 0., 0.],
+                 [gamma, gamma, 0.],
+                 [delta, delta, gamma]],
+                [delta, delta, gamma])
+
+
+class HEVI(IMEXRungeKutta):
+    """
+    This class implements a horizontally explicit, vertically implicit
+    (HEVI) discretisation of the compressible equations, as an
+    implicit-explicit Runge-Kutta scheme with the tableaux of
+    :class:`ARS232`. The forcing is split into its horizontal and
+    vertical parts with :meth:`.Forcing.directional_forcings`. The
+    advection terms and the horizontal forcing are treated explicitly,
+    and the vertical forcing, which holds the vertical acoustic and
+    gravity terms, implicitly with the column solves of a
+    :class:`.VerticalCompressibleSolver`, so that no globally coupled
+    system is solved. The sponge term, if there is one, is part of the
+    vertical forcing and so is also treated implicitly. Hydrostatic
+    forcing is not supported. It needs the timestepping parameter alpha
+    to be ``ARS232.gamma``.
+
+    :arg state: a :class:`.State` object
+    :arg advected_fields: iterable of ``(field_name, scheme)`` pairs
+        indicating the fields to advect, and the
+        :class:`~.Advection` to use.
+    :arg forcing: a :class:`.CompressibleForcing` object, from which
+        the horizontal and vertical forcings are built
+    :arg diffused_fields: optional iterable of ``(field_name, scheme)``
+        pairs indictaing the fields to diffusion, and the
+        :class:`~.Diffusion` to use.
+    :arg physics_list: optional list of classes that implement `physics` schemes
+    :arg prescribed_fields: an order list of tuples, pairing a field name with a
+         function that returns the field as a function of time.
+    :arg linear_solver: optional :class:`.VerticalCompressibleSolver`, if
+         not given then one is built with the moisture of the forcing.
+    """
+
+    tableaux = ARS232.tableaux
+
+    def __init__(self, state, advected_fields, forcing,
+                 diffused_fields=None, physics_list=None, prescribed_fields=None,
+                 linear_solver=None):
+
+        if linear_solver is None:
+            linear_solver = VerticalCompressibleSolver(state, moisture=forcing.moisture)
+
+        # each stage scales the whole vertical forcing, including the
+        # sponge term
+        self.horizontal_forcing, vertical_forcing = forcing.directional_forcings(scale_sponge=True)
+
+        super().__init__(state, advected_fields, linear_solver, vertical_forcing,
+                         diffused_fields, physics_list, prescribed_fields)
+
+    def _explicit_tendency(self, x, tendency):
+        """
+        Evaluate dt times the advection terms and the horizontal
+        forcing at x and place them in tendency.
+        """
+        super()._explicit_tendency(x, tendency)
+        with timed_stage("Apply forcing terms"):
+            self.horizontal_forcing.apply(self.state.timestepping.dt, tendency, x,
+                                          tendency, implicit=False)
+
 
 class AdvectionDiffusion(BaseTimestepper):
     """
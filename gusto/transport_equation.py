@@ -1,6 +1,6 @@
 from abc import ABCMeta, abstractmethod
 from enum import Enum
-from firedrake import (Function, TestFunction, TrialFunction, FacetNormal,
+from firedrake import (TestFunction, TrialFunction, FacetNormal,
                        dx, dot, grad, div, jump, avg, dS, dS_v, dS_h, inner,
                        ds_v, ds_t, ds_b, VectorElement, as_ufl,
                        outer, sign, cross, CellNormal, Constant,
@@ -115,15 +115,22 @@ class TransportEquation(object, metaclass=ABCMeta):
               None, "once" or "twice". Defaults to "once".
     :arg solver_params: (optional) dictionary of solver parameters to pass to the
                         linear solver.
+    :arg ubar: (optional) the advecting velocity. Defaults to the velocity
+               shared through the state, which is updated once per
+               iteration by the timestepper; any other velocity must be
+               updated by its owner.
     """
 
-    def __init__(self, state, V, *, ibp=IntegrateByParts.ONCE, solver_params=None):
+    def __init__(self, state, V, *, ibp=IntegrateByParts.ONCE, solver_params=None,
+                 ubar=None):
         self.state = state
         self.V = V
         self.ibp = ibp
 
-        # set up functions required for forms
-        self.ubar = Function(state.spaces("HDiv"))
+        if ubar is None:
+            self.ubar = state.ubar
+        else:
+            self.ubar = ubar
         self.test = TestFunction(V)
         self.trial = TrialFunction(V)
 
@@ -219,10 +226,13 @@ class AdvectionEquation(TransportEquation):
                         linear solver.
     :arg outflow: Boolean specifying whether advected quantity can be advected out
                   of domain.
+    :arg ubar: (optional) the advecting velocity, if not the shared one.
     """
     def __init__(self, state, V, *, ibp=IntegrateByParts.ONCE, equation_form="advective",
-                 vector_manifold=False, solver_params=None, outflow=False):
-        super().__init__(state=state, V=V, ibp=ibp, solver_params=solver_params)
+                 vector_manifold=False, solver_params=None, outflow=False,
+                 ubar=None):
+        super().__init__(state=state, V=V, ibp=ibp, solver_params=solver_params,
+                         ubar=ubar)
         if equation_form == "advective" or equation_form == "continuity":
             self.continuity = (equation_form == "continuity")
         else:
@@ -293,12 +303,14 @@ class EmbeddedDGAdvection(AdvectionEquation):
     :arg outflow: Boolean specifying whether advected quantity can be advected out of domain.
     :arg options: an instance of the AdvectionOptions class specifying which options to use
                   with the embedded DG scheme.
+    :arg ubar: (optional) the advecting velocity, if not the shared one.
     """
 
     def __init__(self, state, V, ibp=IntegrateByParts.ONCE,
                  equation_form="advective",
                  vector_manifold=False,
-                 solver_params=None, outflow=False, options=None):
+                 solver_params=None, outflow=False, options=None,
+                 ubar=None):
 
         if options is None:
             raise ValueError("Must provide an instance of the AdvectionOptions class")
@@ -314,7 +326,8 @@ class EmbeddedDGAdvection(AdvectionEquation):
                          equation_form=equation_form,
                          vector_manifold=vector_manifold,
                          solver_params=solver_params,
-                         outflow=outflow)
+                         outflow=outflow,
+                         ubar=ubar)
 
 
 class SUPGAdvection(AdvectionEquation):
@@ -381,9 +394,9 @@ class SUPGAdvection(AdvectionEquation):
             tau = supg_params.tau
             assert as_ufl(tau).ufl_shape == (dim, dim), "Provided tau has incorrect shape!"
         else:
-            # create tuple of default values of size dim
-            dt = state.timestepping.dt
-            default_vals = [supg_params.default*dt]*dim
+            # create tuple of default values of size dim, scaled
+            # by the state's dt Constant below
+            default_vals = [supg_params.default]*dim
             # check for directions is which the space is discontinuous
             # so that we don't apply supg in that direction
             if is_cg(V):
@@ -395,7 +408,7 @@ class SUPGAdvection(AdvectionEquation):
                             else 0. for i in range(dim)]
                 else:
                     raise ValueError("I don't know what to do with space %s" % space)
-            tau = Constant(tuple([
+            tau = state.dt*Constant(tuple([
                 tuple(
                     [vals[j] if i == j else 0. for i, v in enumerate(vals)]
                 ) for j in range(dim)])
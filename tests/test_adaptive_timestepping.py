@@ -0,0 +1,83 @@
+from gusto import *
+from firedrake import (PeriodicSquareMesh, exp, SpatialCoordinate, Constant,
+                       FunctionSpace, as_vector)
+
+
+def setup_gaussian(dirname):
+    n = 16
+    L = 1.
+    mesh = PeriodicSquareMesh(n, n, L)
+
+    fieldlist = ['u', 'D']
+    parameters = ShallowWaterParameters(H=1.0, g=1.0)
+    timestepping = TimesteppingParameters(dt=0.01, adaptive=True,
+                                          max_courant=0.5,
+                                          dt_min=0.005, dt_max=0.05)
+    output = OutputParameters(dirname=dirname+'/sw_plane_gaussian_adaptive')
+
+    state = State(mesh, horizontal_degree=1,
+                  family="BDM",
+                  timestepping=timestepping,
+                  output=output,
+                  parameters=parameters,
+                  fieldlist=fieldlist)
+
+    u0 = state.fields("u")
+    D0 = state.fields("D")
+    x, y = SpatialCoordinate(mesh)
+    H = Constant(state.parameters.H)
+    u0.project(as_vector([0.5, 0.0]))
+    D0.interpolate(H + 0.1*exp(-50*((x-0.5)**2 + (y-0.5)**2)))
+    V = FunctionSpace(mesh, "CG", 1)
+    f = state.fields("coriolis", V)
+    f.interpolate(Constant(1.))  # Coriolis frequency (1/s)
+
+    state.initialise([("u", u0), ("D", D0)])
+
+    ueqn = EmbeddedDGAdvection(state, u0.function_space(), options=EmbeddedDGOptions())
+    Deqn = AdvectionEquation(state, D0.function_space(), equation_form="continuity")
+    advected_fields = []
+    advected_fields.append(("u", SSPRK3(state, u0, ueqn)))
+    advected_fields.append(("D", SSPRK3(state, D0, Deqn)))
+
+    linear_solver = ShallowWaterSolver(state)
+
+    # Set up forcing
+    sw_forcing = ShallowWaterForcing(state)
+
+    # build time stepper
+    stepper = CrankNicolson(state, advected_fields, linear_solver,
+                            sw_forcing)
+
+    return stepper
+
+
+def test_adaptive_timestepping(tmpdir):
+    dirname = str(tmpdir)
+    stepper = setup_gaussian(dirname)
+    stepper.run(t=0, tmax=0.3)
+
+    state = stepper.state
+    dt = state.timestepping.dt
+    # the timestep should have changed from its initial value, without
+    # exceeding the upper bound, and the shared Constant should match
+    assert dt != 0.01
+    assert dt <= 0.05
+    assert float(state.dt) == dt
+    assert abs(float(state.t) - 0.3) < 1.e-10
+    # the shortened final step should not be kept as the timestep
+    assert dt == stepper.untruncated_dt
+    assert dt >= 0.005
+
+
+def test_adaptive_courant_not_output(tmpdir):
+    dirname = str(tmpdir)
+    stepper = setup_gaussian(dirname)
+    stepper.run(t=0, tmax=0.03)
+
+    state = stepper.state
+    # the Courant number used to choose dt is not added to the outputs
+    assert not any(isinstance(f, CourantNumber)
+                   for f in state.diagnostic_fields)
+    assert "CourantNumber" not in [f.name() for f in state.to_dump]
+    assert "CourantNumber" not in state.diagnostics.fields
@@ -201,6 +201,39 @@ def test_advection_embedded_dg(geometry, error, state, f_init, tmax, f_end):
     check_errors(f_end, error, end_fields, scalar_fields)
 
 
+@pytest.mark.parametrize("geometry", ["slice"])
+def test_advection_semi_lagrangian(geometry, error, state, f_init, tmax, f_end):
+    """
+    This tests the semi-Lagrangian advection scheme for scalar fields in
+    the DG space, and in the temperature space with the embedded DG
+    option, in slice geometry.
+    """
+    dgspace = state.spaces("DG")
+    fspace = state.spaces("HDiv_v")
+    dg_end = Function(dgspace).interpolate(f_end)
+    f_end = Function(fspace).interpolate(f_end)
+
+    # the slice is periodic in x, with length 1
+    periodic_lengths = (1., None)
+
+    f = state.fields("f_dg", dgspace)
+    f.interpolate(f_init)
+    eqn = AdvectionEquation(state, dgspace)
+    advected_fields = [("f_dg", SemiLagrangian(state, f, eqn,
+                                               periodic_lengths=periodic_lengths))]
+
+    f = state.fields("f_embedded", fspace)
+    f.interpolate(f_init)
+    eqn = EmbeddedDGAdvection(state, fspace,
+                              options=EmbeddedDGOptions(embedding_space=dgspace))
+    advected_fields.append(("f_embedded", SemiLagrangian(state, f, eqn,
+                                                         periodic_lengths=periodic_lengths)))
+
+    end_fields = run(state, advected_fields, tmax)
+    check_errors(dg_end, error, end_fields, ["f_dg"])
+    check_errors(f_end, error, end_fields, ["f_embedded"])
+
+
 @pytest.mark.parametrize("geometry", ["slice"])
 def test_advection_supg(geometry, error, state, f_init, tmax, f_end):
     """
@@ -1,11 +1,15 @@
 from gusto import *
 from firedrake import (PeriodicIntervalMesh, ExtrudedMesh,
                        SpatialCoordinate, exp, sin, Function, as_vector)
+from netCDF4 import Dataset
 import numpy as np
 import itertools
+from os import path
+import re
+import pytest
 
 
-def setup_sk(dirname):
+def setup_sk(dirname, netcdf_buffer_size, async_output):
     nlayers = 10  # horizontal layers
     columns = 30  # number of columns
     L = 1.e5
@@ -25,7 +29,9 @@ def setup_sk(dirname):
     fieldlist = ['u', 'rho', 'theta']
     timestepping = TimesteppingParameters(dt=dt)
     output = OutputParameters(dirname=dirname+"/sk_nonlinear", dumplist=['u'], dumpfreq=5, log_level=INFO,
-                              point_data=[('rho', points), ('u', points)])
+                              point_data=[('rho', points), ('u', points)],
+                              netcdf_buffer_size=netcdf_buffer_size,
+                              async_output=async_output)
     parameters = CompressibleParameters()
     diagnostic_fields = [CourantNumber()]
 
@@ -98,10 +104,27 @@ def setup_sk(dirname):
     return stepper, 2*dt
 
 
-def test_checkpointing(tmpdir):
+@pytest.mark.parametrize("netcdf_buffer_size, async_output",
+                         [(1, False), (4, False), (1, True)])
+def test_checkpointing(tmpdir, netcdf_buffer_size, async_output):
 
     dirname = str(tmpdir)
-    stepper, tmax = setup_sk(dirname)
+    stepper, tmax = setup_sk(dirname, netcdf_buffer_size, async_output)
     stepper.run(t=0., tmax=tmax)
     dt = stepper.state.timestepping.dt
     stepper.run(t=0, tmax=2*tmax+dt, pickup=True)
+
+    # the point data from the pickup run is appended to the records
+    # from the first run, rather than overwriting them
+    with Dataset(dirname+"/sk_nonlinear/point_data.nc", "r") as data:
+        times = data.variables["time"][:]
+    assert times[0] == 0.
+    assert (np.diff(times) >= 0.).all()
+    assert times[-1] == 2*tmax+dt
+
+    # every vtu listed in the pvd file has been written
+    with open(dirname+"/sk_nonlinear/field_output.pvd", "r") as pvd:
+        vtus = re.findall('file="([^"]*)"', pvd.read())
+    assert len(vtus) > 0
+    for vtu in vtus:
+        assert path.exists(path.join(dirname, "sk_nonlinear", vtu))
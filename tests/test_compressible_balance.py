@@ -1,14 +1,16 @@
 from gusto import *
-from firedrake import PeriodicIntervalMesh, ExtrudedMesh, Constant
+from firedrake import (PeriodicIntervalMesh, ExtrudedMesh, Constant, Function,
+                       errornorm, norm)
 from os import path
 from netCDF4 import Dataset
+import pytest
 
 # this tests the dry compressible hydrostatic balance, by setting up a vertical slice
 # with this initial procedure, before taking a few time steps and ensuring that
 # the resulting velocities are very small
 
 
-def setup_balance(dirname):
+def setup_balance(dirname, scheme):
 
     # set up grid and time stepping parameters
     dt = 1.
@@ -24,7 +26,10 @@ def setup_balance(dirname):
     mesh = ExtrudedMesh(m, layers=nlayers, layer_height=H/nlayers)
 
     fieldlist = ['u', 'rho', 'theta']
-    timestepping = TimesteppingParameters(dt=dt, maxk=4, maxi=1)
+    if scheme in ["ars232", "hevi"]:
+        timestepping = TimesteppingParameters(dt=dt, maxi=1, alpha=ARS232.gamma)
+    else:
+        timestepping = TimesteppingParameters(dt=dt, maxk=4, maxi=1)
     output = OutputParameters(dirname=dirname+'/dry_balance', dumpfreq=10, dumplist=['u'])
     parameters = CompressibleParameters()
     diagnostics = Diagnostics(*fieldlist)
@@ -71,29 +76,35 @@ def setup_balance(dirname):
                        ("rho", SSPRK3(state, rho0, rhoeqn)),
                        ("theta", SSPRK3(state, theta0, thetaeqn))]
 
-    # Set up linear solver
-    linear_solver = CompressibleSolver(state)
-
     # Set up forcing
     compressible_forcing = CompressibleForcing(state)
 
     # build time stepper
-    stepper = CrankNicolson(state, advected_fields, linear_solver,
-                            compressible_forcing)
+    if scheme == "hevi":
+        stepper = HEVI(state, advected_fields, compressible_forcing)
+    elif scheme == "ars232":
+        linear_solver = CompressibleSolver(state)
+        stepper = ARS232(state, advected_fields, linear_solver,
+                         compressible_forcing)
+    else:
+        linear_solver = CompressibleSolver(state)
+        stepper = CrankNicolson(state, advected_fields, linear_solver,
+                                compressible_forcing)
 
     return stepper, tmax
 
 
-def run_balance(dirname):
+def run_balance(dirname, scheme):
 
-    stepper, tmax = setup_balance(dirname)
+    stepper, tmax = setup_balance(dirname, scheme)
     stepper.run(t=0, tmax=tmax)
 
 
-def test_balance_setup(tmpdir):
+@pytest.mark.parametrize("scheme", ["crank_nicolson", "hevi", "ars232"])
+def test_balance_setup(tmpdir, scheme):
 
     dirname = str(tmpdir)
-    run_balance(dirname)
+    run_balance(dirname, scheme)
     filename = path.join(dirname, "dry_balance/diagnostics.nc")
     data = Dataset(filename, "r")
 
@@ -101,3 +112,33 @@ def test_balance_setup(tmpdir):
     umax = u.variables['max']
 
     assert umax[-1] < 1e-8
+
+
+def test_balance_solver_reuse(tmpdir):
+
+    m = PeriodicIntervalMesh(5, 2000.)
+    mesh = ExtrudedMesh(m, layers=10, layer_height=1000.)
+    fieldlist = ['u', 'rho', 'theta']
+    output = OutputParameters(dirname=str(tmpdir)+'/balance_solver')
+    state = State(mesh, vertical_degree=1, horizontal_degree=1,
+                  family="CG",
+                  timestepping=TimesteppingParameters(dt=1.),
+                  output=output,
+                  parameters=CompressibleParameters(),
+                  fieldlist=fieldlist)
+
+    Vt = state.spaces("HDiv_v")
+    Vr = state.spaces("DG")
+    balance_solver = HydrostaticBalanceSolver(state)
+
+    # a solver that is reused should give the same answer as a new one
+    for Tsurf, pi_boundary in [(300., 1.0), (280., 0.9)]:
+        theta = Function(Vt).interpolate(Constant(Tsurf))
+        rho = Function(Vr)
+        rho_expected = Function(Vr)
+        balance_solver.solve(theta, rho, pi_boundary=pi_boundary,
+                             solve_for_rho=True)
+        compressible_hydrostatic_balance(state, theta, rho_expected,
+                                         pi_boundary=pi_boundary,
+                                         solve_for_rho=True)
+        assert errornorm(rho, rho_expected) < 1e-10*norm(rho_expected)
@@ -0,0 +1,45 @@
+from gusto import *
+from firedrake import PeriodicSquareMesh
+
+
+def setup_state(dirname):
+    mesh = PeriodicSquareMesh(4, 4, 1.)
+    fieldlist = ['u', 'D']
+    timestepping = TimesteppingParameters(dt=0.1)
+    output = OutputParameters(dirname=dirname+'/diagnostic_scheduling',
+                              dumpfreq=5)
+    diagnostic_fields = [ShallowWaterKineticEnergy(),
+                         ShallowWaterPotentialEnergy(outputs=("vtu",)),
+                         Sum("ShallowWaterKineticEnergy",
+                             "ShallowWaterPotentialEnergy",
+                             outputs=("diagnostics",), frequency=2),
+                         VelocityX(outputs=())]
+    state = State(mesh, horizontal_degree=1, family="BDM",
+                  timestepping=timestepping, output=output,
+                  parameters=ShallowWaterParameters(H=1.),
+                  fieldlist=fieldlist,
+                  diagnostic_fields=diagnostic_fields)
+    state.setup_diagnostics()
+    state.setup_dump(0., 1.)
+    return state
+
+
+def test_diagnostic_scheduling(tmpdir):
+    state = setup_state(str(tmpdir))
+
+    def names(count, dump_vtus):
+        return set(f.name for f in state.diagnostics_to_compute(count, dump_vtus))
+
+    ke = "ShallowWaterKineticEnergy"
+    pe = "ShallowWaterPotentialEnergy"
+    total = ke+"_plus_"+pe
+
+    # the sum needs both energies, even when the vtus are not written
+    assert names(0, True) == {ke, pe, total}
+    assert names(2, False) == {ke, pe, total}
+    # the sum is only computed at every other dump
+    assert names(1, True) == {ke, pe}
+    assert names(1, False) == {ke}
+    # diagnostics with outputs=("vtu",) are not written to the netcdf file
+    assert pe not in state.diagnostics.fields
+    assert "VelocityX" not in state.diagnostics.fields
@@ -0,0 +1,62 @@
+from gusto import *
+from firedrake import (PeriodicSquareMesh, PeriodicIntervalMesh, ExtrudedMesh,
+                       SpatialCoordinate, sin, cos, as_vector)
+import numpy as np
+
+
+def test_fused_statistics(tmpdir):
+    mesh = PeriodicSquareMesh(8, 8, 1.)
+    fieldlist = ['u', 'D']
+    timestepping = TimesteppingParameters(dt=0.1)
+    output = OutputParameters(dirname=str(tmpdir)+'/diagnostics')
+    state = State(mesh, horizontal_degree=1, family="BDM",
+                  timestepping=timestepping, output=output,
+                  parameters=ShallowWaterParameters(H=1.),
+                  fieldlist=fieldlist)
+
+    x, y = SpatialCoordinate(mesh)
+    state.fields("u").project(as_vector([sin(2*np.pi*x), cos(2*np.pi*y)]))
+    state.fields("D").interpolate(1. + 0.1*sin(2*np.pi*x)*cos(2*np.pi*y))
+
+    diagnostics = state.diagnostics
+    for fname, dname, value in diagnostics.statistics(state):
+        expected = getattr(diagnostics, dname)(state.fields(fname))
+        if expected is None:
+            assert value is None
+        else:
+            assert np.isclose(value, float(expected)), (fname, dname)
+
+
+def test_shared_recovered_rho(tmpdir):
+    m = PeriodicIntervalMesh(10, 1000.)
+    mesh = ExtrudedMesh(m, layers=10, layer_height=100.)
+    fieldlist = ['u', 'rho', 'theta']
+    timestepping = TimesteppingParameters(dt=1.0)
+    output = OutputParameters(dirname=str(tmpdir)+'/diagnostics')
+    diagnostic_fields = [Temperature(), Pressure(), Theta_e()]
+    state = State(mesh, vertical_degree=1, horizontal_degree=1,
+                  family="CG", timestepping=timestepping, output=output,
+                  parameters=CompressibleParameters(),
+                  fieldlist=fieldlist,
+                  diagnostic_fields=diagnostic_fields)
+    state.fields("water_v", state.fields("theta").function_space())
+    state.setup_diagnostics()
+
+    # the recovered rho is shared by all of the diagnostics
+    rho_averaged = state.derived_fields.rho_averaged
+    for diagnostic in diagnostic_fields:
+        assert diagnostic.rho_averaged is rho_averaged
+
+    rho = state.fields("rho")
+    rho.assign(1.)
+    state.fields("theta").assign(300.)
+    state.fields_updated()
+    Temperature_1 = diagnostic_fields[0].compute(state).copy(deepcopy=True)
+    assert np.allclose(rho_averaged.dat.data_ro, 1.)
+
+    # the recovery is redone once the fields have been updated
+    rho.assign(2.)
+    state.fields_updated()
+    Temperature_2 = diagnostic_fields[0].compute(state)
+    assert np.allclose(rho_averaged.dat.data_ro, 2.)
+    assert not np.allclose(Temperature_1.dat.data_ro, Temperature_2.dat.data_ro)
@@ -0,0 +1,67 @@
+from gusto import *
+from firedrake import (PeriodicIntervalMesh, ExtrudedMesh, SpatialCoordinate,
+                       Function, LinearVariationalProblem,
+                       LinearVariationalSolver, exp, sin, as_vector, norm)
+import numpy as np
+import pytest
+
+
+def setup_sk(dirname):
+    nlayers = 10  # horizontal layers
+    columns = 30  # number of columns
+    L = 1.e5
+    m = PeriodicIntervalMesh(columns, L)
+
+    # build volume mesh
+    H = 1.0e4  # Height position of the model top
+    mesh = ExtrudedMesh(m, layers=nlayers, layer_height=H/nlayers)
+
+    fieldlist = ['u', 'rho', 'theta']
+    timestepping = TimesteppingParameters(dt=6.0)
+    output = OutputParameters(dirname=dirname+"/sk_forcing")
+    parameters = CompressibleParameters()
+
+    state = State(mesh, vertical_degree=1, horizontal_degree=1,
+                  family="CG",
+                  timestepping=timestepping,
+                  output=output,
+                  parameters=parameters,
+                  fieldlist=fieldlist)
+
+    u0 = state.fields("u")
+    rho0 = state.fields("rho")
+    theta0 = state.fields("theta")
+
+    g = parameters.g
+    N = parameters.N
+    x, z = SpatialCoordinate(mesh)
+    thetab = 300.*exp(N**2*z/g)
+    theta_b = Function(theta0.function_space()).interpolate(thetab)
+    rho_b = Function(rho0.function_space())
+    compressible_hydrostatic_balance(state, theta_b, rho_b)
+
+    theta0.interpolate(theta_b + 0.01*sin(np.pi*z/H)/(1 + (x - L/2)**2/5.e3**2))
+    rho0.assign(rho_b)
+    u0.project(as_vector([20.0, 0.0]))
+    state.initialise([('u', u0), ('rho', rho0), ('theta', theta0)])
+
+    return state
+
+
+@pytest.mark.parametrize("direct_mass_solve", [False, True])
+def test_forcing_mass_solver(tmpdir, direct_mass_solve):
+    state = setup_sk(str(tmpdir))
+    forcing = CompressibleForcing(state, direct_mass_solve=direct_mass_solve)
+
+    dt = state.timestepping.dt
+    x_out = Function(state.W)
+    forcing.apply(dt, state.xn, state.xn, x_out, implicit=False)
+    u_forced = Function(state.spaces("HDiv")).assign(x_out.split()[0] - state.xn.split()[0])
+
+    # the forcing solve as it was before the mass solver was chosen
+    uF = Function(state.spaces("HDiv"))
+    problem = LinearVariationalProblem(forcing.mass_term(), forcing.forcing_term(), uF,
+                                       bcs=state.bcs)
+    LinearVariationalSolver(problem, solver_parameters={"ksp_rtol": 1.e-12}).solve()
+
+    assert norm(u_forced - uF) < 1.e-6*norm(uF)
@@ -0,0 +1,116 @@
+from gusto import *
+from firedrake import (PeriodicIntervalMesh, ExtrudedMesh,
+                       SpatialCoordinate, exp, sin, Function)
+import numpy as np
+import pytest
+
+
+def setup_sk(dirname, frozen_operator):
+    nlayers = 10  # horizontal layers
+    columns = 30  # number of columns
+    L = 1.e5
+    m = PeriodicIntervalMesh(columns, L)
+    dt = 6.0
+
+    # build volume mesh
+    H = 1.0e4  # Height position of the model top
+    mesh = ExtrudedMesh(m, layers=nlayers, layer_height=H/nlayers)
+
+    fieldlist = ['u', 'rho', 'theta']
+    timestepping = TimesteppingParameters(dt=dt)
+    output = OutputParameters(dirname=dirname+"/sk_frozen", dump_vtus=False,
+                              dump_diagnostics=False, checkpoint=False)
+    parameters = CompressibleParameters()
+
+    state = State(mesh, vertical_degree=1, horizontal_degree=1,
+                  family="CG",
+                  timestepping=timestepping,
+                  output=output,
+                  parameters=parameters,
+                  fieldlist=fieldlist)
+
+    rho0 = state.fields("rho")
+    theta0 = state.fields("theta")
+
+    g = parameters.g
+    N = parameters.N
+    x, z = SpatialCoordinate(mesh)
+    thetab = 300.*exp(N**2*z/g)
+    theta_b = Function(theta0.function_space()).interpolate(thetab)
+    rho_b = Function(rho0.function_space())
+    compressible_hydrostatic_balance(state, theta_b, rho_b)
+
+    theta0.interpolate(theta_b)
+    rho0.assign(rho_b)
+    state.set_reference_profiles([('rho', rho_b),
+                                  ('theta', theta_b)])
+
+    linear_solver = CompressibleSolver(state, frozen_operator=frozen_operator)
+
+    # a right hand side in the theta field
+    theta_rhs = state.xrhs.split()[2]
+    theta_rhs.interpolate(sin(np.pi*z/H)*sin(2*np.pi*x/L))
+
+    return state, linear_solver, theta_b, rho_b
+
+
+def count_pc_updates(linear_solver):
+    """
+    Count the number of times that the SCPC preconditioner of the
+    hybridized solver is set up again after its first set up.
+    """
+    scpc = linear_solver.hybridized_solver.snes.ksp.pc.getPythonContext()
+    counter = {"updates": 0}
+    update = scpc.update
+
+    def counted_update(pc):
+        counter["updates"] += 1
+        return update(pc)
+
+    scpc.update = counted_update
+    return counter
+
+
+@pytest.mark.parametrize("frozen_operator", [False, True])
+def test_frozen_operator(tmpdir, frozen_operator):
+    state, linear_solver, theta_b, rho_b = setup_sk(str(tmpdir), frozen_operator)
+
+    linear_solver.solve()
+    dy0 = Function(state.dy).assign(state.dy)
+    counter = count_pc_updates(linear_solver)
+
+    # repeated solves reuse the frozen operator, and give the same
+    # result either way
+    for i in range(3):
+        linear_solver.solve()
+    if frozen_operator:
+        assert counter["updates"] == 0
+    assert np.allclose(state.dy.dat.data_ro[2], dy0.dat.data_ro[2])
+
+    # changing dt rebuilds the frozen operator once
+    counter["updates"] = 0
+    state.dt.assign(2*state.timestepping.dt)
+    linear_solver.update_dt()
+    for i in range(3):
+        linear_solver.solve()
+    if frozen_operator:
+        assert counter["updates"] == 1
+
+    # in either mode the solve uses the new dt, as a new solver does
+    dy1 = Function(state.dy).assign(state.dy)
+    CompressibleSolver(state, frozen_operator=frozen_operator).solve()
+    assert np.allclose(dy1.dat.data_ro[2], state.dy.dat.data_ro[2])
+    assert not np.allclose(dy1.dat.data_ro[2], dy0.dat.data_ro[2])
+
+    # and so does setting the reference profiles
+    counter["updates"] = 0
+    state.set_reference_profiles([('rho', rho_b),
+                                  ('theta', 1.01*theta_b)])
+    for i in range(3):
+        linear_solver.solve()
+    if frozen_operator:
+        assert counter["updates"] == 1
+    dy2 = Function(state.dy).assign(state.dy)
+    CompressibleSolver(state, frozen_operator=frozen_operator).solve()
+    assert np.allclose(dy2.dat.data_ro[2], state.dy.dat.data_ro[2])
+    assert not np.allclose(dy2.dat.data_ro[2], dy1.dat.data_ro[2])
@@ -0,0 +1,113 @@
+from gusto import *
+from firedrake import (PeriodicIntervalMesh, PeriodicRectangleMesh,
+                       ExtrudedMesh, SpatialCoordinate, Function, exp, sin,
+                       cos, as_vector, norm)
+import numpy as np
+import pytest
+
+
+def setup_eady(dirname):
+    columns = 10
+    nlayers = 5
+    H = 10000.
+    L = 1000000.
+    f = 1.e-04
+    m = PeriodicRectangleMesh(columns, 1, 2.*L, 1.e5, quadrilateral=True)
+    mesh = ExtrudedMesh(m, layers=nlayers, layer_height=H/nlayers)
+
+    fieldlist = ['u', 'p', 'b']
+    timestepping = TimesteppingParameters(dt=100.)
+    output = OutputParameters(dirname=dirname+"/eady_fused")
+    parameters = EadyParameters(H=H, L=L, f=f,
+                                deltax=2.*L/float(columns),
+                                deltaz=H/float(nlayers))
+
+    state = State(mesh, vertical_degree=1, horizontal_degree=1,
+                  family="RTCF",
+                  Coriolis=as_vector([0., 0., f*0.5]),
+                  timestepping=timestepping,
+                  output=output,
+                  parameters=parameters,
+                  fieldlist=fieldlist)
+
+    u0 = state.fields("u")
+    p0 = state.fields("p")
+    b0 = state.fields("b")
+    x, y, z = SpatialCoordinate(mesh)
+    u0.project(as_vector([10.*sin(np.pi*x/L), 5.*cos(np.pi*x/L), 0.]))
+    b0.interpolate((z - H/2)*parameters.Nsq + 1.e-3*sin(np.pi*z/H)*cos(np.pi*x/L))
+    p0.interpolate(0.5*parameters.Nsq*(z - H/2)**2)
+    state.initialise([('u', u0), ('p', p0), ('b', b0)])
+
+    return state
+
+
+def setup_moist_sk(dirname):
+    nlayers = 10
+    columns = 30
+    L = 1.e5
+    H = 1.0e4
+    m = PeriodicIntervalMesh(columns, L)
+    mesh = ExtrudedMesh(m, layers=nlayers, layer_height=H/nlayers)
+
+    fieldlist = ['u', 'rho', 'theta']
+    timestepping = TimesteppingParameters(dt=6.0)
+    output = OutputParameters(dirname=dirname+"/moist_fused")
+    parameters = CompressibleParameters()
+
+    state = State(mesh, vertical_degree=1, horizontal_degree=1,
+                  family="CG",
+                  timestepping=timestepping,
+                  output=output,
+                  parameters=parameters,
+                  fieldlist=fieldlist)
+
+    u0 = state.fields("u")
+    rho0 = state.fields("rho")
+    theta0 = state.fields("theta")
+    Vt = theta0.function_space()
+    water_v0 = state.fields("water_v", Vt)
+    water_c0 = state.fields("water_c", Vt)
+
+    g = parameters.g
+    N = parameters.N
+    x, z = SpatialCoordinate(mesh)
+    thetab = 300.*exp(N**2*z/g)
+    theta_b = Function(Vt).interpolate(thetab)
+    rho_b = Function(rho0.function_space())
+    compressible_hydrostatic_balance(state, theta_b, rho_b)
+
+    bubble = exp(-((x - L/2)**2 + (z - H/2)**2)/2.e3**2)
+    theta0.interpolate(theta_b + 0.5*bubble)
+    rho0.assign(rho_b)
+    u0.project(as_vector([20.0*sin(2*np.pi*x/L), 2.0*sin(np.pi*z/H)]))
+    water_v0.interpolate(0.01 + 0.005*bubble)
+    water_c0.interpolate(0.001*bubble)
+    state.initialise([('u', u0), ('rho', rho0), ('theta', theta0),
+                      ('water_v', water_v0), ('water_c', water_c0)])
+
+    return state
+
+
+def apply_forcing(state, forcing):
+    x_out = Function(state.W)
+    forcing.apply(state.timestepping.dt, state.xn, state.xn, x_out,
+                  implicit=False)
+    return x_out
+
+
+@pytest.mark.parametrize("setup, forcing_class, kwargs",
+                         [(setup_eady, EadyForcing, {}),
+                          (setup_moist_sk, CompressibleForcing,
+                           {"moisture": ["water_v", "water_c"]})])
+def test_fused_forcing(tmpdir, setup, forcing_class, kwargs):
+    state = setup(str(tmpdir))
+    x_separate = apply_forcing(state, forcing_class(state, **kwargs))
+    x_fused = apply_forcing(state, forcing_class(state, fused=True, **kwargs))
+
+    # every component, including those forced by the component terms,
+    # is the same from the single fused solve
+    for f_separate, f_fused, x in zip(x_separate.split(), x_fused.split(),
+                                      state.xn.split()):
+        change = norm(f_separate - x)
+        assert norm(f_separate - f_fused) <= 1.e-6*max(change, 1.e-12*norm(x))
@@ -1,9 +1,10 @@
 from gusto import *
 from firedrake import (SpatialCoordinate, PeriodicRectangleMesh,
                        ExtrudedMesh, Function)
+import pytest
 
 
-def setup_gw(dirname):
+def setup_gw(dirname, fused):
     nlayers = 10  # horizontal layers
     columns = 30  # number of columns
     L = 1.e5
@@ -44,14 +45,14 @@ def setup_gw(dirname):
                       ('b', b0)])
 
     # Set up forcing
-    forcing = IncompressibleForcing(state)
+    forcing = IncompressibleForcing(state, fused=fused)
 
     return state, forcing
 
 
-def run_gw_incompressible(dirname):
+def run_gw_incompressible(dirname, fused):
 
-    state, forcing = setup_gw(dirname)
+    state, forcing = setup_gw(dirname, fused)
     dt = state.timestepping.dt
     forcing.apply(dt, state.xn, state.xn, state.xn)
     u = state.xn.split()[0]
@@ -59,8 +60,9 @@ def run_gw_incompressible(dirname):
     return w
 
 
-def test_gw(tmpdir):
+@pytest.mark.parametrize("fused", [False, True])
+def test_gw(tmpdir, fused):
 
     dirname = str(tmpdir)
-    w = run_gw_incompressible(dirname)
+    w = run_gw_incompressible(dirname, fused)
     assert max(abs(w.dat.data.min()), w.dat.data.max()) < 3e-8
@@ -0,0 +1,133 @@
+from gusto import *
+from firedrake import (PeriodicIntervalMesh, ExtrudedMesh,
+                       SpatialCoordinate, exp, sin, Function, as_vector,
+                       norm)
+import numpy as np
+import pytest
+
+# this runs a short gravity wave slice, in a uniform horizontal flow,
+# with each of the compressible timesteppers and compares the result
+# with that of the Crank-Nicolson timestepper
+
+
+nsteps = 10
+
+
+def setup_gw(dirname, scheme):
+    nlayers = 10  # horizontal layers
+    columns = 30  # number of columns
+    L = 1.e5
+    m = PeriodicIntervalMesh(columns, L)
+    dt = 6.0
+
+    # build volume mesh
+    H = 1.0e4  # Height position of the model top
+    mesh = ExtrudedMesh(m, layers=nlayers, layer_height=H/nlayers)
+
+    fieldlist = ['u', 'rho', 'theta']
+    if scheme in ["ars232", "ark2", "hevi"]:
+        timestepping = TimesteppingParameters(dt=dt, maxi=2, alpha=ARS232.gamma)
+    else:
+        timestepping = TimesteppingParameters(dt=dt, maxk=4, maxi=1)
+    output = OutputParameters(dirname=dirname+"/gw_"+scheme, dump_vtus=False,
+                              dump_diagnostics=False, checkpoint=False)
+    parameters = CompressibleParameters()
+
+    state = State(mesh, vertical_degree=1, horizontal_degree=1,
+                  family="CG",
+                  timestepping=timestepping,
+                  output=output,
+                  parameters=parameters,
+                  fieldlist=fieldlist)
+
+    # Initial conditions
+    u0 = state.fields("u")
+    rho0 = state.fields("rho")
+    theta0 = state.fields("theta")
+
+    # spaces
+    Vu = u0.function_space()
+    Vt = theta0.function_space()
+    Vr = rho0.function_space()
+
+    g = parameters.g
+    N = parameters.N
+    x, z = SpatialCoordinate(mesh)
+    thetab = 300.*exp(N**2*z/g)
+
+    theta_b = Function(Vt).interpolate(thetab)
+    rho_b = Function(Vr)
+    compressible_hydrostatic_balance(state, theta_b, rho_b)
+
+    a = 5.0e3
+    deltaTheta = 1.0e-2
+    theta_pert = deltaTheta*sin(np.pi*z/H)/(1 + (x - L/2)**2/a**2)
+    theta0.interpolate(theta_b + theta_pert)
+    rho0.assign(rho_b)
+    u0.project(as_vector([20.0, 0.0]))
+
+    state.initialise([('u', u0),
+                      ('rho', rho0),
+                      ('theta', theta0)])
+    state.set_reference_profiles([('rho', rho_b),
+                                  ('theta', theta_b)])
+
+    # Set up advection schemes
+    ueqn = EulerPoincare(state, Vu)
+    rhoeqn = AdvectionEquation(state, Vr, equation_form="continuity")
+    thetaeqn = EmbeddedDGAdvection(state, Vt, equation_form="advective",
+                                   options=EmbeddedDGOptions())
+    advected_fields = [("u", ThetaMethod(state, u0, ueqn)),
+                       ("rho", SSPRK3(state, rho0, rhoeqn)),
+                       ("theta", SSPRK3(state, theta0, thetaeqn))]
+
+    compressible_forcing = CompressibleForcing(state)
+
+    if scheme == "ars232":
+        stepper = ARS232(state, advected_fields, CompressibleSolver(state),
+                         compressible_forcing)
+    elif scheme == "ark2":
+        stepper = ARK2(state, advected_fields, CompressibleSolver(state),
+                       compressible_forcing)
+    elif scheme == "hevi":
+        stepper = HEVI(state, advected_fields, compressible_forcing)
+    else:
+        stepper = CrankNicolson(state, advected_fields, CompressibleSolver(state),
+                                compressible_forcing)
+
+    return stepper, theta_b
+
+
+def run_gw(dirname, scheme):
+    stepper, theta_b = setup_gw(dirname, scheme)
+    state = stepper.state
+    theta_pert0 = Function(theta_b.function_space()).assign(state.fields("theta") - theta_b)
+    stepper.run(t=0, tmax=nsteps*state.timestepping.dt)
+    theta_pert = Function(theta_b.function_space()).assign(state.fields("theta") - theta_b)
+    return stepper, theta_pert0, theta_pert
+
+
+@pytest.mark.parametrize("scheme", ["ars232", "ark2", "hevi"])
+def test_gw_timesteppers(tmpdir, scheme):
+    dirname = str(tmpdir)
+    _, theta_pert0, theta_cn = run_gw(dirname, "cn")
+    stepper, _, theta_pert = run_gw(dirname, scheme)
+
+    # the perturbation is advected by the flow and disperses as gravity
+    # waves, and both timesteppers should agree on how it has changed
+    assert norm(theta_pert - theta_cn) < 0.05*norm(theta_cn - theta_pert0)
+
+    # two implicit stages per step, each of maxi linear solves, which
+    # are column solves for HEVI
+    maxi = stepper.state.timestepping.maxi
+    assert stepper.linear_solves == nsteps*2*maxi
+
+
+def test_imex_rejects_subcycling(tmpdir):
+    stepper, _ = setup_gw(str(tmpdir), "ars232")
+    state = stepper.state
+    rho0 = state.fields("rho")
+    rhoeqn = AdvectionEquation(state, rho0.function_space(), equation_form="continuity")
+    advected_fields = [("rho", SSPRK3(state, rho0, rhoeqn, subcycles=2))]
+    with pytest.raises(ValueError):
+        ARS232(state, advected_fields, stepper.linear_solver, stepper.forcing)
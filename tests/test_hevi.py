@@ -0,0 +1,196 @@
+from gusto import *
+from firedrake import (PeriodicIntervalMesh, ExtrudedMesh, SpatialCoordinate,
+                       Function, FunctionSpace, VectorFunctionSpace, Mesh,
+                       exp, sin, cos, as_vector, dot, norm, conditional)
+import numpy as np
+import pytest
+
+
+def setup_slice(dirname):
+    nlayers = 10
+    columns = 12
+    L = 1.e5
+    H = 1.0e4
+    m = PeriodicIntervalMesh(columns, L)
+    mesh = ExtrudedMesh(m, layers=nlayers, layer_height=H/nlayers)
+
+    fieldlist = ['u', 'rho', 'theta']
+    timestepping = TimesteppingParameters(dt=6.0, alpha=ARS232.gamma)
+    output = OutputParameters(dirname=dirname+"/hevi")
+    parameters = CompressibleParameters()
+
+    state = State(mesh, vertical_degree=1, horizontal_degree=1,
+                  family="CG",
+                  timestepping=timestepping,
+                  output=output,
+                  parameters=parameters,
+                  fieldlist=fieldlist)
+
+    u0 = state.fields("u")
+    rho0 = state.fields("rho")
+    theta0 = state.fields("theta")
+
+    x, z = SpatialCoordinate(mesh)
+    thetab = 300.*exp(parameters.N**2*z/parameters.g)
+    theta_b = Function(theta0.function_space()).interpolate(thetab)
+    rho_b = Function(rho0.function_space())
+    compressible_hydrostatic_balance(state, theta_b, rho_b)
+
+    theta0.interpolate(theta_b + 0.01*sin(np.pi*z/H)*cos(2*np.pi*x/L))
+    rho0.assign(rho_b)
+    u0.project(as_vector([20.0*sin(2*np.pi*x/L), 2.0*sin(np.pi*z/H)]))
+    state.initialise([('u', u0), ('rho', rho0), ('theta', theta0)])
+    state.set_reference_profiles([('rho', rho_b), ('theta', theta_b)])
+
+    return state, H, L
+
+
+def test_vertical_dofs(tmpdir):
+    state, H, L = setup_slice(str(tmpdir))
+    solver = VerticalCompressibleSolver(state)
+
+    x, z = SpatialCoordinate(state.mesh)
+    w = as_vector([0., z*(H - z)*(1. + 0.5*sin(2*np.pi*x/L))])
+    uh = as_vector([20.0*sin(2*np.pi*x/L), 0.])
+
+    # copying the vertical dofs of a vertical field gives the same field
+    # in the full velocity space
+    w_v = Function(state.spaces("Vv")).interpolate(w)
+    w_u = Function(state.spaces("HDiv"))
+    solver._copy_vertical(w_u, w_v)
+
+    w_expected = Function(state.spaces("HDiv")).interpolate(w)
+    assert norm(w_u - w_expected) < 1.e-10*norm(w_expected)
+
+    # and zeroing them leaves the horizontal part of a field
+    u = Function(state.spaces("HDiv")).interpolate(uh + w)
+    solver._zero_vertical(u)
+    u_expected = Function(state.spaces("HDiv")).interpolate(uh)
+    assert norm(u - u_expected) < 1.e-10*norm(u_expected)
+
+
+@pytest.mark.parametrize("fused", [False, True])
+def test_directional_forcing(tmpdir, fused):
+    state, _, _ = setup_slice(str(tmpdir))
+    forcing = CompressibleForcing(state, fused=fused)
+    horizontal_forcing, vertical_forcing = forcing.directional_forcings()
+
+    dt = state.timestepping.dt
+    x_full = Function(state.W)
+    forcing.apply(dt, state.xn, state.xn, x_full, implicit=False)
+
+    # the horizontal and vertical parts sum to the full forcing
+    x_split = Function(state.W)
+    horizontal_forcing.apply(dt, state.xn, state.xn, x_split, implicit=False)
+    vertical_forcing.apply(dt, x_split, state.xn, x_split, implicit=False)
+    u0 = state.xn.split()[0]
+    u_full = x_full.split()[0]
+    change = norm(u_full - u0)
+    assert norm(x_split.split()[0] - u_full) < 1.e-6*change
+
+    # and the vertical part only forces the vertical velocity
+    x_v = Function(state.W)
+    vertical_forcing.apply(dt, state.xn, state.xn, x_v, implicit=False)
+    uF_v = Function(state.spaces("HDiv")).assign(x_v.split()[0] - u0)
+    k = state.k
+    assert norm(uF_v - dot(uF_v, k)*k) < 1.e-6*norm(uF_v)
+
+
+def setup_mountain(dirname, scheme):
+    nlayers = 20
+    columns = 40
+    L = 32000.
+    H = 10000.
+    dt = 1.0
+    m = PeriodicIntervalMesh(columns, L)
+    ext_mesh = ExtrudedMesh(m, layers=nlayers, layer_height=H/nlayers)
+
+    # terrain following coordinates over a hill
+    Vc = VectorFunctionSpace(ext_mesh, "DG", 2)
+    x, z = SpatialCoordinate(ext_mesh)
+    a = 1000.
+    hm = 100.
+    zs = hm*a**2/((x - L/2)**2 + a**2)
+    mesh = Mesh(Function(Vc).interpolate(as_vector([x, z + ((H - z)/H)*zs])))
+
+    # sponge in the top 3km
+    x, z = SpatialCoordinate(mesh)
+    zc = H - 3000.
+    mu_top = conditional(z <= zc, 0.0, 0.03*sin((np.pi/2.)*(z - zc)/(H - zc))**2)
+    mu = Function(FunctionSpace(mesh, "DG", 2)).interpolate(mu_top)
+
+    fieldlist = ['u', 'rho', 'theta']
+    if scheme == "hevi":
+        timestepping = TimesteppingParameters(dt=dt, maxi=2, alpha=ARS232.gamma)
+    else:
+        timestepping = TimesteppingParameters(dt=dt, maxk=4, maxi=1)
+    output = OutputParameters(dirname=dirname+"/mountain_"+scheme, dump_vtus=False,
+                              dump_diagnostics=False, checkpoint=False)
+    parameters = CompressibleParameters()
+
+    state = State(mesh, vertical_degree=1, horizontal_degree=1,
+                  family="CG",
+                  sponge_function=mu,
+                  timestepping=timestepping,
+                  output=output,
+                  parameters=parameters,
+                  fieldlist=fieldlist)
+
+    u0 = state.fields("u")
+    rho0 = state.fields("rho")
+    theta0 = state.fields("theta")
+    Vu = u0.function_space()
+    Vt = theta0.function_space()
+    Vr = rho0.function_space()
+
+    theta_b = Function(Vt).interpolate(300.*exp(parameters.N**2*z/parameters.g))
+    rho_b = Function(Vr)
+    compressible_hydrostatic_balance(state, theta_b, rho_b)
+
+    theta0.assign(theta_b)
+    rho0.assign(rho_b)
+    u0.project(as_vector([10.0, 0.0]))
+    remove_initial_w(u0, state.Vv)
+
+    state.initialise([('u', u0), ('rho', rho0), ('theta', theta0)])
+    state.set_reference_profiles([('rho', rho_b), ('theta', theta_b)])
+
+    ueqn = EulerPoincare(state, Vu)
+    rhoeqn = AdvectionEquation(state, Vr, equation_form="continuity")
+    thetaeqn = EmbeddedDGAdvection(state, Vt, equation_form="advective",
+                                   options=EmbeddedDGOptions())
+    advected_fields = [("u", ThetaMethod(state, u0, ueqn)),
+                       ("rho", SSPRK3(state, rho0, rhoeqn)),
+                       ("theta", SSPRK3(state, theta0, thetaeqn))]
+
+    compressible_forcing = CompressibleForcing(state)
+    if scheme == "hevi":
+        stepper = HEVI(state, advected_fields, compressible_forcing)
+    else:
+        stepper = CrankNicolson(state, advected_fields, CompressibleSolver(state),
+                                compressible_forcing)
+    return stepper
+
+
+def test_hevi_mountain_sponge(tmpdir):
+    # flow over a hill on a terrain following mesh with a sponge layer,
+    # which HEVI treats implicitly as part of the vertical forcing
+    nsteps = 10
+    u = {}
+    for scheme in ["cn", "hevi"]:
+        stepper = setup_mountain(str(tmpdir), scheme)
+        state = stepper.state
+        u0 = Function(state.spaces("HDiv")).assign(state.fields("u"))
+        stepper.run(t=0, tmax=nsteps*state.timestepping.dt)
+        u[scheme] = Function(state.spaces("HDiv")).assign(state.fields("u"))
+
+    # both timesteppers agree on how the flow has changed
+    assert norm(u["hevi"] - u["cn"]) < 0.1*norm(u["cn"] - u0)
+
+
+def test_hevi_rejects_hydrostatic(tmpdir):
+    stepper = setup_mountain(str(tmpdir), "hevi")
+    state = stepper.state
+    state.hydrostatic = True
+    with pytest.raises(NotImplementedError):
+        HEVI(state, stepper.advected_fields, CompressibleForcing(state))
@@ -0,0 +1,49 @@
+from gusto.mass_solvers import LocalMassSolver
+from firedrake import (PeriodicIntervalMesh, ExtrudedMesh, SpatialCoordinate,
+                       FunctionSpace, VectorFunctionSpace, Function,
+                       TestFunction, TrialFunction, LinearVariationalProblem,
+                       LinearVariationalSolver, FacetNormal, inner, dot, jump,
+                       avg, dx, dS_v, dS_h, sin, cos, as_vector, errornorm)
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize("degree", [0, 1])
+@pytest.mark.parametrize("vector", [False, True])
+def test_local_mass_solver(degree, vector):
+    L = 1.e3
+    H = 1.e3
+    m = PeriodicIntervalMesh(10, L)
+    mesh = ExtrudedMesh(m, layers=5, layer_height=H/5)
+    x, z = SpatialCoordinate(mesh)
+    n = FacetNormal(mesh)
+
+    if vector:
+        V = VectorFunctionSpace(mesh, "DG", degree)
+        q = Function(V).interpolate(as_vector([sin(2*np.pi*x/L)*z,
+                                               cos(np.pi*z/H)]))
+        u = as_vector([1., 0.5])
+        flux = inner(jump(TestFunction(V)), avg(q))*dot(avg(u), n('+'))
+    else:
+        V = FunctionSpace(mesh, "DG", degree)
+        q = Function(V).interpolate(sin(2*np.pi*x/L)*z)
+        u = as_vector([1., 0.5])
+        flux = jump(TestFunction(V))*avg(q)*dot(avg(u), n('+'))
+
+    # a mass matrix and a right hand side with facet terms, as in the
+    # discontinuous Galerkin advection schemes
+    test = TestFunction(V)
+    a = inner(test, TrialFunction(V))*dx
+    rhs = inner(test, q)*dx - 0.1*flux*(dS_v + dS_h)
+
+    x_local = Function(V)
+    LocalMassSolver(a, rhs, x_local).solve()
+
+    x_global = Function(V)
+    problem = LinearVariationalProblem(a, rhs, x_global)
+    LinearVariationalSolver(problem, solver_parameters={"ksp_type": "cg",
+                                                        "ksp_rtol": 1.e-14,
+                                                        "pc_type": "bjacobi",
+                                                        "sub_pc_type": "ilu"}).solve()
+
+    assert errornorm(x_global, x_local) < 1.e-10*max(1., np.abs(x_global.dat.data_ro).max())
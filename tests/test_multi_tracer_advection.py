@@ -0,0 +1,72 @@
+from gusto import *
+from firedrake import (PeriodicSquareMesh, exp, SpatialCoordinate,
+                       FunctionSpace, as_vector, norm)
+import pytest
+
+
+def setup_tracers(dirname, together, embedded_dg=False):
+    mesh = PeriodicSquareMesh(16, 16, 1.)
+
+    fieldlist = ['u', 'D']
+    timestepping = TimesteppingParameters(dt=0.01)
+    output = OutputParameters(dirname=dirname+'/multi_tracer_advection')
+    state = State(mesh, horizontal_degree=1,
+                  family="BDM",
+                  timestepping=timestepping,
+                  output=output,
+                  parameters=ShallowWaterParameters(H=1.),
+                  fieldlist=fieldlist)
+
+    x, y = SpatialCoordinate(mesh)
+    u0 = state.fields("u")
+    u0.project(as_vector([1.0, 0.5]))
+    state.initialise([("u", u0)])
+
+    if embedded_dg:
+        V = FunctionSpace(mesh, "CG", 1)
+    else:
+        V = FunctionSpace(mesh, "DG", 1)
+    names = ["tracer0", "tracer1", "tracer2"]
+    for i, name in enumerate(names):
+        f = state.fields(name, V)
+        f.interpolate(exp(-50*((x-0.2-0.2*i)**2 + (y-0.5)**2)))
+
+    if together:
+        options = EmbeddedDGOptions() if embedded_dg else None
+        tracers = MultiTracerAdvection(state, names, options=options)
+        advected_fields = [(tracers.name, tracers)]
+    elif embedded_dg:
+        advected_fields = [(name, SSPRK3(state, state.fields(name),
+                                         EmbeddedDGAdvection(state, V, options=EmbeddedDGOptions())))
+                           for name in names]
+    else:
+        advected_fields = [(name, SSPRK3(state, state.fields(name),
+                                         AdvectionEquation(state, V)))
+                           for name in names]
+
+    stepper = AdvectionDiffusion(state, advected_fields)
+    return stepper, names
+
+
+@pytest.mark.parametrize("embedded_dg", [False, True])
+def test_multi_tracer_advection(tmpdir, embedded_dg):
+    dirname = str(tmpdir)
+    separate, names = setup_tracers(dirname+"/separate", False, embedded_dg)
+    separate.run(t=0, tmax=0.1)
+    together, _ = setup_tracers(dirname+"/together", True, embedded_dg)
+    together.run(t=0, tmax=0.1)
+
+    # the projection back from the embedding space is an iterative
+    # solve, which is for all of the fields together
+    tol = 1.e-5 if embedded_dg else 1.e-8
+    for name in names:
+        f_separate = separate.state.fields(name)
+        f_together = together.state.fields(name)
+        assert norm(f_separate - f_together) < tol*norm(f_separate)
+
+
+@pytest.mark.parametrize("options", [RecoveredOptions(), SUPGOptions()])
+def test_multi_tracer_advection_options(tmpdir, options):
+    stepper, names = setup_tracers(str(tmpdir), False)
+    with pytest.raises(NotImplementedError):
+        MultiTracerAdvection(stepper.state, names, options=options)
@@ -0,0 +1,71 @@
+from gusto import *
+from firedrake import (PeriodicSquareMesh, exp, SpatialCoordinate, Constant,
+                       FunctionSpace, as_vector)
+import pytest
+
+
+def setup_sw(dirname, picard_atol):
+    n = 16
+    L = 1.
+    mesh = PeriodicSquareMesh(n, n, L)
+
+    fieldlist = ['u', 'D']
+    parameters = ShallowWaterParameters(H=1.0, g=1.0)
+    timestepping = TimesteppingParameters(dt=0.01, maxk=8,
+                                          picard_rtol=1.e-6,
+                                          picard_atol=picard_atol)
+    output = OutputParameters(dirname=dirname+'/sw_picard', dump_vtus=False,
+                              dump_diagnostics=False, checkpoint=False)
+
+    state = State(mesh, horizontal_degree=1,
+                  family="BDM",
+                  timestepping=timestepping,
+                  output=output,
+                  parameters=parameters,
+                  fieldlist=fieldlist)
+
+    # the velocity starts from rest
+    u0 = state.fields("u")
+    D0 = state.fields("D")
+    x, y = SpatialCoordinate(mesh)
+    H = Constant(state.parameters.H)
+    u0.project(as_vector([0.0, 0.0]))
+    D0.interpolate(H + 0.1*exp(-50*((x-0.5)**2 + (y-0.5)**2)))
+    V = FunctionSpace(mesh, "CG", 1)
+    f = state.fields("coriolis", V)
+    f.interpolate(Constant(1.))
+
+    state.initialise([("u", u0), ("D", D0)])
+
+    ueqn = EmbeddedDGAdvection(state, u0.function_space(), options=EmbeddedDGOptions())
+    Deqn = AdvectionEquation(state, D0.function_space(), equation_form="continuity")
+    advected_fields = [("u", SSPRK3(state, u0, ueqn)),
+                       ("D", SSPRK3(state, D0, Deqn))]
+
+    linear_solver = ShallowWaterSolver(state)
+    sw_forcing = ShallowWaterForcing(state)
+
+    return CrankNicolson(state, advected_fields, linear_solver, sw_forcing)
+
+
+@pytest.mark.parametrize("picard_atol", [0., {"u": 1.e-8}])
+def test_increment_converged_zero_velocity(tmpdir, picard_atol):
+    stepper = setup_sw(str(tmpdir), picard_atol)
+    state = stepper.state
+
+    # a tiny increment in a velocity that is zero can only pass the
+    # test through the absolute floor
+    state.xnp1.assign(state.xn)
+    state.dy.assign(0.)
+    du, dD = state.dy.split()
+    du.dat.data[:] = 1.e-12
+
+    assert stepper._increment_converged() == (picard_atol != 0.)
+
+
+def test_picard_converges_from_rest(tmpdir):
+    stepper = setup_sw(str(tmpdir), {"u": 1.e-8, "D": 1.e-8})
+    stepper.run(t=0, tmax=0.01)
+
+    # the iterations converge without the velocity blocking the test
+    assert stepper._increment_converged()
@@ -0,0 +1,37 @@
+from gusto.point_location import PointLocation, PointEvaluator
+from firedrake import (PeriodicIntervalMesh, ExtrudedMesh, SpatialCoordinate,
+                       FunctionSpace, VectorFunctionSpace, Function, sin,
+                       cos, as_vector)
+import numpy as np
+import itertools
+import pytest
+
+
+@pytest.mark.parametrize("family, degree", [("CG", 1), ("CG", 2), ("DG", 1)])
+@pytest.mark.parametrize("vector", [False, True])
+def test_point_evaluator(family, degree, vector):
+    L = 1.e3
+    H = 1.e3
+    m = PeriodicIntervalMesh(10, L)
+    mesh = ExtrudedMesh(m, layers=5, layer_height=H/5)
+    x, z = SpatialCoordinate(mesh)
+
+    if vector:
+        V = VectorFunctionSpace(mesh, family, degree)
+        expr = as_vector([sin(2*np.pi*x/L)*z, cos(np.pi*z/H)])
+    else:
+        V = FunctionSpace(mesh, family, degree)
+        expr = sin(2*np.pi*x/L)*z
+    f = Function(V).interpolate(expr)
+
+    points_x = [0.1*L, 0.33*L, 0.5*L, 0.87*L]
+    points_z = [0.05*H, 0.5*H, 0.71*H]
+    points = np.array([p for p in itertools.product(points_x, points_z)])
+
+    location = PointLocation(V, points)
+    evaluator = PointEvaluator(V, location)
+    vals = np.zeros((len(points),) + f.ufl_shape)
+    vals[location.indices] = evaluator.evaluate(f)
+    mesh.comm.Allreduce(vals.copy(), vals)
+
+    assert np.allclose(vals, np.asarray(f.at(points)))
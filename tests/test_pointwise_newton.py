@@ -0,0 +1,69 @@
+from gusto.initialisation_tools import PointwiseNewtonSolver
+from firedrake import (UnitSquareMesh, SpatialCoordinate, FunctionSpace,
+                       Function, exp)
+import numpy as np
+import pytest
+
+
+def setup_fields(n):
+    mesh = UnitSquareMesh(4, 4)
+    x, y = SpatialCoordinate(mesh)
+    V = FunctionSpace(mesh, "CG", 2)
+    a = Function(V).interpolate(1. + x + 2*y)
+    b = Function(V).interpolate(0.5 - x*y)
+    fields = [Function(V).assign(1.) for i in range(n)]
+    return a, b, fields
+
+
+def test_pointwise_newton_jacobian():
+    a, b, (u, v) = setup_fields(2)
+    u.interpolate(1. + 0.5*a)
+    v.interpolate(0.3 + 0.1*b)
+    u0 = u.dat.data_ro.copy()
+    v0 = v.dat.data_ro.copy()
+
+    def residual(u, v):
+        return [u*u*v - a, exp(v) + u - b]
+
+    # a single step should be the Newton step with the exact Jacobian
+    PointwiseNewtonSolver(residual, [u, v], max_count=1).solve()
+
+    av = a.dat.data_ro
+    bv = b.dat.data_ro
+    R = np.array([u0*u0*v0 - av, np.exp(v0) + u0 - bv])
+    J = np.array([[2*u0*v0, u0*u0],
+                  [np.ones_like(u0), np.exp(v0)]])
+    du = np.linalg.solve(J.transpose(2, 0, 1), R.T[..., None])[..., 0]
+
+    assert np.allclose(u.dat.data_ro, u0 - du[:, 0], rtol=1.e-12, atol=1.e-12)
+    assert np.allclose(v.dat.data_ro, v0 - du[:, 1], rtol=1.e-12, atol=1.e-12)
+
+
+@pytest.mark.parametrize("n", [1, 2])
+def test_pointwise_newton_convergence(n):
+    a, b, fields = setup_fields(n)
+
+    if n == 1:
+        # u = sqrt(a)
+        def residual(u):
+            return [u*u - a]
+        expected = [np.sqrt(a.dat.data_ro)]
+    else:
+        # u*v = a and u - v = b
+        def residual(u, v):
+            return [u*v - a, u - v - b]
+        av = a.dat.data_ro
+        bv = b.dat.data_ro
+        u = 0.5*(bv + np.sqrt(bv**2 + 4*av))
+        expected = [u, u - bv]
+
+    PointwiseNewtonSolver(residual, fields, max_count=20).solve()
+
+    for f, f_expected in zip(fields, expected):
+        assert np.allclose(f.dat.data_ro, f_expected, rtol=1.e-12)
+
+
+def test_pointwise_newton_three_unknowns():
+    a, b, fields = setup_fields(3)
+    with pytest.raises(NotImplementedError):
+        PointwiseNewtonSolver(lambda u, v, w: [u, v, w], fields)
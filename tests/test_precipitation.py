@@ -83,6 +83,9 @@ def setup_fallout(dirname):
 def run_fallout(dirname):
 
     stepper, tmax = setup_fallout(dirname)
+    # the rain is advected by the rainfall velocity
+    fallout = stepper.physics_list[0]
+    assert fallout.advection_method.ubar is fallout.v
     stepper.run(t=0, tmax=tmax)
 
 
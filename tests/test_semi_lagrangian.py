@@ -0,0 +1,178 @@
+from gusto import *
+from gusto.configuration import logger
+from firedrake import (PeriodicIntervalMesh, ExtrudedMesh, Mesh,
+                       VectorFunctionSpace, SpatialCoordinate, Function,
+                       as_vector, exp, sin, norm)
+from math import pi, ceil
+from time import perf_counter
+import numpy as np
+
+
+def setup_slice(dirname, dt, terrain=False):
+    m = PeriodicIntervalMesh(15, 1.)
+    mesh = ExtrudedMesh(m, layers=15, layer_height=1./15.)
+    if terrain:
+        # terrain following coordinates over a hill at the bottom
+        Vc = VectorFunctionSpace(mesh, "DG", 2)
+        x, z = SpatialCoordinate(mesh)
+        zs = 0.2*exp(-((x - 0.5)/0.1)**2)
+        mesh = Mesh(Function(Vc).interpolate(as_vector([x, z + (1 - z)*zs])))
+
+    timestepping = TimesteppingParameters(dt=dt)
+    output = OutputParameters(dirname=dirname, dump_vtus=False,
+                              dump_diagnostics=False, checkpoint=False)
+    state = State(mesh,
+                  vertical_degree=1,
+                  horizontal_degree=1,
+                  family="CG",
+                  timestepping=timestepping,
+                  output=output,
+                  fieldlist=["u", "rho", "theta"])
+    return state
+
+
+def run(state, advected_fields, tmax):
+    stepper = AdvectionDiffusion(state, advected_fields)
+    stepper.run(0, tmax)
+    return stepper.state.fields
+
+
+def test_semi_lagrangian_terrain(tmpdir):
+    # a Courant number of 1.5, with an upward flow that crosses the
+    # lower boundary, so that the departure points of the nodes near
+    # the hill are below it
+    dt = 0.1
+    state = setup_slice(str(tmpdir), dt, terrain=True)
+    state.fields("u").project(as_vector([1.0, 0.3]))
+
+    Vdg = state.spaces("DG")
+    x, z = SpatialCoordinate(state.mesh)
+    c = state.fields("c", Vdg)
+    c.assign(1.)
+    f = state.fields("f", Vdg)
+    f.interpolate(sin(2*pi*x)*sin(pi*z))
+    fmin = f.dat.data_ro.min()
+    fmax = f.dat.data_ro.max()
+
+    eqn = AdvectionEquation(state, Vdg)
+    schemes = [SemiLagrangian(state, field, eqn, periodic_lengths=(1., None))
+               for field in [c, f]]
+
+    # points far below the domain are moved back into it
+    scheme = schemes[0]
+    location = scheme._locate(scheme.arrival_points - np.array([0., 10.]))
+    assert len(location.missing) == 0
+    assert len(location.remote) == 0
+    assert len(location.indices) == len(scheme.arrival_points)
+
+    end_fields = run(state, [("c", schemes[0]), ("f", schemes[1])], 5*dt)
+
+    # a constant stays constant, and the interpolation in each cell
+    # does not make new extrema
+    assert np.allclose(end_fields("c").dat.data_ro, 1., rtol=0., atol=1.e-12)
+    f = end_fields("f").dat.data_ro
+    assert f.min() >= fmin - 1.e-12
+    assert f.max() <= fmax + 1.e-12
+
+
+def setup_translation(dirname, dt, scheme):
+    state = setup_slice(dirname+"/"+scheme, dt)
+    state.fields("u").project(as_vector([1.0, 0.0]))
+
+    Vdg = state.spaces("DG")
+    x, z = SpatialCoordinate(state.mesh)
+    f = state.fields("f", Vdg)
+    f.interpolate(sin(2*pi*x)*sin(2*pi*z))
+    f_exact = Function(Vdg).assign(f)
+
+    eqn = AdvectionEquation(state, Vdg)
+    if scheme == "semi_lagrangian":
+        advection = SemiLagrangian(state, f, eqn, periodic_lengths=(1., None))
+    else:
+        advection = SSPRK3(state, f, eqn, subcycles=16, max_courant=0.25)
+    return state, advection, f_exact
+
+
+def test_semi_lagrangian_cost(tmpdir):
+    # a Courant number of 3.75, so that the semi-Lagrangian scheme takes
+    # one step where SSPRK3 takes 15 subcycles, and after 4 steps the
+    # field is translated once around the periodic slice
+    dt = 0.25
+    nsteps = 4
+    dirname = str(tmpdir)
+
+    # count the point locations, the cells visited in them, and the
+    # stage solves
+    counts = {"semi_lagrangian": 0, "ssprk3": 0}
+    times = {}
+    errors = {}
+    schemes = {}
+    for name in ["semi_lagrangian", "ssprk3"]:
+        state, advection, f_exact = setup_translation(dirname, dt, name)
+        schemes[name] = advection
+        if name == "semi_lagrangian":
+            locate = advection._locate
+
+            def counted_locate(points):
+                counts["semi_lagrangian"] += 1
+                return locate(points)
+
+            advection._locate = counted_locate
+        else:
+            solve_stage = advection.solve_stage
+
+            def counted_solve_stage(x_in, stage):
+                counts["ssprk3"] += 1
+                solve_stage(x_in, stage)
+
+            advection.solve_stage = counted_solve_stage
+
+        start = perf_counter()
+        end_fields = run(state, [("f", advection)], nsteps*dt)
+        times[name] = perf_counter() - start
+        errors[name] = norm(end_fields("f") - f_exact)/norm(f_exact)
+
+    walker = schemes["semi_lagrangian"].walker
+    logger.info("semi-Lagrangian: %s point locations visiting %s cells in %ss, SSPRK3: %s stage solves in %ss"
+                % (counts["semi_lagrangian"], walker.visits, times["semi_lagrangian"],
+                   counts["ssprk3"], times["ssprk3"]))
+
+    # the semi-Lagrangian scheme locates the midpoints in each iteration
+    # and then the departure points, while SSPRK3 makes three solves in
+    # each subcycle
+    iterations = schemes["semi_lagrangian"].iterations
+    assert counts["semi_lagrangian"] == nsteps*(iterations + 1)
+    assert schemes["ssprk3"].ncycles == 15
+    assert counts["ssprk3"] == nsteps*3*15
+
+    # each point walks from the cell of its arrival node across at most
+    # as many cells as the Courant number, and one more to reach a
+    # neighbouring cell, so the work of each location is proportional
+    # to the number of this rank's points, not to the size of the mesh
+    npoints = len(schemes["semi_lagrangian"].arrival_points)
+    assert walker.visits <= counts["semi_lagrangian"]*npoints*(ceil(3.75) + 2)
+
+    # with comparable accuracy
+    assert errors["semi_lagrangian"] < 0.2
+    assert errors["ssprk3"] < 0.2
+
+
+def test_semi_lagrangian_remote_points(tmpdir):
+    # points whose walk stops before reaching their cells are located
+    # by searching the cells, and give the same values as the walk
+    dt = 0.25
+    state, advection, _ = setup_translation(str(tmpdir), dt, "semi_lagrangian")
+    f = state.fields("f")
+    points = advection.arrival_points - np.array([3.75*dt, 0.])
+    location = advection._locate(points)
+    values = location.evaluate(f)
+
+    advection.walker.max_steps = 1
+    remote_location = advection._locate(points)
+    assert len(remote_location.remote) == 0
+    assert sum(len(indices) for indices in remote_location.owners.values()) > 0
+
+    # the evaluators are set up once for each function space
+    evaluators = remote_location.evaluators(f.function_space())
+    assert remote_location.evaluators(f.function_space()) is evaluators
+    assert np.allclose(remote_location.evaluate(f), values)
@@ -0,0 +1,74 @@
+from gusto import *
+from firedrake import (PeriodicSquareMesh, exp, SpatialCoordinate, Constant,
+                       FunctionSpace, Function, as_vector, norm)
+
+
+def setup_sw(dirname):
+    mesh = PeriodicSquareMesh(16, 16, 1.)
+
+    fieldlist = ['u', 'D']
+    parameters = ShallowWaterParameters(H=1.0, g=1.0)
+    timestepping = TimesteppingParameters(dt=0.01, maxk=3)
+    output = OutputParameters(dirname=dirname+'/sw_shared_ubar', dump_vtus=False,
+                              dump_diagnostics=False, checkpoint=False)
+
+    state = State(mesh, horizontal_degree=1,
+                  family="BDM",
+                  timestepping=timestepping,
+                  output=output,
+                  parameters=parameters,
+                  fieldlist=fieldlist)
+
+    u0 = state.fields("u")
+    D0 = state.fields("D")
+    x, y = SpatialCoordinate(mesh)
+    u0.project(as_vector([0.5, 0.2]))
+    D0.interpolate(1. + 0.1*exp(-50*((x-0.5)**2 + (y-0.5)**2)))
+    f = state.fields("coriolis", FunctionSpace(mesh, "CG", 1))
+    f.interpolate(Constant(1.))
+
+    # a passively advected tracer
+    tracer = state.fields("tracer", FunctionSpace(mesh, "DG", 1))
+    tracer.interpolate(exp(-50*((x-0.3)**2 + (y-0.5)**2)))
+
+    state.initialise([("u", u0), ("D", D0)])
+
+    ueqn = EmbeddedDGAdvection(state, u0.function_space(), options=EmbeddedDGOptions())
+    Deqn = AdvectionEquation(state, D0.function_space(), equation_form="continuity")
+    tracereqn = AdvectionEquation(state, tracer.function_space())
+    advected_fields = [("u", SSPRK3(state, u0, ueqn)),
+                       ("D", SSPRK3(state, D0, Deqn)),
+                       ("tracer", SSPRK3(state, tracer, tracereqn))]
+
+    return CrankNicolson(state, advected_fields, ShallowWaterSolver(state),
+                         ShallowWaterForcing(state))
+
+
+def test_shared_ubar(tmpdir):
+    stepper = setup_sw(str(tmpdir))
+    state = stepper.state
+
+    # every scheme advects with the shared velocity
+    for _, advection in stepper.advected_fields:
+        assert advection.ubar is state.ubar
+
+    # record each update of the shared velocity, and check it against
+    # the velocity each scheme used to compute for itself
+    updates = []
+    update_ubar = state.update_ubar
+
+    def counted_update_ubar(xn, xnp1, alpha):
+        update_ubar(xn, xnp1, alpha)
+        un = xn.split()[0]
+        unp1 = xnp1.split()[0]
+        expected = Function(state.ubar.function_space()).assign(un + alpha*(unp1 - un))
+        updates.append(norm(state.ubar - expected) <= 1.e-12*norm(expected))
+
+    state.update_ubar = counted_update_ubar
+    nsteps = 2
+    stepper.run(t=0, tmax=nsteps*state.timestepping.dt)
+
+    # once per outer iteration for the active fields, and once per step
+    # for the passive tracer
+    assert len(updates) == nsteps*(state.timestepping.maxk + 1)
+    assert all(updates)
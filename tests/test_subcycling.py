@@ -2,7 +2,7 @@ from gusto import *
 from firedrake import PeriodicSquareMesh, exp, SpatialCoordinate, Constant, FunctionSpace
 
 
-def setup_gaussian(dirname):
+def setup_gaussian(dirname, max_courant=None):
     n = 16
     L = 1.
     mesh = PeriodicSquareMesh(n, n, L)
@@ -35,8 +35,10 @@ def setup_gaussian(dirname):
     ueqn = EmbeddedDGAdvection(state, u0.function_space(), options=EmbeddedDGOptions())
     Deqn = AdvectionEquation(state, D0.function_space(), equation_form="continuity")
     advected_fields = []
-    advected_fields.append(("u", SSPRK3(state, u0, ueqn, subcycles=2)))
-    advected_fields.append(("D", SSPRK3(state, D0, Deqn, subcycles=2)))
+    advected_fields.append(("u", SSPRK3(state, u0, ueqn, subcycles=2,
+                                        max_courant=max_courant)))
+    advected_fields.append(("D", SSPRK3(state, D0, Deqn, subcycles=2,
+                                        max_courant=max_courant)))
 
     linear_solver = ShallowWaterSolver(state)
 
@@ -50,11 +52,22 @@ def setup_gaussian(dirname):
     return stepper
 
 
-def run(dirname):
-    stepper = setup_gaussian(dirname)
+def run(dirname, max_courant=None):
+    stepper = setup_gaussian(dirname, max_courant)
     stepper.run(t=0, tmax=0.3)
+    return stepper
 
 
 def test_subcycling(tmpdir):
     dirname = str(tmpdir)
     run(dirname)
+
+
+def test_adaptive_subcycling(tmpdir):
+    dirname = str(tmpdir)
+    # with a large target Courant number one cycle is enough, and with
+    # a small one the number of subcycles is limited by subcycles
+    for max_courant, ncycles in [(100., 1), (1.e-8, 2)]:
+        stepper = run(dirname, max_courant)
+        for name, scheme in stepper.advected_fields:
+            assert scheme.ncycles == ncycles
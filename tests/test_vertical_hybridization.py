@@ -1,8 +1,9 @@
 from gusto import *
 from firedrake import *
+import pytest
 
 
-def run_compressible_balance_test(dirname):
+def run_compressible_balance_test(dirname, column_solver):
     dt = 1.
     deltax = 400
     L = 2000.
@@ -59,14 +60,18 @@ def run_compressible_balance_test(dirname):
     w_hybrid = Function(W)
     w_ref = Function(W)
 
+    if column_solver:
+        trace_params = {'column_solver': True}
+    else:
+        trace_params = {'ksp_type': 'preonly',
+                        'pc_type': 'lu',
+                        'pc_factor_mat_solver_type': 'mumps'}
     hybrid_params = {
         'ksp_type': 'preonly',
         'pc_type': 'python',
         'mat_type': 'matfree',
         'pc_python_type': 'gusto.VerticalHybridizationPC',
-        'vert_hybridization': {'ksp_type': 'preonly',
-                               'pc_type': 'lu',
-                               'pc_factor_mat_solver_type': 'mumps'}
+        'vert_hybridization': trace_params
     }
     solve(a == L, w_hybrid, bcs=bcs, solver_parameters=hybrid_params)
     v_hybrid, pi_hybrid = w_hybrid.split()
@@ -84,18 +89,20 @@ def run_compressible_balance_test(dirname):
     return v_error, pi_error
 
 
-def test_compressible_balance_hybrid(tmpdir):
+@pytest.mark.parametrize("column_solver", [False, True])
+def test_compressible_balance_hybrid(tmpdir, column_solver):
     """Solves the compressible hydrostatic equation
     for a pressure variable using two solver configurations:
 
-    (1): Hybridization with LU on the multiplier solve;
+    (1): Hybridization with LU, or the column solver, on the
+         multiplier solve;
     (2): Direct LU on the full system.
 
     The error between the two fields should be small.
     """
 
     dirname = str(tmpdir)
-    v_error, pi_error = run_compressible_balance_test(dirname)
+    v_error, pi_error = run_compressible_balance_test(dirname, column_solver)
 
     assert v_error < 1.0e-9
     assert pi_error < 1.0e-9
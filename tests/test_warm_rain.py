@@ -0,0 +1,66 @@
+from gusto import *
+from firedrake import (Constant, PeriodicIntervalMesh, SpatialCoordinate,
+                       ExtrudedMesh, sqrt, conditional, cos, norm)
+from math import pi
+import pytest
+
+
+def setup_moist_state(dirname):
+
+    L = 1000.
+    H = 1000.
+    nlayers = 10
+    ncolumns = 10
+
+    m = PeriodicIntervalMesh(ncolumns, L)
+    mesh = ExtrudedMesh(m, layers=nlayers, layer_height=(H / nlayers))
+    x = SpatialCoordinate(mesh)
+
+    fieldlist = ['u', 'rho', 'theta']
+    timestepping = TimesteppingParameters(dt=1.0)
+    output = OutputParameters(dirname=dirname+"/warm_rain")
+    parameters = CompressibleParameters()
+
+    state = State(mesh, vertical_degree=1, horizontal_degree=1,
+                  family="CG",
+                  timestepping=timestepping,
+                  output=output,
+                  parameters=parameters,
+                  fieldlist=fieldlist)
+
+    theta0 = state.fields("theta")
+    rho0 = state.fields("rho")
+    Vt = theta0.function_space()
+
+    # Isentropic background state
+    theta0.interpolate(Constant(300.))
+    compressible_hydrostatic_balance(state, theta0, rho0,
+                                     solve_for_rho=True)
+
+    # a bubble of vapour, with some cloud and rain inside it
+    r = sqrt((x[0]-500.)**2 + (x[1]-350.)**2)
+    bubble = conditional(r > 250., 0., 0.5*(1. + cos((pi/250.)*r)))
+    state.fields("water_v", Vt).interpolate(0.01 + 0.02*bubble)
+    state.fields("water_c", Vt).interpolate(0.002*bubble)
+    state.fields("rain", Vt).interpolate(0.001*bubble)
+
+    return state
+
+
+@pytest.mark.parametrize("iterations", [1, 2])
+def test_warm_rain(tmpdir, iterations):
+
+    dirname = str(tmpdir)
+    separate = setup_moist_state(dirname+"/separate")
+    together = setup_moist_state(dirname+"/together")
+
+    physics_list = [Coalescence(separate), Evaporation(separate),
+                    Condensation(separate, iterations=iterations)]
+    for physics in physics_list:
+        physics.apply()
+    WarmRain(together, iterations=iterations).apply()
+
+    for name in ["theta", "water_v", "water_c", "rain"]:
+        f_separate = separate.fields(name)
+        f_together = together.fields(name)
+        assert norm(f_separate - f_together) < 1.e-10*norm(f_separate), name